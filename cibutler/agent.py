@@ -0,0 +1,274 @@
+"""
+Opt-in cibutler agent.
+
+A long-running process that keeps the CLI imported, kubeconfig loaded and
+the OSDU token refresher, Keycloak client secret and HTTP connections warm.
+It listens on a Unix socket, the cibutler entry point (cibutler.entry)
+sends it the read-only commands in AGENT_COMMANDS and prints the reply.
+
+Commands run one at a time, in the client's environment and directory.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import signal
+import logging
+import threading
+import traceback
+import subprocess
+import socketserver
+from pathlib import Path
+from contextlib import redirect_stdout, redirect_stderr
+import click
+import typer
+from dotenv import dotenv_values
+from kubernetes.config import kube_config
+from typing_extensions import Annotated
+import cibutler.log as log
+from cibutler.common import CACHE_DIR, console, error_console
+from cibutler.entry import SOCKET_FILE, agent_command
+from cibutler.tunnel import pid_alive
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+PID_FILE = os.path.join(CACHE_DIR, "agent.pid")
+LOG_FILE = "agent.log"
+ENV_FILE = Path.home().joinpath(".env.cibutler")
+
+# One command at a time: the consoles, os.environ and the working directory
+# are process wide
+_lock = threading.Lock()
+
+
+def agent_pid():
+    """
+    PID of the running agent, None when there is none
+    """
+    try:
+        with open(PID_FILE) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if pid_alive(pid) else None
+
+
+def invoke(command: click.Command, argv: list):
+    """
+    Run a click command without exiting, returns the exit code
+    """
+    try:
+        result = command.main(args=argv, prog_name="cibutler", standalone_mode=False)
+    except click.ClickException as err:
+        err.show()
+        return err.exit_code
+    except click.exceptions.Abort:
+        print("Aborted!", file=sys.stderr)
+        return 1
+    except SystemExit as err:
+        return err.code if isinstance(err.code, int) else 1
+    except Exception:
+        logger.exception(f"Agent command failed: {argv}")
+        traceback.print_exc()
+        return 1
+    # Typer exits are returned as their exit code
+    return result if isinstance(result, int) else 0
+
+
+def run_command(command: click.Command, argv: list, env: dict = None, cwd: str = None):
+    """
+    Run argv with the client's environment and directory, capturing its output
+    """
+    if not agent_command(argv):
+        return {
+            "exit_code": 2,
+            "stdout": "",
+            "stderr": f"cibutler agent does not run: {' '.join(argv)}\n",
+        }
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    start = time.time()
+    with _lock:
+        saved_env = dict(os.environ)
+        saved_cwd = os.getcwd()
+        saved_kubeconfig = kube_config.KUBE_CONFIG_DEFAULT_LOCATION
+        if env is not None:
+            # As if the client had loaded ~/.env.cibutler itself
+            os.environ.clear()
+            os.environ.update({**dotenv_values(ENV_FILE), **env})
+            # The kubernetes client reads KUBECONFIG once, at import
+            kube_config.KUBE_CONFIG_DEFAULT_LOCATION = os.environ.get(
+                "KUBECONFIG", "~/.kube/config"
+            )
+        try:
+            if cwd:
+                os.chdir(cwd)
+            # The consoles write to sys.stdout/sys.stderr when they print
+            with redirect_stdout(stdout), redirect_stderr(stderr):
+                exit_code = invoke(command, argv)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved_env)
+            os.chdir(saved_cwd)
+            kube_config.KUBE_CONFIG_DEFAULT_LOCATION = saved_kubeconfig
+    logger.info(f"{' '.join(argv)}: exit {exit_code} in {time.time() - start:.2f}s")
+    return {
+        "exit_code": exit_code,
+        "stdout": stdout.getvalue(),
+        "stderr": stderr.getvalue(),
+    }
+
+
+class AgentHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = json.loads(self.rfile.readline())
+            reply = run_command(
+                self.server.command,
+                message["argv"],
+                env=message.get("env"),
+                cwd=message.get("cwd"),
+            )
+        except (ValueError, KeyError, TypeError) as err:
+            reply = {"exit_code": 2, "stdout": "", "stderr": f"Bad request: {err}\n"}
+        self.wfile.write(json.dumps(reply).encode())
+
+
+class AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, command: click.Command):
+        self.command = command
+        if os.path.exists(path):
+            os.remove(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Only this user may connect
+        umask = os.umask(0o177)
+        try:
+            super().__init__(path, AgentHandler)
+        finally:
+            os.umask(umask)
+
+
+def warm_up():
+    """
+    Load kubeconfig and get the OSDU token once, so the first command is warm
+    too. Failures are logged, commands report them when they run.
+    """
+    from kubernetes import config
+    import cibutler.osdu as osdu
+
+    try:
+        config.load_kube_config()
+    except Exception as err:
+        logger.info(f"Agent warm up: no kubeconfig: {err}")
+        return
+    with _lock, redirect_stdout(io.StringIO()), redirect_stderr(io.StringIO()):
+        try:
+            refresher = osdu.setup(os.environ.get("BASE_URL", osdu.BASE_URL))
+            refresher.refresh_token()
+        except Exception as err:
+            # typer.Exit included, setup reports an unreachable OSDU with it
+            logger.info(f"Agent warm up: no OSDU token: {err!r}")
+
+
+def serve(path: str = SOCKET_FILE):
+    """
+    Run the agent until SIGTERM or Ctrl-C
+    """
+    # Imported here, main imports this module
+    from typer.main import get_command
+    from cibutler.main import cli as main_cli
+
+    log.use_logfile(log.daemon_logfile("agent"))
+    server = AgentServer(path, get_command(main_cli))
+    with open(PID_FILE, "w") as f:
+        f.write(str(os.getpid()))
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    threading.Thread(target=warm_up, daemon=True).start()
+    logger.info(f"cibutler agent listening on {path}")
+    try:
+        # Served from a thread, the SIGTERM handler calls shutdown on this one
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        while thread.is_alive():
+            thread.join(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+    finally:
+        server.server_close()
+        for file in (path, PID_FILE):
+            if os.path.exists(file):
+                os.remove(file)
+
+
+def start_background(timeout: int = 60):
+    """
+    Start the agent as a detached process, returns its pid once it answers
+    """
+    pid = agent_pid()
+    if pid:
+        return pid
+    with open(LOG_FILE, "a") as output:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "cibutler.main", "agent"],
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=output,
+            start_new_session=True,
+        )
+    deadline = time.time() + timeout
+    while time.time() < deadline and proc.poll() is None:
+        if os.path.exists(SOCKET_FILE) and agent_pid():
+            return proc.pid
+        time.sleep(0.2)
+    return None
+
+
+@cli.command(rich_help_panel="CI Commands")
+def agent(
+    background: Annotated[
+        bool, typer.Option("--background", "-b", help="Run in background")
+    ] = False,
+):
+    """
+    Run the cibutler agent, so status, info, groups, search and diag ready answer fast :zap:
+
+    The agent keeps the CLI loaded with warm clients and tokens. Commands are
+    sent to it while it runs, set CIBUTLER_NO_AGENT=1 to bypass it.
+    """
+    if background:
+        pid = start_background()
+        if not pid:
+            error_console.print(f":x: cibutler agent did not start, see {LOG_FILE}")
+            raise typer.Exit(1)
+        console.print(f":white_check_mark: cibutler agent running, pid {pid}")
+        return
+    if agent_pid():
+        error_console.print(":x: cibutler agent already running")
+        raise typer.Exit(1)
+    console.print(f"cibutler agent listening on {SOCKET_FILE}, press Ctrl-C to stop")
+    serve()
+
+
+@cli.command(rich_help_panel="CI Commands")
+def agent_stop():
+    """
+    Stop the cibutler agent
+    """
+    pid = agent_pid()
+    if not pid:
+        console.print("No cibutler agent running")
+        return
+    os.kill(pid, signal.SIGTERM)
+    console.print(":white_check_mark: cibutler agent stopped")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,205 @@
+"""
+Batch mode: run a script of cibutler commands in one process.
+
+One command per line, as typed after `cibutler`, with shell quoting and #
+comments. Lines share the process, so the OSDU token refresher, Keycloak
+secret, HTTP session and kubeconfig are set up once. With --jobs, lines run
+in parallel up to the next `wait` line.
+"""
+
+import io
+import sys
+import time
+import shlex
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import typer
+from rich.table import Table
+from typing_extensions import Annotated
+from cibutler.agent import invoke
+from cibutler.common import console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+WAIT = "wait"
+# Exit code of lines not run after a failure
+SKIPPED = None
+
+
+class BatchError(Exception):
+    pass
+
+
+def parse(text: str):
+    """
+    Groups of (line number, argv) that may run in parallel, split on wait
+    """
+    groups = [[]]
+    for number, line in enumerate(text.splitlines(), start=1):
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as err:
+            raise BatchError(f"line {number}: {err}")
+        if not argv:
+            continue
+        if argv[0] == "cibutler":
+            argv = argv[1:]
+        if argv == [WAIT]:
+            if groups[-1]:
+                groups.append([])
+            continue
+        if argv[0] == "batch":
+            raise BatchError(f"line {number}: batch can not run batch")
+        groups[-1].append((number, argv))
+    return [group for group in groups if group]
+
+
+class ThreadOutput(io.TextIOBase):
+    """
+    Stands in for sys.stdout/sys.stderr while lines run in parallel, so each
+    line's output (the consoles included) is kept apart and printed whole
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def capture(self, buffer):
+        self.local.buffer = buffer
+
+    def write(self, text):
+        return (getattr(self.local, "buffer", None) or self.stream).write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_line(command, argv: list, output: tuple = None):
+    """
+    Returns (exit code, seconds, captured output)
+    """
+    buffer = None
+    if output:
+        buffer = io.StringIO()
+        for stream in output:
+            stream.capture(buffer)
+    start = time.time()
+    try:
+        exit_code = invoke(command, argv)
+    finally:
+        for stream in output or []:
+            stream.capture(None)
+    return exit_code, time.time() - start, buffer.getvalue() if buffer else ""
+
+
+def run_batch(command, groups: list, jobs: int = 1, keep_going: bool = False):
+    """
+    Run the groups in order, returns {line number: (argv, exit code, seconds)}
+    """
+    results = {}
+    failed = False
+    output = None
+    if jobs > 1:
+        output = (ThreadOutput(sys.stdout), ThreadOutput(sys.stderr))
+        sys.stdout, sys.stderr = output
+    try:
+        for group in groups:
+            if failed and not keep_going:
+                for number, argv in group:
+                    results[number] = (argv, SKIPPED, 0)
+                continue
+            if jobs == 1:
+                for number, argv in group:
+                    if failed and not keep_going:
+                        # Sequential lines stop at the first failure
+                        results[number] = (argv, SKIPPED, 0)
+                        continue
+                    logger.info(f"batch line {number}: {shlex.join(argv)}")
+                    exit_code, seconds, _ = run_line(command, argv)
+                    results[number] = (argv, exit_code, seconds)
+                    failed = failed or exit_code != 0
+                continue
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = {
+                    executor.submit(run_line, command, argv, output): (number, argv)
+                    for number, argv in group
+                }
+                for future in as_completed(futures):
+                    number, argv = futures[future]
+                    exit_code, seconds, text = future.result()
+                    output[0].stream.write(f"--- line {number}: {shlex.join(argv)}\n")
+                    output[0].stream.write(text)
+                    results[number] = (argv, exit_code, seconds)
+                    failed = failed or exit_code != 0
+    finally:
+        if output:
+            sys.stdout, sys.stderr = (stream.stream for stream in output)
+    return results
+
+
+def results_table(results: dict):
+    table = Table(title="Batch Results")
+    table.add_column("Line", justify="right")
+    table.add_column("Command", style="cyan")
+    table.add_column("Exit", justify="right")
+    table.add_column("Seconds", justify="right")
+    for number in sorted(results):
+        argv, exit_code, seconds = results[number]
+        if exit_code is SKIPPED:
+            status = "[yellow]skipped[/yellow]"
+        elif exit_code:
+            status = f"[red]{exit_code}[/red]"
+        else:
+            status = "[green]0[/green]"
+        table.add_row(str(number), shlex.join(argv), status, f"{seconds:.1f}")
+    return table
+
+
+@cli.command(rich_help_panel="CI Commands")
+def batch(
+    file: Annotated[str, typer.Argument(help="File of cibutler commands, - for stdin")],
+    jobs: Annotated[
+        int, typer.Option("--jobs", "-j", min=1, help="Lines to run in parallel")
+    ] = 1,
+    keep_going: Annotated[
+        bool,
+        typer.Option(
+            "--keep-going", "-k", help="Run the remaining lines after a failure"
+        ),
+    ] = False,
+):
+    """
+    Run many cibutler commands in one process :scroll:
+
+    One command per line without the leading cibutler, # starts a comment.
+    With --jobs, lines run in parallel until a [code]wait[/code] line.
+    Tokens, sessions and cluster clients are shared by all lines.
+    """
+    # Imported here, main imports this module
+    from typer.main import get_command
+    from cibutler.main import cli as main_cli
+
+    try:
+        if file == "-":
+            text = sys.stdin.read()
+        else:
+            with open(file) as f:
+                text = f.read()
+        groups = parse(text)
+    except (OSError, BatchError) as err:
+        error_console.print(f":x: {err}")
+        raise typer.Exit(1)
+
+    results = run_batch(get_command(main_cli), groups, jobs=jobs, keep_going=keep_going)
+    console.print(results_table(results))
+    if any(exit_code != 0 for _, exit_code, _ in results.values()):
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -12,6 +12,7 @@ import cibutler.cidocker as cidocker
 import cibutler.utils as utils
 import cibutler.ciminikube as ciminikube
 import cibutler.update as update
+import cibutler.conf as conf
 from cibutler.common import console, error_console, save_console_text
 
 logger = logging.getLogger(__name__)
@@ -56,10 +57,16 @@ def select_target(
 @cli.command(rich_help_panel="CI Commands")
 def check(
     target: Annotated[str, typer.Option(help="Target")] = None,
+    low_memory: Annotated[
+        bool,
+        typer.Option("--low-memory", help="Check for a low-memory install"),
+    ] = False,
 ):
     """
     Install Preflight Check
     """
+    # Only lower the RAM check, the default stays with preflight_check_required
+    heap = {"total_heap_required": conf.low_memory_heap_required} if low_memory else {}
     update.update_message()
     target = select_target(target=target)
     console.rule()
@@ -77,7 +84,7 @@ def check(
 
     if "minikube" in target.lower():
         console.print(":white_check_mark: Minikube Selected")
-        preflight_check_required()
+        preflight_check_required(**heap)
         check_docker_server_version()
         cimpl.check_hosts()
         if ciminikube.status():
@@ -89,7 +96,7 @@ def check(
     elif "docker-desktop" in target.lower():
         console.print(":white_check_mark: Docker-Desktop Selected")
         cik8s.use_context(context="docker-desktop")
-        preflight_check_required()
+        preflight_check_required(**heap)
         check_docker_server_version()
         k8s_checks()
         cimpl.check_hosts()
@@ -97,7 +104,11 @@ def check(
     elif "microk8s" in target.lower():
         context = cik8s.get_currentcontext()
         console.print(f":white_check_mark: MicroK8s Selected with context {context}")
-        preflight_check_required(skip_docker_daemon=True, skip_docker=True)
+        preflight_check_required(
+            skip_docker_daemon=True,
+            skip_docker=True,
+            **heap,
+        )
         k8s_checks()
         cimpl.check_hosts()
         check_storage_class(added_during_install=True)
@@ -106,7 +117,11 @@ def check(
             ":white_check_mark: K3s (Rancher Lab’s minimal Kubernetes distribution) Selected"
         )
         cik8s.use_context(context="default")
-        preflight_check_required(skip_docker_daemon=True, skip_docker=True)
+        preflight_check_required(
+            skip_docker_daemon=True,
+            skip_docker=True,
+            **heap,
+        )
         k8s_checks()
         cimpl.check_hosts()
         check_storage_class(added_during_install=False)
@@ -114,7 +129,7 @@ def check(
         console.print(":white_check_mark: K3d (K3s in Docker) Selected")
         cimpl.check_hosts()
         check_docker_server_version()
-        preflight_check_required()
+        preflight_check_required(**heap)
         cimpl.check_hosts()
         check_storage_class(added_during_install=False)
     elif "other kubernetes" in target.lower():
@@ -123,7 +138,10 @@ def check(
             f":white_check_mark: Other Kubernetes Selected with context {context}"
         )
         preflight_check_required(
-            skip_docker_daemon=True, skip_docker=True, min_cpu_cores=2
+            skip_docker_daemon=True,
+            skip_docker=True,
+            min_cpu_cores=2,
+            **heap,
         )
         k8s_checks(ignore_ram=True)
         cimpl.check_hosts()
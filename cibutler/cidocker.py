@@ -60,6 +60,22 @@ def docker_memory_consumption():
     return memory_usage_total
 
 
+def container_memory_gb(name: str = "minikube"):
+    """
+    Memory used by one container (page cache excluded) in GB, None if unavailable
+    """
+    try:
+        stat = docker.from_env().containers.get(name).stats(stream=False)
+        memory_stats = stat["memory_stats"]
+        usage = memory_stats["usage"] - memory_stats.get("stats", {}).get(
+            "inactive_file", 0
+        )
+    except Exception as err:
+        logger.debug(f"Unable to get memory of container {name}: {err}")
+        return None
+    return usage / 1024 / 1024 / 1024
+
+
 @diag_cli.command(rich_help_panel="Docker Diagnostic Commands")
 def container_ip(container_id: str = "minikube", network: str = None):
     """
@@ -81,7 +97,11 @@ def log_container_list():
     client = docker.from_env()
     for container in client.containers.list():
         logger.info(
-            f"id: {container.id}, name: {container.name}, {container.image}, {container.status}"
+            "id: %s, name: %s, %s, %s",
+            container.id,
+            container.name,
+            container.image,
+            container.status,
         )
 
 
@@ -95,14 +115,26 @@ def log_network_list():
     client = docker.from_env()
     for network in client.networks.list():
         logger.info(
-            f"Network ID: {network.short_id} Name: {network.name}, Attrs: {network.attrs['Scope']}, Containers: {network.containers} {network.attrs}"
+            "Network ID: %s Name: %s, Scope: %s",
+            network.short_id,
+            network.name,
+            network.attrs["Scope"],
         )
+        # network.containers looks up every container, only do it when debugging
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Network %s containers: %s attrs: %s",
+                network.name,
+                network.containers,
+                network.attrs,
+            )
 
 
 def log_volume_list():
     client = docker.from_env()
     for volume in client.volumes.list():
-        logger.info(f"Volume ID: {volume.short_id} Name: {volume.name}, {volume.attrs}")
+        logger.info("Volume ID: %s Name: %s", volume.short_id, volume.name)
+        logger.debug("Volume %s attrs: %s", volume.name, volume.attrs)
 
 
 def docker_info_memtotal():
@@ -205,6 +237,8 @@ def log_docker_details():
     """
     Log containers, networks and volumes
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
     log_container_list()
     log_network_list()
     log_volume_list()
@@ -4,6 +4,7 @@ import asyncio
 from pyhelm3 import Client, Chart, ChartNotFoundError, CommandCancelledError
 from pydantic import ValidationError
 import typing
+import cibutler.shell as shell
 from cibutler.shell import run_shell_command
 from cibutler.releases import select_version
 from pathlib import Path
@@ -79,13 +80,29 @@ def helm_install(
     return output.decode("ascii").strip()
 
 
+def helm_uninstall_command(name="osdu-cimpl", namespace="default"):
+    return ["helm", "uninstall", name, "-n", namespace]
+
+
 def helm_uninstall(name="osdu-cimpl", namespace="default"):
     console.print(f"Uninstalling {name}...")
     logger.info(f"Uninstalling helm {name} in namespace {namespace}")
-    output = subprocess.Popen(
-        ["helm", "uninstall", name, "-n", namespace], stdout=subprocess.PIPE
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(
+        helm_uninstall_command(name, namespace), timeout=shell.ACTION_TIMEOUT
+    ).output
+
+
+def helm_uninstall_many(names: list, namespace="default"):
+    """
+    Uninstall releases that do not depend on each other concurrently
+    """
+    console.print(f"Uninstalling {', '.join(names)}...")
+    logger.info(f"Uninstalling helm {names} in namespace {namespace}")
+    results = shell.run_many(
+        [helm_uninstall_command(name, namespace) for name in names],
+        timeout=shell.ACTION_TIMEOUT,
+    )
+    return "\n".join(result.output for result in results)
 
 
 @diag_cli.command(rich_help_panel="Helm Diagnostic Commands")
@@ -1,15 +1,13 @@
 import typer
-import subprocess
-import shlex
 import json
 from pick import pick
 from pathlib import Path
 import os
 import logging
-from rich.progress import track
-from kubernetes import client, config
+from kubernetes import client, config, utils
 from kubernetes.client.rest import ApiException
 from typing_extensions import Annotated
+import cibutler.shell as shell
 from cibutler.shell import run_shell_command
 from cibutler.common import console, error_console
 
@@ -66,31 +64,7 @@ def list_pods(
         with open(json_name, "w") as f:
             f.write(str(ret))
         console.print(f":white_check_mark: Pods list saved to {json_name}")
-        for i in track(ret.items, description="Saving pod logs and descriptions..."):
-            try:
-                describe_txt = get_describe(
-                    what="pod", thing=i.metadata.name, namespace=i.metadata.namespace
-                )
-                with open(f"{i.metadata.name}_describe.txt", "w") as descf:
-                    descf.write(describe_txt)
-                    logger.info(
-                        f"saved describe for {i.metadata.name} to {i.metadata.name}_describe.txt"
-                    )
-                pod_log = pod_logs(
-                    pod_name=i.metadata.name, namespace=i.metadata.namespace
-                )
-                with open(f"{i.metadata.name}_logs.txt", "w") as logf:
-                    logf.write(pod_log)
-                    logger.info(
-                        f"saved logs for {i.metadata.name} to {i.metadata.name}_logs.txt"
-                    )
-            except Exception as err:
-                logger.error(
-                    f"Error saving logs or description for pod {i.metadata.name}: {err}"
-                )
-                error_console.print(
-                    f":x: Error saving logs or description for pod {i.metadata.name}: {err}"
-                )
+        save_pod_details(ret.items)
 
         return txt_name, json_name
     else:
@@ -120,7 +94,8 @@ def list_nodes():
     except Exception as err:
         error_console.print(f":x: Error talking to kubernetes API: {err}")
         raise typer.Exit(1)
-    logger.info(response)
+    # The full node list is large, only build its repr when debugging
+    logger.debug("Nodes: %s", response)
     return response
 
 
@@ -128,7 +103,7 @@ def node_status(name: str):
     config.load_kube_config()
     k8s_api = client.CoreV1Api()
     response = k8s_api.read_node_status(name)
-    logger.info(response)
+    logger.debug("Node status: %s", response)
     return response
 
 
@@ -137,7 +112,8 @@ def kube_status():
 
 
 def kube_log_node_info():
-    logger.info(kube_status().node_info)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Node info: %s", kube_status().node_info)
 
 
 def kube_allocatable():
@@ -149,7 +125,7 @@ def kube_allocatable_cpu():
     Get the allocatable CPU
     """
     cpu = kube_status().allocatable["cpu"]
-    logger.info(f"k8s cpu {cpu}")
+    logger.info("k8s cpu %s", cpu)
     if "m" in cpu:
         return cpu
     else:
@@ -188,7 +164,7 @@ def kube_capacity_memory_gb():
 
 def kube_istio_ready():
     """Check if Istio is ready in the cluster."""
-    output = subprocess.Popen(
+    output = shell.run(
         [
             "kubectl",
             "-n",
@@ -200,16 +176,16 @@ def kube_istio_ready():
             "--template",
             "{..readyReplicas}",
         ],
-        stdout=subprocess.PIPE,
-    ).communicate()[0]
-    retval = output.decode("ascii").strip()
+        timeout=shell.QUERY_TIMEOUT,
+    ).stdout
+    retval = output.strip()
     console.print(f"kube_istio_ready: {retval}")
     logger.info(f"kube_istio_ready: {retval}")
     return retval
 
 
 def kubepod_name(type):
-    output = subprocess.Popen(
+    output = shell.run(
         [
             "kubectl",
             "get",
@@ -221,13 +197,13 @@ def kubepod_name(type):
             "--template",
             "{..metadata.name}",
         ],
-        stdout=subprocess.PIPE,
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+        timeout=shell.QUERY_TIMEOUT,
+    ).stdout
+    return output.strip()
 
 
 def kubepod_nodename(nodename):
-    output = subprocess.Popen(
+    output = shell.run(
         [
             "kubectl",
             "get",
@@ -239,9 +215,9 @@ def kubepod_nodename(nodename):
             "--template",
             "{..metadata.name}",
         ],
-        stdout=subprocess.PIPE,
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+        timeout=shell.QUERY_TIMEOUT,
+    ).stdout
+    return output.strip()
 
 
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands")
@@ -268,185 +244,208 @@ def describe(
         )
 
 
+def describe_command(what="pods", label=None, thing=None, namespace="default"):
+    args = ["kubectl", "-n", namespace, "describe", what]
+    if thing:
+        args.append(thing)
+    elif label:
+        args += ["-l", label]
+    return args
+
+
 def get_describe(what="pods", label=None, thing=None, namespace="default"):
     """Get the description of a Kubernetes resource."""
-    try:
-        if thing:
-            output = subprocess.Popen(
-                ["kubectl", "-n", namespace, "describe", what, thing],
-                stdout=subprocess.PIPE,
-            ).communicate()[0]
-        elif label:
-            output = subprocess.Popen(
-                ["kubectl", "-n", namespace, "describe", what, "-l", label],
-                stdout=subprocess.PIPE,
-            ).communicate()[0]
-        else:
-            output = subprocess.Popen(
-                ["kubectl", "-n", namespace, "describe", what], stdout=subprocess.PIPE
-            ).communicate()[0]
-        return output.decode("utf-8").strip()
-    except Exception as err:
-        logger.error(f"Error describing {what} {thing}: {err}")
-        error_console.print(f":x: Error describing {what} {thing}: {err}")
+    result = shell.run(
+        describe_command(what=what, label=label, thing=thing, namespace=namespace),
+        timeout=shell.QUERY_TIMEOUT,
+    )
+    if not result.ok:
+        logger.error(f"Error describing {what} {thing}: {result.stderr}")
+        error_console.print(f":x: Error describing {what} {thing}: {result.stderr}")
+    return result.stdout.strip()
 
 
 def pod_containers(pod_name, namespace="default"):
-    try:
-        output = subprocess.Popen(
-            [
-                "kubectl",
-                "get",
-                "pod",
-                pod_name,
-                "-n",
-                namespace,
-                "-o",
-                "jsonpath={.spec.containers[*].name}",
-            ],
-            stdout=subprocess.PIPE,
-        ).communicate()[0]
-        return output.decode("utf-8").strip().split()
-    except subprocess.CalledProcessError as err:
-        error_console.print(f":x: Error getting containers for pod {pod_name}: {err}")
-        return f"Error getting containers for pod {pod_name}: {err}"
-    except Exception as err:
-        error_console.print(f":x: Error getting containers for pod {pod_name}: {err}")
-        return f"Error getting containers for pod {pod_name}: {err}"
+    result = shell.run(
+        [
+            "kubectl",
+            "get",
+            "pod",
+            pod_name,
+            "-n",
+            namespace,
+            "-o",
+            "jsonpath={.spec.containers[*].name}",
+        ],
+        timeout=shell.QUERY_TIMEOUT,
+    )
+    if not result.ok:
+        error_console.print(
+            f":x: Error getting containers for pod {pod_name}: {result.stderr}"
+        )
+    return result.stdout.split()
+
+
+def pod_logs_command(pod_name, namespace="default"):
+    # One call for every container, each line prefixed with its container
+    return [
+        "kubectl",
+        "logs",
+        pod_name,
+        "-n",
+        namespace,
+        "--all-containers",
+        "--prefix",
+    ]
 
 
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands", hidden=True)
 def pod_logs(pod_name, namespace="default"):
-    containers = pod_containers(pod_name=pod_name, namespace=namespace)
-    for container in containers:
-        logger.info(
-            f"Getting logs for pod {pod_name} in namespace {namespace} for container: {container}"
+    logger.info(f"Getting logs for pod {pod_name} in namespace {namespace}")
+    result = shell.run(
+        pod_logs_command(pod_name, namespace), timeout=shell.QUERY_TIMEOUT
+    )
+    if not result.ok:
+        logger.error(
+            f"Error getting logs for pod {pod_name} in namespace {namespace}: {result.stderr}"
         )
-        try:
-            output = subprocess.Popen(
-                ["kubectl", "logs", pod_name, "-c", container, "-n", namespace],
-                stdout=subprocess.PIPE,
-            ).communicate()[0]
-            return output.decode("utf-8").strip()
-        except subprocess.CalledProcessError as err:
-            logger.error(
-                f"Error getting logs for pod {pod_name} in namespace {namespace} for container {container}: {err}"
-            )
-            error_console.print(f":x: Error getting logs for pod {pod_name}: {err}")
-            return f"Error getting logs for pod {pod_name}: {err}"
-        except UnicodeDecodeError as err:
-            logger.error(
-                f"Error decoding logs for pod {pod_name} in namespace {namespace} for container {container}: {err}"
-            )
-            error_console.print(f":x: Error decoding logs for pod {pod_name}: {err}")
-            return f"Error decoding logs for pod {pod_name}: {err}"
-        except Exception as err:
-            logger.error(
-                f"Error getting logs for pod {pod_name} in namespace {namespace} for container {container}: {err}"
+        error_console.print(
+            f":x: Error getting logs for pod {pod_name}: {result.stderr}"
+        )
+        return f"Error getting logs for pod {pod_name}: {result.stderr}"
+    return result.stdout.strip()
+
+
+def save_pod_details(pods: list, limit: int = 8):
+    """
+    Save describe and logs of each pod to <pod>_describe.txt and
+    <pod>_logs.txt, limit kubectl calls at a time
+    """
+    commands = []
+    for pod in pods:
+        commands.append(
+            describe_command(
+                what="pod", thing=pod.metadata.name, namespace=pod.metadata.namespace
             )
-            error_console.print(f":x: Error getting logs for pod {pod_name}: {err}")
-            return f"Error getting logs for pod {pod_name}: {err}"
+        )
+        commands.append(pod_logs_command(pod.metadata.name, pod.metadata.namespace))
+    with console.status(f"Saving logs and descriptions of {len(pods)} pods..."):
+        results = shell.run_many(commands, timeout=shell.QUERY_TIMEOUT, limit=limit)
+    for pod, describe, logs in zip(pods, results[::2], results[1::2]):
+        name = pod.metadata.name
+        for result, suffix in ((describe, "describe"), (logs, "logs")):
+            if not result.ok:
+                logger.error(f"Error saving {suffix} for pod {name}: {result.stderr}")
+                error_console.print(
+                    f":x: Error saving {suffix} for pod {name}: {result.stderr}"
+                )
+            with open(f"{name}_{suffix}.txt", "w") as f:
+                f.write(result.stdout if result.ok else result.output)
+            logger.info(f"saved {suffix} for {name} to {name}_{suffix}.txt")
 
 
 def get_namespace(namespace):
     if namespace:
-        output = subprocess.Popen(
-            ["kubectl", "describe", "namespaces", namespace], stdout=subprocess.PIPE
-        ).communicate()[0]
+        args = ["kubectl", "describe", "namespaces", namespace]
     else:
-        output = subprocess.Popen(
-            ["kubectl", "get", "namespace", "--show-labels"], stdout=subprocess.PIPE
-        ).communicate()[0]
-    return output.decode("ascii").strip()
+        args = ["kubectl", "get", "namespace", "--show-labels"]
+    return shell.run(args, timeout=shell.QUERY_TIMEOUT).stdout.strip()
 
 
 def get_services():
     """
     Get k8s services
     """
-    output = subprocess.Popen(
-        ["kubectl", "get", "services"], stdout=subprocess.PIPE
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(
+        ["kubectl", "get", "services"], timeout=shell.QUERY_TIMEOUT
+    ).stdout.strip()
 
 
 def get_clusters():
     """
     List the clusters kubectl knows about
     """
-    output = subprocess.Popen(
-        ["kubectl", "config", "get-clusters"], stdout=subprocess.PIPE
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(
+        ["kubectl", "config", "get-clusters"], timeout=shell.QUERY_TIMEOUT
+    ).stdout.strip()
 
 
 def cluster_info():
     """
     List the clusters kubectl knows about
     """
-    output = subprocess.Popen(
-        ["kubectl", "cluster-info"], stdout=subprocess.PIPE
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(
+        ["kubectl", "cluster-info"], timeout=shell.QUERY_TIMEOUT
+    ).stdout.strip()
+
+
+def delete_command(name, namespace="default", grace_period: int = 1):
+    return [
+        "kubectl",
+        "delete",
+        name,
+        "--all",
+        "-n",
+        namespace,
+        f"--grace-period={grace_period}",
+    ]
 
 
 def delete_item(name, namespace="default", grace_period: int = 1):
-    output = subprocess.Popen(
-        [
-            "kubectl",
-            "delete",
-            name,
-            "--all",
-            "-n",
-            namespace,
-            f"--grace-period={grace_period}",
-        ],
-        stdout=subprocess.PIPE,
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(
+        delete_command(name, namespace, grace_period), timeout=shell.ACTION_TIMEOUT
+    ).output
+
+
+def delete_items(names: list, namespace="default", grace_period: int = 1):
+    """
+    Delete all resources of each kind concurrently
+    """
+    results = shell.run_many(
+        [delete_command(name, namespace, grace_period) for name in names],
+        timeout=shell.ACTION_TIMEOUT,
+    )
+    return "\n".join(result.output for result in results)
 
 
 def delete_all(namespace: str = "default", grace_period: int = 1):
-    output = subprocess.Popen(
-        [
-            "kubectl",
-            "delete",
-            "all",
-            "--all",
-            "-n",
-            namespace,
-            f"--grace-period={grace_period}",
-        ],
-        stdout=subprocess.PIPE,
-    ).communicate()[0]
-    return output.decode("ascii").strip()
+    return delete_item("all", namespace=namespace, grace_period=grace_period)
+
+
+def delete_pod(name: str, namespace: str = "default"):
+    """
+    Delete a pod so its controller recreates it
+    """
+    logger.info(f"Deleting pod {name} in {namespace}")
+    return shell.run(
+        ["kubectl", "delete", "pod", name, "-n", namespace, "--wait=false"],
+        timeout=shell.QUERY_TIMEOUT,
+    ).stdout.strip()
+
+
+def rollout_restart(deployments: list, namespace: str = "default"):
+    """
+    Rollout restart deployments
+    """
+    logger.info(f"Restarting deployments {deployments} in {namespace}")
+    return shell.run(
+        ["kubectl", "rollout", "restart", "deploy", *deployments, "-n", namespace],
+        timeout=shell.QUERY_TIMEOUT,
+    ).stdout.strip()
 
 
 def kubectl_get(opt="vs", namespace: str = "default"):
-    try:
-        output = subprocess.run(
-            ["kubectl", "get", opt, "-n", namespace], capture_output=True
-        )  # nosec
-    except subprocess.CalledProcessError as err:
-        return str(err)
-    else:
-        return output.stdout.decode("ascii").strip()
+    return shell.run(
+        ["kubectl", "get", opt, "-n", namespace], timeout=shell.QUERY_TIMEOUT
+    ).stdout.strip()
 
 
 def get_ingress_ip(namespace: str = "istio-system"):
-    output = subprocess.Popen(
-        [
-            "kubectl",
-            "get",
-            "--no-headers",
-            "svc",
-            "-n",
-            namespace,
-            "istio-ingress",
-        ],
-        stdout=subprocess.PIPE,
-    ).communicate()[0]  # nosec
-    return output.decode("ascii").strip().split()[2]
+    output = shell.run(
+        ["kubectl", "get", "--no-headers", "svc", "-n", namespace, "istio-ingress"],
+        timeout=shell.QUERY_TIMEOUT,
+    ).stdout
+    return output.strip().split()[2]
 
 
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands")
@@ -479,20 +478,61 @@ def get_pods_not_running(namespace: str = "default"):
     """
     jsonpath = "'{range .items[?(@.status.containerStatuses[-1:].state.waiting)]}{.metadata.name}: {@.status.containerStatuses[*].state.waiting.reason}{\"\\n\"}{end}'"  # nosec
     cmd = f"kubectl get pods -n {namespace} -o jsonpath={jsonpath}"  # nosec
-    args = shlex.split(cmd)
-    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(cmd, timeout=shell.QUERY_TIMEOUT).stdout.strip()
+
+
+def get_pods_not_running_dict(namespace: str = "default"):
+    """
+    Get pods that are not running as a dict of pod name to waiting reason(s)
+    """
+    pods = {}
+    for line in get_pods_not_running(namespace=namespace).splitlines():
+        name, _, reason = line.partition(":")
+        if name.strip():
+            pods[name.strip()] = reason.strip()
+    return pods
 
 
 def get_deployment_status(deployment: str, namespace: str = "default"):
     cmd = f"kubectl get deploy {deployment} -n {namespace} -o jsonpath='{{.status}}'"  # nosec
-    args = shlex.split(cmd)
-    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
-    data = output.decode("ascii").strip()
+    data = shell.run(cmd, timeout=shell.QUERY_TIMEOUT).stdout.strip()
     if data:
         return json.loads(data)
 
 
+def scale_workload(kind: str, name: str, replicas: int, namespace: str = "default"):
+    """
+    Scale a Deployment or StatefulSet through the scale subresource
+    """
+    logger.info(f"Scaling {kind} {name} to {replicas} in {namespace}")
+    config.load_kube_config()
+    apps = client.AppsV1Api()
+    body = {"spec": {"replicas": replicas}}
+    if kind == "StatefulSet":
+        apps.patch_namespaced_stateful_set_scale(name, namespace, body)
+    else:
+        apps.patch_namespaced_deployment_scale(name, namespace, body)
+
+
+def workloads_settled(workloads: list, namespace: str = "default"):
+    """
+    True when every (kind, name, replicas) workload has exactly that many
+    ready replicas and no pods left over from a scale down
+    """
+    config.load_kube_config()
+    apps = client.AppsV1Api()
+    for kind, name, replicas in workloads:
+        if kind == "StatefulSet":
+            status = apps.read_namespaced_stateful_set(name, namespace).status
+        else:
+            status = apps.read_namespaced_deployment(name, namespace).status
+        if (status.ready_replicas or 0) != replicas or (
+            status.replicas or 0
+        ) != replicas:
+            return False
+    return True
+
+
 @cli.command(rich_help_panel="k8s Related Commands")
 def use_context(
     context: Annotated[
@@ -522,10 +562,21 @@ def current_context():
 
 def get_currentcontext():
     # kubectl config view -o template --template='{{ index . "current-context" }}'
-    output = subprocess.Popen(
-        ["kubectl", "config", "current-context"], stdout=subprocess.PIPE
-    ).communicate()[0]  # nosec
-    return output.decode("ascii").strip()
+    return shell.run(
+        ["kubectl", "config", "current-context"], timeout=shell.QUERY_TIMEOUT
+    ).stdout.strip()
+
+
+def kube_context():
+    """
+    Name of the current kubeconfig context, read in process. None when there
+    is no kubeconfig or no current context.
+    """
+    try:
+        _, active_context = config.list_kube_config_contexts()
+    except config.ConfigException:
+        return None
+    return (active_context or {}).get("name")
 
 
 def get_current_valid_context():
@@ -540,10 +591,9 @@ def get_current_valid_context():
 
 
 def usecontext(context: str = "docker-desktop"):
-    output = subprocess.Popen(
-        ["kubectl", "config", "use-context", context], stdout=subprocess.PIPE
-    ).communicate()[0]  # nosec
-    return output.decode("ascii").strip()
+    return shell.run(
+        ["kubectl", "config", "use-context", context], timeout=shell.QUERY_TIMEOUT
+    ).stdout.strip()
 
 
 def log_contexts():
@@ -630,16 +680,14 @@ def get_pvcs(namespace: str = "default"):
     """
     Get persistent volume claims
     """
-    try:
-        output = subprocess.run(
-            ["kubectl", "get", "pvc", "-n", namespace, "-o", "json"],
-            capture_output=True,
-            check=True,
-        )
-        return json.loads(output.stdout.decode("utf-8"))
-    except subprocess.CalledProcessError as err:
-        error_console.print(f":x: Error getting PVCs: {err}")
+    result = shell.run(
+        ["kubectl", "get", "pvc", "-n", namespace, "-o", "json"],
+        timeout=shell.QUERY_TIMEOUT,
+    )
+    if not result.ok:
+        error_console.print(f":x: Error getting PVCs: {result.output}")
         raise typer.Exit(1)
+    return json.loads(result.stdout)
 
 
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands")
@@ -671,21 +719,20 @@ def get_storage_classes(save: bool = False):
     """
     Get storage classes
     """
-    try:
-        output = subprocess.run(
-            ["kubectl", "get", "sc", "-o", "json"], capture_output=True, check=True
-        )
-        if save:
-            name = "storage_classes.json"
-            with open(name, "w") as f:
-                f.write(output.stdout.decode("utf-8"))
-            console.print(f":white_check_mark: Storage classes saved to {name}")
-            logger.info(f"Storage classes saved to {name}")
-            return name
-        return json.loads(output.stdout.decode("utf-8"))
-    except subprocess.CalledProcessError as err:
-        error_console.print(f":x: Error getting storage classes: {err}")
+    result = shell.run(
+        ["kubectl", "get", "sc", "-o", "json"], timeout=shell.QUERY_TIMEOUT
+    )
+    if not result.ok:
+        error_console.print(f":x: Error getting storage classes: {result.output}")
         raise typer.Exit(1)
+    if save:
+        name = "storage_classes.json"
+        with open(name, "w") as f:
+            f.write(result.stdout)
+        console.print(f":white_check_mark: Storage classes saved to {name}")
+        logger.info(f"Storage classes saved to {name}")
+        return name
+    return json.loads(result.stdout)
 
 
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands")
@@ -735,23 +782,19 @@ def patch_pvc(
         error_console.print(":x: No patch data provided.")
         raise typer.Exit(1)
 
-    try:
-        console.print(
-            f"Patching PVC '{pvc_name}' in namespace '{namespace}' with data:"
-        )
-        console.print(f":wrench: Patching PVC '{pvc_name}'...")
-        console.print(f":page_facing_up: Patch Data: {patch_data}")
-        # Ensure the patch is a valid JSON string
-        output = subprocess.run(
-            ["kubectl", "patch", "pvc", pvc_name, "-n", namespace, "-p", patch_data],
-            capture_output=True,
-            check=True,
-        )
-        console.print(f":thumbs_up: PVC '{pvc_name}' patched successfully.")
-        return output.stdout.decode("utf-8")
-    except subprocess.CalledProcessError as err:
-        error_console.print(f":x: Error patching PVC '{pvc_name}': {err}")
-        logging.error(f"Error patching PVC '{pvc_name}': {err}")
+    console.print(f"Patching PVC '{pvc_name}' in namespace '{namespace}' with data:")
+    console.print(f":wrench: Patching PVC '{pvc_name}'...")
+    console.print(f":page_facing_up: Patch Data: {patch_data}")
+    result = shell.run(
+        ["kubectl", "patch", "pvc", pvc_name, "-n", namespace, "-p", patch_data],
+        timeout=shell.QUERY_TIMEOUT,
+    )
+    if not result.ok:
+        error_console.print(f":x: Error patching PVC '{pvc_name}': {result.output}")
+        logging.error(f"Error patching PVC '{pvc_name}': {result.output}")
+        return
+    console.print(f":thumbs_up: PVC '{pvc_name}' patched successfully.")
+    return result.stdout
 
 
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands")
@@ -826,13 +869,11 @@ volumeBindingMode: Immediate # Or WaitForFirstConsumer
         f.write(yaml)
 
     console.log(f"Adding Storage Class {name}...")
-    try:
-        run_shell_command(f"kubectl apply -f '{filename}'")
-        console.log(f":thumbs_up: Storage Class {name} Added")
-        os.remove(filename)  # Clean up the temporary file
-    except subprocess.CalledProcessError as err:
-        error_console.print(f":x: Error adding Storage Class {name}: {err}")
+    if not run_shell_command(f"kubectl apply -f '{filename}'"):
+        error_console.print(f":x: Error adding Storage Class {name}")
         raise typer.Exit(1)
+    console.log(f":thumbs_up: Storage Class {name} Added")
+    os.remove(filename)  # Clean up the temporary file
 
 
 def log_kube_stats():
@@ -847,6 +888,25 @@ def log_kube_stats():
     )
 
 
+def pod_memory_usage_gb(namespace: str = "default"):
+    """
+    Memory used by pods in a namespace from the metrics API (None if unavailable)
+    """
+    try:
+        config.load_kube_config()
+        metrics = client.CustomObjectsApi().list_namespaced_custom_object(
+            "metrics.k8s.io", "v1beta1", namespace, "pods"
+        )
+    except Exception as err:
+        logger.info(f"Metrics API not available: {err}")
+        return None
+    usage = 0
+    for pod in metrics.get("items", []):
+        for container in pod.get("containers", []):
+            usage += utils.parse_quantity(container["usage"]["memory"])
+    return float(usage) / 1024 / 1024 / 1024
+
+
 @diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands")
 def get_cluster_ip(
     name: Annotated[
@@ -6,8 +6,12 @@ import typer
 import platform
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
 import cibutler.utils as utils
+import cibutler.shell as shell
 import cibutler.cidocker as cidocker
+import cibutler.tunnel as tunnel_supervisor
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +41,8 @@ def suggested_cpu():
         suggested_cpu_limit = 8
     elif nprocs > 6:
         suggested_cpu_limit = 6
+    else:
+        suggested_cpu_limit = nprocs
     return suggested_cpu_limit
 
 
@@ -47,6 +53,8 @@ def config_minikube(
     max_memory: bool = False,
     percent_memory: float = 0.98,
     disk_size: int = 120,  # Disk size allocated to the minikube VM in GB
+    cpus: int = None,  # Sized from the chart, overrides the heuristic
+    memory: int = None,  # Sized from the chart in GB, overrides the heuristic
 ):
     """
     Configure minikube
@@ -54,6 +62,11 @@ def config_minikube(
     if max_cpu:
         console.print(":fire: Setting minikube CPU limit to the max :rocket:")
         minikube_config_set("cpus", "max", profile=profile)
+    elif cpus:
+        console.print(
+            f":pushpin: Setting minikube CPU limit to {cpus} (sized from chart)"
+        )
+        minikube_config_set("cpus", f"{cpus}", profile=profile)
     else:
         if "Darwin" in platform.system():
             suggested_cpu_limit = utils.macos_performance_cores()
@@ -79,6 +92,11 @@ def config_minikube(
     if max_memory:
         console.print(":fire: Setting minikube Memory limit to the max :rocket:")
         minikube_config_set("memory", "max", profile=profile)
+    elif memory:
+        console.print(
+            f":pushpin: Setting minikube Memory limit to {memory}g (sized from chart)"
+        )
+        minikube_config_set("memory", f"{memory}g", profile=profile)
     else:
         ram = cidocker.docker_info_memtotal()
         mem_gb = ram / 1024 / 1024 / 1024
@@ -107,7 +125,7 @@ def minikube_config_set(
     try:
         if profile:
             output = subprocess.run(
-                ["minikube", "config", "set", property, value, "--profile", {profile}],
+                ["minikube", "config", "set", property, value, "--profile", profile],
                 capture_output=True,
             )
         else:
@@ -132,65 +150,209 @@ def change_group(group_name):
         print(f"Error changing group: {e}")
 
 
-def minikube_start(
+def profile_runtime(profile: str = None):
+    """
+    Container runtime of an existing minikube profile, None when there is no
+    such profile
+    """
+    result = shell.run(
+        ["minikube", "profile", "list", "-o", "json"], timeout=shell.QUERY_TIMEOUT
+    )
+    try:
+        profiles = json.loads(result.stdout) if result.ok else {}
+    except ValueError:
+        return None
+    for item in profiles.get("valid", []) + profiles.get("invalid", []):
+        if item.get("Name") == (profile or "minikube"):
+            return (
+                item.get("Config", {})
+                .get("KubernetesConfig", {})
+                .get("ContainerRuntime")
+            ) or "docker"
+    return None
+
+
+def minikube_start_command(
     profile: str = None,
     force: bool = False,
     container_runtime: str = "docker",
     kubernetes_version: str = "stable",
     nodes: int = 1,
+    cpus: int = None,
+    memory: int = None,
+    registry_mirror: str = None,
+    insecure_registries: list = None,
 ):
     """
-    Minkube start
+    Build the minikube start arguments. cpus and memory (GB) are per node.
     """
-    force_opt = ""
+    cmd = [
+        "minikube",
+        "start",
+        f"--container-runtime={container_runtime}",
+        f"--kubernetes-version={kubernetes_version}",
+        f"--nodes={nodes}",
+    ]
+    if profile:
+        cmd += ["--profile", profile]
+    if cpus:
+        cmd.append(f"--cpus={cpus}")
+    if memory:
+        cmd.append(f"--memory={memory}g")
+    if registry_mirror:
+        cmd.append(f"--registry-mirror={registry_mirror}")
+    for registry in insecure_registries or []:
+        cmd.append(f"--insecure-registry={registry}")
     if force:
-        force_opt = "--force"
+        cmd.append("--force")
+    return cmd
+
 
+def minikube_start(
+    profile: str = None,
+    force: bool = False,
+    container_runtime: str = "docker",
+    kubernetes_version: str = "stable",
+    nodes: int = 1,
+    cpus: int = None,
+    memory: int = None,
+    registry_mirror: str = None,
+    insecure_registries: list = None,
+):
+    """
+    Minkube start
+    """
     # might need a change_group("docker") for linux
-    if profile:
-        console.print(
-            f":fire: Starting minikube ({profile}) with {container_runtime} {kubernetes_version} kubernetes with {nodes} node(s)..."
-        )
-        call(
-            [
-                "minikube",
-                "start",
-                f"--container-runtime={container_runtime}",
-                f"--kubernetes-version={kubernetes_version}",
-                f"--nodes={nodes}",
-                f"--profile {profile}",
-            ]
-        )
-        call(
-            [
-                "minikube",
-                "kubectl",
-                "--",
-                "config",
-                "use-context",
-                "minikube",
-                "--profile",
-                profile,
-            ]
-        )
-    else:
-        console.print(
-            f":fire: Starting minikube with {container_runtime} {kubernetes_version} kubernetes with {nodes} node(s)..."
-        )
-        if force_opt:
-            console.print("[yellow]:warning:[/yellow] force start enabled")
-
-        call(
-            [
-                "minikube",
-                "start",
-                f"--container-runtime={container_runtime}",
-                f"--kubernetes-version={kubernetes_version}",
-                f"--nodes={nodes}",
-                force_opt,
-            ]
+    console.print(
+        f":fire: Starting minikube{f' ({profile})' if profile else ''} with {container_runtime} {kubernetes_version} kubernetes with {nodes} node(s)..."
+    )
+    if force:
+        console.print("[yellow]:warning:[/yellow] force start enabled")
+
+    call(
+        minikube_start_command(
+            profile=profile,
+            force=force,
+            container_runtime=container_runtime,
+            kubernetes_version=kubernetes_version,
+            nodes=nodes,
+            cpus=cpus,
+            memory=memory,
+            registry_mirror=registry_mirror,
+            insecure_registries=insecure_registries,
         )
-        call(["minikube", "kubectl", "--", "config", "use-context", "minikube"])
+    )
+    # minikube names the kube context after the profile
+    call(["minikube", "kubectl", "--", "config", "use-context", profile or "minikube"])
+
+
+def split_resources(
+    profiles: int, nodes: int = 1, reserve_cpu: int = 1, reserve_gb: int = 2
+):
+    """
+    Split docker CPU and RAM evenly between profiles, per node.
+    Returns cpus and memory (GB) for each node.
+    """
+    ncpu = cidocker.docker_info_ncpu()
+    mem_gb = cidocker.docker_info_memtotal() / 1024 / 1024 / 1024
+    count = profiles * nodes
+    cpus = max(2, (ncpu - reserve_cpu) // count)
+    memory = max(2, int((mem_gb - reserve_gb) // count))
+    logger.info(
+        f"Docker {ncpu} CPU {mem_gb:.1f}GB split over {profiles} profile(s) x {nodes} node(s): {cpus} CPU {memory}GB each"
+    )
+    return cpus, memory
+
+
+def start_profiles(
+    profiles: list,
+    nodes: int = 1,
+    cpus: int = None,
+    memory: int = None,
+    kubernetes_version: str = "stable",
+    force: bool = False,
+):
+    """
+    Start several minikube profiles concurrently.
+    Returns a dict of profile to exit status.
+    """
+    if not cpus or not memory:
+        split_cpus, split_memory = split_resources(len(profiles), nodes=nodes)
+        cpus = cpus or split_cpus
+        memory = memory or split_memory
+
+    def start(profile):
+        logfile = f"minikube-{profile}.log"
+        with open(logfile, "w") as outfile:
+            return subprocess.run(
+                minikube_start_command(
+                    profile=profile,
+                    force=force,
+                    kubernetes_version=kubernetes_version,
+                    nodes=nodes,
+                    cpus=cpus,
+                    memory=memory,
+                ),
+                stdout=outfile,
+                stderr=subprocess.STDOUT,
+            ).returncode
+
+    results = {}
+    with console.status(
+        f"Starting {len(profiles)} minikube profile(s), {nodes} node(s) each with {cpus} CPU {memory}GB..."
+    ):
+        with ThreadPoolExecutor(max_workers=len(profiles)) as executor:
+            futures = {executor.submit(start, profile): profile for profile in profiles}
+            for future in as_completed(futures):
+                profile = futures[future]
+                try:
+                    results[profile] = future.result()
+                except Exception as err:
+                    logger.error(f"Unable to start minikube profile {profile}: {err}")
+                    results[profile] = 1
+                if results[profile]:
+                    error_console.print(
+                        f":x: {profile} failed to start, see minikube-{profile}.log"
+                    )
+                else:
+                    console.print(f":white_check_mark: {profile} started")
+                logger.info(
+                    f"minikube profile {profile} exit status {results[profile]}"
+                )
+    return results
+
+
+@cli.command(rich_help_panel="CI Commands")
+def start_clusters(
+    profiles: Annotated[
+        str, typer.Argument(help="Comma separated minikube profile names")
+    ],
+    nodes: Annotated[int, typer.Option(help="Nodes per cluster")] = 1,
+    cpus: Annotated[
+        int, typer.Option(help="CPUs per node (default: split docker CPUs)")
+    ] = None,
+    memory: Annotated[
+        int, typer.Option(help="Memory per node in GB (default: split docker RAM)")
+    ] = None,
+    kubernetes_version: Annotated[
+        str, typer.Option(help="Kubernetes version")
+    ] = "stable",
+):
+    """
+    Start isolated minikube clusters (profiles) in parallel, sharing the host's CPU and RAM
+
+    Then install into one with [bold]install --minikube-profile NAME[/bold]
+    """
+    names = [name.strip() for name in profiles.split(",") if name.strip()]
+    results = start_profiles(
+        names,
+        nodes=nodes,
+        cpus=cpus,
+        memory=memory,
+        kubernetes_version=kubernetes_version,
+    )
+    if any(results.values()):
+        raise typer.Exit(1)
 
 
 def minikube_delete(profile: str = None):
@@ -215,12 +377,15 @@ def minikube_status(profile: str = None):
         return call(["minikube", "status"])
 
 
-def status():
+def status(profile: str = None):
     """
     Return status of minikube
     True if running
     """
-    p = subprocess.Popen(["minikube", "status"], stdout=subprocess.PIPE, text=True)
+    cmd = ["minikube", "status"]
+    if profile:
+        cmd += ["-p", profile]
+    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
     p.wait()
     logger.info(f"minikube exit status code: {p.returncode}")
     return not p.returncode
@@ -263,9 +428,10 @@ def tunnel(
         typer.Option(
             "--background",
             "-b",
-            help="Run in background - supported only on Linux and MacOS",
+            help="Run in background, supervised and restarted when unhealthy - supported only on Linux and MacOS",
         ),
     ] = False,
+    profile: Annotated[str, typer.Option(help="Minikube profile")] = None,
 ):
     """
     Minkube tunnel
@@ -274,18 +440,18 @@ def tunnel(
     """
 
     if platform.system() != "Windows" and background and os.geteuid() == 0:
-        logfile = "tunnel.log"
-        with open(logfile, "w") as outfile:
-            console.print(f"Starting background minikube tunnel, logfile: {logfile}")
-            console.log(f"Starting background minikube tunnel, logfile: {logfile}")
-            subprocess.Popen(
-                ["minikube", "tunnel", "--alsologtostderr"],
-                stdout=outfile,
-                stderr=outfile,
-            )
+        pid = tunnel_supervisor.start_supervisor(profile=profile)
+        console.print(
+            f"Started supervised minikube tunnel (pid {pid}), logfile: {tunnel_supervisor.LOG_FILE}"
+        )
+        console.print("Check it with [code]cibutler tunnel-status[/code]")
+        logger.info(f"Started supervised minikube tunnel, pid {pid}")
     else:
         logger.info("Starting minikube tunnel")
-        call(["minikube", "tunnel", "--alsologtostderr"])
+        cmd = ["minikube", "tunnel", "--alsologtostderr"]
+        if profile:
+            cmd += ["--profile", profile]
+        call(cmd)
 
 
 if __name__ == "__main__":
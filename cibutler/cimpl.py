@@ -10,13 +10,19 @@ import inquirer
 import shlex
 import base64
 import logging
+import contextlib
 from rich.panel import Panel
+from rich.live import Live
 from typing_extensions import Annotated
 import cibutler.cik8s as cik8s
 import cibutler.utils as utils
+import cibutler.podwatch as podwatch
+import cibutler.triage as triage
+import cibutler.elastic as elastic
+import cibutler.shell as shell
 from cibutler.shell import run_shell_command
 from cibutler.common import console, error_console
-from cibutler.config import SERVICE_FLAG_MAP
+from cibutler.config import SERVICE_FLAG_MAP, resolve_services
 
 logger = logging.getLogger(__name__)
 
@@ -70,14 +76,53 @@ def cpu():
         logger.info(f"CPU: {utils.cpu_info()} Logic cores: {os.cpu_count()}")
 
 
+def helm_service_values(selected_services: list, log: bool = False):
+    """
+    Helm flag=value pairs enabling the selected services and disabling the rest
+    """
+    selected_services = set(selected_services)
+    values = []
+    for service, flags in SERVICE_FLAG_MAP.items():
+        enabled = str(service in selected_services).lower()
+        if log:
+            console.log(f"{service} Deploy Enabled: {enabled}")
+            logger.info(f"{service} Deploy Enabled: {enabled}")
+        for flag in flags:
+            values.append(f"{flag}={enabled}")
+
+    # Legacy flags for older chart naming
+    legacy_flag_map = {
+        "Unit": ["core_unit_deploy.enabled"],
+        "Policy": [
+            "core_partition_deploy.data.policyServiceEnabled",
+            "core_policy_deploy.enabled",
+        ],
+        "Crs-catalog": [
+            "core_crs_catalog_deploy.enabled",
+            "core-crs-catalog-deploy.enabled",
+        ],
+        "Crs-conversion": [
+            "core_crs_converter_deploy.enabled",
+            "core-crs-converter-deploy.enabled",
+        ],
+    }
+    for service, flags in legacy_flag_map.items():
+        enabled = str(service in selected_services).lower()
+        for flag in flags:
+            values.append(f"{flag}={enabled}")
+    return values
+
+
 def install_cimpl(
     version: str,
     source: str,
     chart: str = "osdu-cimpl",
     configured_options: dict = None,
+    values_files: list = None,
 ):
     """
-    Install CImpl OCI registry or local source
+    Install CImpl OCI registry or local source, values_files are applied in
+    order after the chart's own values
     """
 
     if configured_options is None:
@@ -87,46 +132,22 @@ def install_cimpl(
         "rabbitmq_password", utils.random_password()
     )
     redis_password = configured_options.get("redis_password", utils.random_password())
-    selected_services = set(
+    selected_services = resolve_services(
         configured_options.get("osdu_services", list(SERVICE_FLAG_MAP.keys()))
     )
 
-    def enabled_flag(name: str) -> str:
-        return str(name in selected_services).lower()
-
     console.print(f"Using RabbitMQ password: {rabbitmq_password}")
     console.print(f"Using Redis password: {redis_password}")
     logger.debug(f"Using RabbitMQ password: {rabbitmq_password}")
     logger.debug(f"Using Redis password: {redis_password}")
 
-    helm_service_sets = []
-    for service, flags in SERVICE_FLAG_MAP.items():
-        enabled = enabled_flag(service)
-        console.log(f"{service} Deploy Enabled: {enabled}")
-        logger.info(f"{service} Deploy Enabled: {enabled}")
-        for flag in flags:
-            helm_service_sets.append(f"--set {flag}={enabled}")
-
-    # Legacy flags for older chart naming
-    legacy_flag_map = {
-        "Unit": ["core_unit_deploy.enabled"],
-        "Policy": [
-            "core_partition_deploy.data.policyServiceEnabled",
-            "core_policy_deploy.enabled",
-        ],
-        "Crs-catalog": [
-            "core_crs_catalog_deploy.enabled",
-            "core-crs-catalog-deploy.enabled",
-        ],
-        "Crs-conversion": [
-            "core_crs_converter_deploy.enabled",
-            "core-crs-converter-deploy.enabled",
-        ],
-    }
-    for service, flags in legacy_flag_map.items():
-        enabled = enabled_flag(service)
-        for flag in flags:
-            helm_service_sets.append(f"--set {flag}={enabled}")
+    helm_service_sets = [
+        f"--set {value}" for value in helm_service_values(selected_services, log=True)
+    ]
+    helm_values_files = [f"-f {shlex.quote(path)}" for path in values_files or []]
+    for path in values_files or []:
+        console.log(f":page_facing_up: Using values {path}")
+        logger.info(f"Using values file {path}")
 
     console.log(f":pushpin: Requested install version {version} from {source}...")
 
@@ -140,7 +161,8 @@ def install_cimpl(
             f"--set global.redis.password={redis_password}",
         ]
         helm_sets.extend(helm_service_sets)
-        run_shell_command(
+        helm_sets.extend(helm_values_files)
+        installed = run_shell_command(
             f"helm upgrade --install {chart} {source} --version {version} "
             + " ".join(helm_sets)
         )
@@ -148,9 +170,14 @@ def install_cimpl(
         # Local source
         logger.info(f"Using local source {source} for CImpl")
         console.log(f":fire: Using local source {source} for CImpl")
-        run_shell_command(
-            f"helm upgrade --install {chart} {source} " + " ".join(helm_service_sets)
+        installed = run_shell_command(
+            f"helm upgrade --install {chart} {source} "
+            + " ".join(helm_service_sets + helm_values_files)
         )
+    if not installed:
+        logger.error(f"helm upgrade of {chart} failed")
+        error_console.print(f":x: helm upgrade of {chart} failed, see the output above")
+        raise typer.Exit(1)
 
     time.sleep(1)
 
@@ -337,6 +364,8 @@ def check_running(
     quiet: bool = False,
     entitlement_workaround: bool = False,
     source: str = "unknown",
+    namespace: str = "default",
+    fail_fast: bool = True,
 ):
     """
     Check if CImpl is running (and make simple corrections)
@@ -344,92 +373,125 @@ def check_running(
     start = time.time()
     running = False
     errors = 0
+    status_line = ""
 
-    flag = utils.GracefulExiter()
-    while True:
-        if not quiet:
-            console.clear()
-            call(["kubectl", "get", "po"])  # nosec
+    # One watch stream feeds both the pod counts and the live dashboard
+    watcher = podwatch.start_watcher(namespace=namespace)
+    # Without fail fast the cluster is left alone, findings are only reported
+    escalation = (
+        triage.Escalation(namespace=namespace, fix=fail_fast) if watcher else None
+    )
+    live = None
+    if watcher and not quiet:
+        live = Live(
+            get_renderable=lambda: watcher.table(caption=status_line),
+            console=console,
+            refresh_per_second=1,
+        )
+        live.start()
 
-        pods_not_ready = cik8s.get_pods_not_running()
-        duration = time.time() - start
-        duration_str = utils.convert_time(duration)
-        if pods_not_ready:
-            # If keycloak and partition bootstrap completed, restart the entitlements.
-            # Hopefully this will get fixed in the future
-            if (
-                entitlement_workaround
-                and "partition-bootstrap" in pods_not_ready
-                and "keycloak-bootstrap" in pods_not_ready
-            ):
-                restart_entitlements()
-
-            if flag.exit():
-                break
-
-            # if running over max time
-            if duration > (60 * max_wait):
-                error_console.log(
-                    f"There seems to be an issue with `{pods_not_ready}`."
-                )
-                logger.error(
-                    f"There seems to be an issue with `{pods_not_ready}`. Exiting after {max_wait} minutes. {duration_str} elapsed."
-                )
-                display_error_msg(errors, version=version, minikube=minikube)
-                break
-
-            console.print()
-            count = len(pods_not_ready.strip().split(" "))
-            console.print(
-                f":person_running: Pods not ready: {count}, elapsed: {duration_str}, version: {version}, {'Minikube' if minikube else 'Kubernetes'}",
-            )
-            logger.info(
-                f":person_running: Pods not ready: {count}, elapsed: {duration_str}, version: {version}, {'Minikube' if minikube else 'Kubernetes'}",
-            )
-            logger.info(f"Pods not ready: {pods_not_ready}")
-            for _ in rich.progress.track(
-                range(sleep),
-                transient=True,
-                description=f"The status will be updated every {sleep} seconds. Please, do not interrupt script execution.",
-            ):
-                time.sleep(1)
-        else:
-            console.log(":thumbs_up: pods ready")
-            logger.info("Pods ready")
-            bootstrap = "schema-bootstrap"
-            data = cik8s.get_deployment_status(bootstrap)
-            if data is None:
-                error_console.print(
-                    f":x: Error: Unable to determine {bootstrap} status"
-                )
-                logger.error(
-                    f"Unable to determine {bootstrap} status. Check if the deployment exists."
-                )
-                errors += 1
-                time.sleep(1)
-            elif readyandavailable(data):
-                console.log(f":thumbs_up: {bootstrap} ready")
-                logger.info(f"{bootstrap} is ready")
-                running = True
-                break
+    flag = utils.GracefulExiter()
+    try:
+        while True:
+            if watcher:
+                pods_not_ready = watcher.not_ready()
             else:
-                console.log(
-                    f"Bootstrap default set of schemas is still in progress...{duration_str}"
-                )
-                if quiet:
-                    time.sleep(bootstrap_sleep)
+                pods_not_ready = cik8s.get_pods_not_running_dict(namespace=namespace)
+            duration = time.time() - start
+            duration_str = utils.convert_time(duration)
+            if pods_not_ready:
+                # If keycloak and partition bootstrap completed, restart the entitlements.
+                # Hopefully this will get fixed in the future
+                if (
+                    entitlement_workaround
+                    and any("partition-bootstrap" in pod for pod in pods_not_ready)
+                    and any("keycloak-bootstrap" in pod for pod in pods_not_ready)
+                ):
+                    restart_entitlements()
+
+                # Known terminal failures get one targeted fix, then stop the wait
+                if escalation:
+                    fatal = escalation.check(watcher.states())
+                    if fatal and fail_fast:
+                        if live:
+                            live.stop()
+                            live = None
+                        triage.display_findings(fatal)
+                        display_error_msg(errors, version=version, minikube=minikube)
+                        return False
+
+                if flag.exit():
+                    break
+
+                # if running over max time
+                if duration > (60 * max_wait):
+                    error_console.log(
+                        f"There seems to be an issue with `{' '.join(pods_not_ready)}`."
+                    )
+                    logger.error(
+                        f"There seems to be an issue with `{pods_not_ready}`. Exiting after {max_wait} minutes. {duration_str} elapsed."
+                    )
+                    display_error_msg(errors, version=version, minikube=minikube)
+                    break
+
+                count = len(pods_not_ready)
+                status_line = f":person_running: Pods not ready: {count}, elapsed: {duration_str}, version: {version}, {'Minikube' if minikube else 'Kubernetes'}"
+                logger.info(status_line)
+                logger.info("Pods not ready: %s", pods_not_ready)
+                if live:
+                    wait_with_flag(sleep, flag)
                 else:
-                    with console.status(
-                        f"The status will be updated every {bootstrap_sleep} seconds. Please, do not interrupt script execution.",
-                        spinner="aesthetic",
+                    console.print(status_line)
+                    for _ in rich.progress.track(
+                        range(sleep),
+                        transient=True,
+                        description=f"The status will be updated every {sleep} seconds. Please, do not interrupt script execution.",
                     ):
+                        time.sleep(1)
+            else:
+                console.log(":thumbs_up: pods ready")
+                logger.info("Pods ready")
+                bootstrap = "schema-bootstrap"
+                data = cik8s.get_deployment_status(bootstrap)
+                if data is None:
+                    error_console.print(
+                        f":x: Error: Unable to determine {bootstrap} status"
+                    )
+                    logger.error(
+                        f"Unable to determine {bootstrap} status. Check if the deployment exists."
+                    )
+                    errors += 1
+                    time.sleep(1)
+                elif readyandavailable(data):
+                    console.log(f":thumbs_up: {bootstrap} ready")
+                    logger.info(f"{bootstrap} is ready")
+                    running = True
+                    break
+                else:
+                    status_line = f"Bootstrap default set of schemas is still in progress...{duration_str}"
+                    if live:
+                        wait_with_flag(bootstrap_sleep, flag)
+                    elif quiet:
+                        console.log(status_line)
                         time.sleep(bootstrap_sleep)
-
-        if errors > 3:
-            error_console.log("Install failed. Too many errors")
-            display_error_msg(errors, version=version, minikube=minikube)
-            logger.error(f"Install failed. Too many errors: {errors}")
-            return False
+                    else:
+                        console.log(status_line)
+                        with console.status(
+                            f"The status will be updated every {bootstrap_sleep} seconds. Please, do not interrupt script execution.",
+                            spinner="aesthetic",
+                        ):
+                            time.sleep(bootstrap_sleep)
+
+            if errors > 3:
+                error_console.log("Install failed. Too many errors")
+                display_error_msg(errors, version=version, minikube=minikube)
+                logger.error(f"Install failed. Too many errors: {errors}")
+                return False
+    finally:
+        if live:
+            live.stop()
+        if watcher:
+            watcher.stop()
 
     duration = time.time() - start
     if duration > 2:
@@ -439,6 +501,16 @@ def check_running(
     return running
 
 
+def wait_with_flag(seconds: int, flag: utils.GracefulExiter):
+    """
+    Sleep in one second steps so an interrupt is noticed promptly
+    """
+    for _ in range(seconds):
+        if flag.exit():
+            return
+        time.sleep(1)
+
+
 @diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
 def bootstrap_upload_data(
     data_load_flag: str,
@@ -451,9 +523,13 @@ def bootstrap_upload_data(
     bootstrap_data_reference: str = "bootstrap-data-reference",
     bootstrap_data_legal: str = "bootstrap-data-legal",
     sleep: int = 30,
+    bulk_load: bool = True,
 ):
     """
     Bootstrap data upload process into OSDU
+
+    With bulk_load, Elasticsearch refreshes and replicas are off and the
+    indexer is scaled up while waiting for the load to complete.
     """
     console.log(f":fire: Starting uploading data: {data_load_flag}... {version}")
     logger.info(f"Starting uploading data: {data_load_flag}... {version}")
@@ -485,27 +561,39 @@ def bootstrap_upload_data(
 
     console.log(":fire: Starting data load process...")
     logger.info("Starting data load process...")
-    scale_deploy(bootstrap_data_reference, replicas=1)
-    start = time.time()
-    if wait_for_complete:
-        while True:
-            status = cik8s.get_deployment_status(bootstrap_data_reference)
-            if "readyReplicas" in status and status["readyReplicas"]:
-                console.log(
-                    f":thumbs_up: reference data bootstrapped {bootstrap_data_reference}."
-                )
-                logger.info(
-                    f"reference data bootstrapped {bootstrap_data_reference} {data_load_flag}."
-                )
-                break
-            else:
-                duration = time.time() - start
-                duration_str = utils.convert_time(duration)
-                with console.status(
-                    f"Data reference load ({data_load_flag}) running within the cluster {duration_str}"
-                ):
-                    time.sleep(sleep)
+    if wait_for_complete and bulk_load:
+        bulk_mode = elastic.BulkLoadMode()
+    else:
+        # Nothing would be left to restore the settings once the load completes
+        bulk_mode = contextlib.nullcontext()
+    with bulk_mode:
+        scale_deploy(bootstrap_data_reference, replicas=1)
+        start = time.time()
+        if wait_for_complete:
+            while True:
+                status = cik8s.get_deployment_status(bootstrap_data_reference)
+                if "readyReplicas" in status and status["readyReplicas"]:
+                    console.log(
+                        f":thumbs_up: reference data bootstrapped {bootstrap_data_reference}."
+                    )
+                    logger.info(
+                        f"reference data bootstrapped {bootstrap_data_reference} {data_load_flag}."
+                    )
+                    break
+                else:
+                    duration = time.time() - start
+                    duration_str = utils.convert_time(duration)
+                    rate = ""
+                    if bulk_load:
+                        docs_per_second = bulk_mode.docs_per_second()
+                        if docs_per_second is not None:
+                            rate = f", {docs_per_second:.1f} docs/sec"
+                    with console.status(
+                        f"Data reference load ({data_load_flag}) running within the cluster {duration_str}{rate}"
+                    ):
+                        time.sleep(sleep)
 
+    if wait_for_complete:
         duration = time.time() - start
         duration_str = utils.convert_time(duration)
         console.log(
@@ -589,9 +677,8 @@ def get_keycloak_client_secret():
     Get client secret from keycloak secrets
     """
     cmd = 'kubectl get secret keycloak-bootstrap-secret -o jsonpath="{.data.KEYCLOAK_OSDU_ADMIN_SECRET}"'  # nosec
-    args = shlex.split(cmd)
-    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
-    return base64.b64decode(output.decode("ascii").strip()).decode()
+    output = shell.run(cmd, timeout=shell.QUERY_TIMEOUT).stdout
+    return base64.b64decode(output.strip()).decode()
 
 
 def get_keycloak_admin_password():
@@ -599,9 +686,8 @@ def get_keycloak_admin_password():
     Get admin password from keycloak secrets
     """
     cmd = 'kubectl get secret keycloak-bootstrap-secret -o jsonpath="{.data.KEYCLOAK_ADMIN_PASSWORD}"'  # nosec
-    args = shlex.split(cmd)
-    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
-    return base64.b64decode(output.decode("ascii").strip()).decode()
+    output = shell.run(cmd, timeout=shell.QUERY_TIMEOUT).stdout
+    return base64.b64decode(output.strip()).decode()
 
 
 @diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
@@ -617,9 +703,8 @@ def get_notebook_pod():
     Get pod name of notebook
     """
     cmd = "kubectl get --no-headers pods -l app=cimpl-notebook"  # nosec
-    args = shlex.split(cmd)
-    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
-    return output.decode("ascii").strip().split()[0]
+    output = shell.run(cmd, timeout=shell.QUERY_TIMEOUT).stdout
+    return output.strip().split()[0]
 
 
 def get_notebook_token():
@@ -638,9 +723,7 @@ def get_notebook_log():
     """
     pod = get_notebook_pod()
     cmd = f"kubectl logs {pod}"  # nosec
-    args = shlex.split(cmd)
-    output = subprocess.Popen(args, stdout=subprocess.PIPE).communicate()[0]
-    return output.decode("ascii").strip()
+    return shell.run(cmd, timeout=shell.QUERY_TIMEOUT).stdout.strip()
 
 
 @diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
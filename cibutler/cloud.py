@@ -1,10 +1,22 @@
 import typer
 import logging
 from fabric import Connection
+from typing import List
 from typing_extensions import Annotated
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import rich.box
+from rich.markup import escape
+from rich.table import Table
+import cibutler.shell as shell
 from cibutler.shell import run_shell_command
+import cibutler.utils as utils
 import subprocess
+import shlex
+import json
 import time
+import atexit
+import threading
+from contextlib import contextmanager
 from cibutler.common import console, error_console
 
 # gcloud compute config-ssh
@@ -20,6 +32,82 @@ diag_cli = typer.Typer(
 )
 
 
+# ControlMaster multiplexing for ssh run as a command (the pool covers fabric)
+SSH_MULTIPLEX_OPTIONS = (
+    "-o ControlMaster=auto -o ControlPath=~/.ssh/cibutler-%C -o ControlPersist=10m"
+)
+
+
+class ConnectionPool:
+    """
+    Authenticated fabric connections by host, kept alive and reused across
+    commands so a host pays for the ssh handshake once
+    """
+
+    def __init__(self, keepalive: int = 30):
+        self.keepalive = keepalive
+        self._connections = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _host_lock(self, host: str):
+        with self._lock:
+            return self._locks.setdefault(host, threading.Lock())
+
+    def get(self, host: str):
+        """
+        Return an open connection to host, reconnecting if the transport dropped
+        """
+        with self._host_lock(host):
+            c = self._connections.get(host)
+            if c is None or not c.is_connected:
+                if c is not None:
+                    logger.info(f"Reconnecting to {host}")
+                    c.close()
+                start_time = time.time()
+                c = Connection(host)
+                c.open()
+                if self.keepalive:
+                    c.transport.set_keepalive(self.keepalive)
+                logger.info(f"Connected to {host} in {time.time() - start_time:.2f}s")
+                self._connections[host] = c
+            return c
+
+    @contextmanager
+    def session(self, host: str):
+        """
+        Connection for a group of commands, left open for the next caller
+        """
+        c = self.get(host)
+        try:
+            yield c
+        except Exception:
+            if not c.is_connected:
+                self.close(host)
+            raise
+
+    def reconnect(self, host: str):
+        """
+        Replace the connection to host with a newly authenticated one
+        """
+        self.close(host)
+        return self.get(host)
+
+    def close(self, host: str):
+        with self._lock:
+            c = self._connections.pop(host, None)
+        if c is not None:
+            c.close()
+
+    def close_all(self):
+        for host in list(self._connections):
+            self.close(host)
+
+
+pool = ConnectionPool()
+atexit.register(pool.close_all)
+
+
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
 def gcloud_checks():
     """
@@ -59,7 +147,8 @@ def ssh(
 
     Typically used after "gcloud compute config-ssh"
     """
-    result = Connection(host).run(command, hide=hide)
+    with pool.session(host) as c:
+        result = c.run(command, hide=hide, warn=True)
     if result.ok:
         if verbose:
             console.log(f"Connected to {host}")
@@ -84,7 +173,9 @@ def gcloud_config_ssh(
     """
     run_shell_command("gcloud compute config-ssh")
     if accept_new:
-        run_shell_command(f"ssh -o StrictHostKeyChecking=accept-new {host} uname")
+        run_shell_command(
+            f"ssh {SSH_MULTIPLEX_OPTIONS} -o StrictHostKeyChecking=accept-new {host} uname"
+        )
 
 
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
@@ -98,7 +189,7 @@ def gcloud_ssh(
     gcloud ssh with tunnel for kubernetes
     """
     run_shell_command(
-        f"gcloud compute ssh {instance} --zone {zone} --ssh-flag='-o ServerAliveInterval=60 -L 16443:localhost:16443'"
+        f"gcloud compute ssh {instance} --zone {zone} --ssh-flag='-o ServerAliveInterval=60 {SSH_MULTIPLEX_OPTIONS} -L 16443:localhost:16443'"
     )
 
 
@@ -139,34 +230,70 @@ def gcloud_instance_create(
     image=projects/rocky-linux-cloud/global/images/rocky-linux-9-optimized-gcp-v20250709
     """
 
-    vcpu = cores * 2
-    ram = gb * 1024  # Convert GB to MB
     with console.status(
         f"Creating VM {instance} in project {project} in zone {zone}..."
     ):
-        # --machine-type=e2-custom-6-32768 \
         run_shell_command(
-            f"gcloud compute instances create {instance} \
-    --project={project} \
-    --zone={zone} \
-    --description='OSDU CIButler Testing' \
-    --machine-type={series}-custom-{vcpu}-{ram} \
-    --network-interface=network-tier=PREMIUM,stack-type=IPV4_ONLY,subnet=default \
-    --metadata=enable-osconfig=TRUE \
-    --maintenance-policy=MIGRATE \
-    --provisioning-model=STANDARD \
-    --service-account={service_account} \
-    --scopes=https://www.googleapis.com/auth/devstorage.read_only,https://www.googleapis.com/auth/logging.write,https://www.googleapis.com/auth/monitoring.write,https://www.googleapis.com/auth/service.management.readonly,https://www.googleapis.com/auth/servicecontrol,https://www.googleapis.com/auth/trace.append \
-    --tags=http-server,https-server \
-    --create-disk=auto-delete=yes,boot=yes,device-name={instance},image={image},mode=rw,size={diskgb},type=pd-balanced \
-    --no-shielded-secure-boot \
-    --shielded-vtpm \
-    --shielded-integrity-monitoring \
-    --labels=goog-ops-agent-policy=v2-x86-template-1-4-0,goog-ec-src=vm_add-gcloud \
-    --reservation-affinity=any "
+            shlex.join(
+                ["gcloud", "compute", "instances", "create", instance]
+                + instance_create_args(
+                    project=project,
+                    service_account=service_account,
+                    zone=zone,
+                    series=series,
+                    cores=cores,
+                    gb=gb,
+                    diskgb=diskgb,
+                    image=image,
+                    device_name=instance,
+                )
+            )
         )
 
 
+def instance_create_args(
+    project: str,
+    service_account: str,
+    zone: str,
+    series: str = "n2",
+    cores: int = 6,
+    gb: int = 36,
+    diskgb: int = 132,
+    image: str = "projects/ubuntu-os-cloud/global/images/ubuntu-minimal-2504-plucky-amd64-v20250708",
+    device_name: str = None,
+):
+    """
+    gcloud compute instances create flags shared by single and batch create
+    """
+    vcpu = cores * 2
+    ram = gb * 1024  # Convert GB to MB
+    disk = (
+        f"auto-delete=yes,boot=yes,image={image},mode=rw,size={diskgb},type=pd-balanced"
+    )
+    if device_name:
+        disk = f"device-name={device_name},{disk}"
+    # --machine-type=e2-custom-6-32768 \
+    return [
+        f"--project={project}",
+        f"--zone={zone}",
+        "--description=OSDU CIButler Testing",
+        f"--machine-type={series}-custom-{vcpu}-{ram}",
+        "--network-interface=network-tier=PREMIUM,stack-type=IPV4_ONLY,subnet=default",
+        "--metadata=enable-osconfig=TRUE",
+        "--maintenance-policy=MIGRATE",
+        "--provisioning-model=STANDARD",
+        f"--service-account={service_account}",
+        "--scopes=https://www.googleapis.com/auth/devstorage.read_only,https://www.googleapis.com/auth/logging.write,https://www.googleapis.com/auth/monitoring.write,https://www.googleapis.com/auth/service.management.readonly,https://www.googleapis.com/auth/servicecontrol,https://www.googleapis.com/auth/trace.append",
+        "--tags=http-server,https-server",
+        f"--create-disk={disk}",
+        "--no-shielded-secure-boot",
+        "--shielded-vtpm",
+        "--shielded-integrity-monitoring",
+        "--labels=goog-ops-agent-policy=v2-x86-template-1-4-0,goog-ec-src=vm_add-gcloud",
+        "--reservation-affinity=any",
+    ]
+
+
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
 def gcloud_list_instances(
     project: Annotated[str, typer.Argument(help="GC Project", envvar="PROJECT")],
@@ -272,6 +399,264 @@ def gcloud_instance_delete(
         )
 
 
+def gcloud_json(args: list):
+    """
+    Run gcloud with json output and return the parsed result.
+    Raises subprocess.CalledProcessError if gcloud fails.
+    """
+    cmd = ["gcloud", *args, "--format=json"]
+    result = shell.run(cmd, timeout=shell.QUERY_TIMEOUT)
+    if not result.ok:
+        raise subprocess.CalledProcessError(
+            result.returncode, cmd, result.stdout, result.stderr
+        )
+    return json.loads(result.stdout or "[]")
+
+
+def gcloud_instance_names(zone: str, pattern: str, project: str = None):
+    """
+    Instance names in a zone matching a regular expression
+    """
+    args = [
+        "compute",
+        "instances",
+        "list",
+        f"--zones={zone}",
+        f"--filter=name~{pattern}",
+    ]
+    if project:
+        args.append(f"--project={project}")
+    return [instance["name"] for instance in gcloud_json(args)]
+
+
+def gcloud_instances_async(
+    action: str, names: list, zone: str, extra_args: list = None
+):
+    """
+    Start one gcloud instances operation for all names without waiting.
+    Returns the operations.
+    """
+    return gcloud_json(
+        ["compute", "instances", action, *names, f"--zone={zone}", "--async"]
+        + (extra_args or [])
+    )
+
+
+def wait_operations(
+    operations: list,
+    zone: str,
+    project: str = None,
+    poll: int = 5,
+    timeout: int = 1200,
+):
+    """
+    Poll all operations together with one gcloud call per round until done.
+    Returns the finished operations by name.
+    """
+    pending = {operation["name"] for operation in operations}
+    done = {}
+    start_time = time.time()
+    with console.status(f"Waiting for {len(pending)} operations...") as status:
+        while pending:
+            args = [
+                "compute",
+                "operations",
+                "list",
+                f"--zones={zone}",
+                f"--filter=name:({' '.join(sorted(pending))})",
+            ]
+            if project:
+                args.append(f"--project={project}")
+            for operation in gcloud_json(args):
+                if operation["name"] in pending and operation.get("status") == "DONE":
+                    pending.discard(operation["name"])
+                    done[operation["name"]] = operation
+            status.update(
+                f"{len(done)}/{len(operations)} operations done ({utils.convert_time(time.time() - start_time)})"
+            )
+            if pending:
+                if time.time() - start_time > timeout:
+                    logger.error(f"Timed out waiting for operations: {pending}")
+                    break
+                time.sleep(poll)
+    return done
+
+
+def operation_results(operations: list, done: dict):
+    """
+    Instance, status and error of each operation
+    """
+    results = []
+    for operation in operations:
+        finished = done.get(operation["name"])
+        instance = operation.get("targetLink", operation["name"]).rsplit("/", 1)[-1]
+        if finished is None:
+            results.append({"instance": instance, "ok": False, "error": "timed out"})
+        elif finished.get("error"):
+            errors = finished["error"].get("errors", [])
+            message = "; ".join(error.get("message", "") for error in errors)
+            results.append({"instance": instance, "ok": False, "error": message})
+        else:
+            results.append({"instance": instance, "ok": True, "error": None})
+    return results
+
+
+def gcloud_batch(
+    action: str,
+    names: list,
+    zone: str,
+    extra_args: list = None,
+    project: str = None,
+    poll: int = 5,
+):
+    """
+    Run a gcloud instances action on many instances at once and wait for all
+    of them. Returns the per instance results.
+    """
+    start_time = time.time()
+    operations = gcloud_instances_async(action, names, zone, extra_args)
+    console.print(f":rocket: Started {action} of {len(operations)} instances")
+    done = wait_operations(operations, zone, project=project, poll=poll)
+    results = operation_results(operations, done)
+
+    table = Table(
+        box=rich.box.SIMPLE,
+        caption=f"{action}: {sum(r['ok'] for r in results)}/{len(results)} succeeded in {utils.convert_time(time.time() - start_time)}",
+    )
+    table.add_column("Instance", style="cyan")
+    table.add_column("Result")
+    table.add_column("Error")
+    for result in results:
+        table.add_row(
+            result["instance"],
+            "[green]ok[/green]" if result["ok"] else "[red]failed[/red]",
+            result["error"] or "",
+        )
+    console.print(table)
+    return results
+
+
+def batch_names(names: list, pattern: str, zone: str, project: str = None):
+    names = list(names or [])
+    if pattern:
+        names += gcloud_instance_names(zone, pattern, project=project)
+    if not names:
+        error_console.print(":x: No instances, give names or --pattern")
+        raise typer.Exit(1)
+    return names
+
+
+def run_batch(action: str, names: list, zone: str, extra_args=None, project=None):
+    try:
+        results = gcloud_batch(action, names, zone, extra_args, project=project)
+    except subprocess.CalledProcessError as err:
+        error_console.print(f":x: gcloud {action} failed: {err.stderr.strip()}")
+        logger.error(f"gcloud {action} failed: {err.stderr}")
+        raise typer.Exit(1)
+    if not all(result["ok"] for result in results):
+        raise typer.Exit(1)
+
+
+@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
+def gcloud_batch_create(
+    project: Annotated[str, typer.Argument(help="GC Project", envvar="PROJECT")],
+    service_account: Annotated[
+        str, typer.Argument(help="Service Account", envvar="SERVICE_ACCOUNT")
+    ],
+    instances: Annotated[
+        List[str], typer.Argument(help="Instance names (or use --count)")
+    ] = None,
+    count: Annotated[int, typer.Option(help="Number of instances to create")] = 0,
+    prefix: Annotated[str, typer.Option(help="Name prefix with --count")] = "lab-",
+    zone: Annotated[str, typer.Option(help="GC Zone", envvar="ZONE")] = "us-central1-b",
+    series: Annotated[str, typer.Option(help="Instance Type", envvar="SERIES")] = "n2",
+    cores: Annotated[int, typer.Option(help="Instance Cores", envvar="CORES")] = 6,
+    gb: Annotated[
+        int, typer.Option("--ram", help="Instance GB RAM", envvar="RAM")
+    ] = 36,
+    diskgb: Annotated[int, typer.Option("--disk", help="Disk GB", envvar="DISK")] = 132,
+    image: Annotated[
+        str, typer.Option(help="Image Name", envvar="IMAGE")
+    ] = "projects/ubuntu-os-cloud/global/images/ubuntu-minimal-2504-plucky-amd64-v20250708",
+):
+    """
+    Create many GC VMs at once, e.g. [bold]--count 20 --prefix lab-[/bold] for a lab
+    """
+    names = list(instances or [])
+    width = len(str(count))
+    names += [f"{prefix}{index:0{width}d}" for index in range(1, count + 1)]
+    if not names:
+        error_console.print(":x: No instances, give names or --count")
+        raise typer.Exit(1)
+    run_batch(
+        "create",
+        names,
+        zone,
+        instance_create_args(
+            project=project,
+            service_account=service_account,
+            zone=zone,
+            series=series,
+            cores=cores,
+            gb=gb,
+            diskgb=diskgb,
+            image=image,
+        ),
+        project=project,
+    )
+
+
+@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
+def gcloud_batch_stop(
+    instances: Annotated[List[str], typer.Argument(help="Instance names")] = None,
+    pattern: Annotated[
+        str, typer.Option(help="Regular expression of instance names, e.g. ^lab-")
+    ] = None,
+    zone: Annotated[str, typer.Option(help="GC Zone", envvar="ZONE")] = "us-central1-b",
+):
+    """
+    Stop many GC VM instances at once
+    """
+    run_batch("stop", batch_names(instances, pattern, zone), zone)
+
+
+@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
+def gcloud_batch_start(
+    instances: Annotated[List[str], typer.Argument(help="Instance names")] = None,
+    pattern: Annotated[
+        str, typer.Option(help="Regular expression of instance names, e.g. ^lab-")
+    ] = None,
+    zone: Annotated[str, typer.Option(help="GC Zone", envvar="ZONE")] = "us-central1-b",
+):
+    """
+    Start many GC VM instances at once
+    """
+    run_batch("start", batch_names(instances, pattern, zone), zone)
+
+
+@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
+def gcloud_batch_delete(
+    instances: Annotated[List[str], typer.Argument(help="Instance names")] = None,
+    pattern: Annotated[
+        str, typer.Option(help="Regular expression of instance names, e.g. ^lab-")
+    ] = None,
+    zone: Annotated[str, typer.Option(help="GC Zone", envvar="ZONE")] = "us-central1-b",
+    force: Annotated[
+        bool,
+        typer.Option(
+            "--force", "--yes", "--quiet", "-y", help="No confirmation prompt"
+        ),
+    ] = False,
+):
+    """
+    Delete many GC VM instances (and their disks) at once
+    """
+    names = batch_names(instances, pattern, zone)
+    if not force:
+        typer.confirm(f"Delete {len(names)} instances: {', '.join(names)}?", abort=True)
+    run_batch("delete", names, zone, ["--delete-disks=all", "--quiet"])
+
+
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
 def gcloud_cluster_create(
     name: Annotated[str, typer.Argument(help="cluster name", envvar="CLUSTER")],
@@ -294,26 +679,460 @@ def gcloud_cluster_delete(
     run_shell_command(f"gcloud container clusters delete {name} --zone={zone}")
 
 
-@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
-def cloud_install_cibutler(
-    host: Annotated[str, typer.Argument(help="host", envvar="HOST")] = None,
-    target: Annotated[str, typer.Option(help="target")] = "microk8s",
+HOSTSMAN_ENTRIES = "osdu.localhost:127.0.0.1 osdu.local:127.0.0.1 airflow.localhost:127.0.0.1 airflow.local:127.0.0.1 minio.localhost:127.0.0.1 minio.local:127.0.0.1 keycloak.localhost:127.0.0.1 keycloak.local:127.0.0.1"
+PIPX_INSTALL_CIBUTLER = 'pipx install cibutler --index-url https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple --pip-args="--extra-index-url=https://community.opengroup.org/api/v4/projects/148/packages/pypi/simple"'
+
+# snap and pipx binaries are not on the PATH of a non-interactive ssh session
+REMOTE_PATH = "export PATH=$PATH:/snap/bin:/var/lib/snapd/snap/bin:$HOME/.local/bin"
+
+
+class Step:
+    """
+    One provisioning step: a shell command and an optional cheap check that
+    succeeds when the step is already satisfied (steps without a check always run).
+    new_session runs the step on a fresh connection, e.g. after a group change.
+    """
+
+    def __init__(
+        self, name: str, command: str, check: str = None, new_session: bool = False
+    ):
+        self.name = name
+        self.command = command
+        self.check = check
+        self.new_session = new_session
+
+
+def pipx_step(package: str, command: str):
+    return Step(
+        f"pipx {package}",
+        command,
+        check=f"pipx list --short 2>/dev/null | grep -q '^{package} '",
+    )
+
+
+HOSTSMAN_STEPS = [
+    Step("pipx ensurepath", "pipx ensurepath"),
+    pipx_step("hostsman", "pipx install hostsman"),
+    Step(
+        "hosts entries",
+        f"sudo .local/share/pipx/venvs/hostsman/bin/hostsman -i {HOSTSMAN_ENTRIES}",
+        check="grep -q osdu.localhost /etc/hosts && grep -q keycloak.local /etc/hosts",
+    ),
+    pipx_step("cibutler", PIPX_INSTALL_CIBUTLER),
+    Step("cibutler version", ".local/bin/cibutler --version"),
+]
+
+APT_BASE = Step(
+    "apt packages",
+    "sudo apt-get update && sudo apt install -y curl python3-pip pipx",
+    check="dpkg -s curl python3-pip pipx >/dev/null 2>&1",
+)
+SNAP_HELM = Step("helm", "sudo snap install helm --classic", check="command -v helm")
+SNAP_KUBECTL = Step(
+    "kubectl", "sudo snap install kubectl --classic", check="command -v kubectl"
+)
+
+RECIPES = {
+    "cibutler": [
+        Step("cibutler version", ".local/bin/cibutler --version"),
+        Step("cibutler check", ".local/bin/cibutler check --target {target}"),
+        Step("cibutler install", ".local/bin/cibutler install -k --force"),
+    ],
+    "ubuntu-minikube": [
+        Step(
+            "apt packages",
+            "sudo apt-get update && sudo apt install -y curl gnome-terminal docker.io python3-pip pipx",
+            check="dpkg -s curl gnome-terminal docker.io python3-pip pipx >/dev/null 2>&1",
+        ),
+        SNAP_HELM,
+        SNAP_KUBECTL,
+        Step(
+            "minikube",
+            "curl -LO https://github.com/kubernetes/minikube/releases/latest/download/minikube-linux-amd64"
+            " && sudo install minikube-linux-amd64 /usr/local/bin/minikube && rm minikube-linux-amd64",
+            check="command -v minikube",
+        ),
+        Step(
+            "docker group",
+            "sudo usermod -aG docker {user}",
+            check="id -nG {user} | grep -qw docker",
+        ),
+        *HOSTSMAN_STEPS,
+    ],
+    "ubuntu-k8s": [
+        APT_BASE,
+        Step("k8s", "sudo snap install k8s --classic", check="command -v k8s"),
+        SNAP_HELM,
+        *HOSTSMAN_STEPS,
+        Step(
+            "k8s bootstrap",
+            "sudo k8s bootstrap",
+            check="sudo k8s status >/dev/null 2>&1",
+        ),
+        Step("k8s status", "sudo k8s status"),
+    ],
+    "ubuntu-microk8s": [
+        APT_BASE,
+        Step(
+            "microk8s",
+            "sudo snap install microk8s --classic",
+            check="command -v microk8s",
+        ),
+        SNAP_HELM,
+        *HOSTSMAN_STEPS,
+        Step(
+            "microk8s group",
+            "sudo usermod -a -G microk8s {user}",
+            check="id -nG {user} | grep -qw microk8s",
+        ),
+        SNAP_KUBECTL,
+        Step("kube dir", "mkdir -p ~/.kube", check="test -d ~/.kube"),
+        Step("microk8s ready", "sudo microk8s status --wait-ready"),
+        Step(
+            "microk8s addons",
+            "sudo microk8s enable dns ingress storage",
+            check="for addon in dns ingress storage; do sudo microk8s status -a $addon | grep -q enabled || exit 1; done",
+        ),
+        # New session so the microk8s group membership applies
+        Step(
+            "kube config",
+            "cd ~/.kube && microk8s config > config",
+            check="test -s ~/.kube/config",
+            new_session=True,
+        ),
+    ],
+    "ubuntu-k3s": [
+        APT_BASE,
+        Step("k3s", "curl -sfL https://get.k3s.io | sh - ", check="command -v k3s"),
+        SNAP_HELM,
+        Step("k3s node", "sudo k3s kubectl get node"),
+        *HOSTSMAN_STEPS,
+        Step("kube dir", "mkdir -p ~/.kube", check="test -d ~/.kube"),
+        Step(
+            "kube config",
+            "sudo k3s kubectl config view --raw > $HOME/.kube/config && chmod 600 $HOME/.kube/config",
+            check="test -s ~/.kube/config",
+        ),
+        Step("kubectl node", "kubectl get node"),
+    ],
+    "rocky-microk8s": [
+        Step(
+            "dnf update",
+            "sudo dnf -y update && sudo dnf install epel-release -y",
+            check="rpm -q epel-release",
+        ),
+        Step("snapd", "sudo dnf install snapd -y", check="rpm -q snapd"),
+        Step(
+            "snap link", "sudo ln -s /var/lib/snapd/snap /snap", check="test -e /snap"
+        ),
+        Step(
+            "snap path",
+            "echo 'export PATH=$PATH:/var/lib/snapd/snap/bin' | sudo tee -a /etc/profile.d/snap.sh",
+            check="test -f /etc/profile.d/snap.sh",
+        ),
+        Step(
+            "snapd socket",
+            "sudo systemctl enable --now snapd.socket",
+            check="systemctl is-active snapd.socket",
+        ),
+        Step(
+            "selinux permissive",
+            "sudo setenforce 0 && sudo sed -i 's/^SELINUX=.*/SELINUX=permissive/g' /etc/selinux/config",
+            check="! getenforce | grep -q Enforcing && grep -q '^SELINUX=permissive' /etc/selinux/config",
+        ),
+        Step("curl", "sudo dnf install -y curl", check="command -v curl"),
+        Step(
+            "microk8s",
+            "sudo snap install microk8s --classic",
+            check="command -v microk8s",
+        ),
+        SNAP_HELM,
+        Step(
+            "python3.11",
+            "sudo dnf install python3.11 python3.11-pip -y && python3.11 -m pip install pipx",
+            check="command -v pipx",
+        ),
+        *HOSTSMAN_STEPS,
+        Step(
+            "microk8s addons",
+            "sudo microk8s enable dns storage",
+            check="for addon in dns storage; do sudo microk8s status -a $addon | grep -q enabled || exit 1; done",
+        ),
+        Step(
+            "microk8s group",
+            "sudo usermod -a -G microk8s {user}",
+            check="id -nG {user} | grep -qw microk8s",
+        ),
+        SNAP_KUBECTL,
+        Step("kube dir", "mkdir -p ~/.kube", check="test -d ~/.kube"),
+        Step(
+            "kube config",
+            "cd ~/.kube && microk8s config > config",
+            check="test -s ~/.kube/config",
+            new_session=True,
+        ),
+    ],
+}
+
+
+def check_steps(c, steps: list, variables: dict):
+    """
+    Run every step check in a single ssh command.
+    Returns the steps that still need to run.
+    """
+    script = [REMOTE_PATH]
+    for index, step in enumerate(steps):
+        if step.check:
+            check = step.check.format(**variables)
+            script.append(
+                f"if ( {check} ) >/dev/null 2>&1; then echo {index}:ok; else echo {index}:missing; fi"
+            )
+    result = c.run("\n".join(script), hide=True, warn=True)
+    satisfied = set()
+    for line in result.stdout.splitlines():
+        index, _, status = line.strip().partition(":")
+        if status == "ok":
+            satisfied.add(int(index))
+    return [step for index, step in enumerate(steps) if index not in satisfied]
+
+
+def apply_recipe(
+    c: Connection,
+    steps: list,
+    variables: dict,
+    force: bool = False,
+    reconnect=None,
+    **run_options,
 ):
     """
-    Run CI Butler install on remote linux host via ssh
+    Run the steps that are not already satisfied, batching consecutive steps
+    into one ssh command. A step with new_session starts a new batch on a new
+    connection from reconnect: sshd sets the user's groups when a connection
+    authenticates, so a new channel on the same transport would not see a
+    group added earlier in the recipe.
+    Returns the names of the steps that ran.
+    """
+    pending = list(steps) if force else check_steps(c, steps, variables)
+    skipped = len(steps) - len(pending)
+    logger.info(
+        f"Recipe: {len(pending)} steps to run, {skipped} already satisfied: {[step.name for step in pending]}"
+    )
+
+    batches = []
+    for step in pending:
+        if not batches or step.new_session:
+            batches.append([])
+        batches[-1].append(step)
+
+    for batch in batches:
+        if batch[0].new_session and reconnect:
+            c = reconnect()
+        script = ["set -e", REMOTE_PATH]
+        for step in batch:
+            script.append(f"echo '==> {step.name}'")
+            script.append(step.command.format(**variables))
+        c.run("\n".join(script), **run_options)
+    return [step.name for step in pending]
+
+
+def install_on_host(
+    host: str, recipe: str, hide: bool = False, force: bool = False, **options
+):
     """
-    remote_user = ssh(command="whoami", host=host)
+    Run a recipe on a single host, with a spinner and plain output
+    """
+    remote_user = ssh(command="whoami", host=host, hide=hide)
     start_time = time.time()
     with console.status(f"Installing on {host}..."):
-        with Connection(host) as c:
-            console.print(f"Running CIButler on {host} as user {remote_user}")
-            c.run(".local/bin/cibutler --version")
-            c.run(f".local/bin/cibutler check --target {target}")
-            c.run(".local/bin/cibutler install -k --force")
+        console.print(f"Installing on {host} as user {remote_user}")
+        with pool.session(host) as c:
+            ran = apply_recipe(
+                c,
+                RECIPES[recipe],
+                dict(options, user=remote_user),
+                force=force,
+                reconnect=lambda: pool.reconnect(host),
+            )
     elapsed_time = time.time() - start_time
     console.print(
-        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds"
+        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds ({len(ran)}/{len(RECIPES[recipe])} steps run)"
+    )
+
+
+class PrefixedStream:
+    """
+    File-like stream that prints each complete line prefixed with the host
+    """
+
+    def __init__(self, host: str, style: str = "cyan"):
+        self.prefix = f"[{style}]{host}[/{style}] | "
+        self.buffer = ""
+
+    def write(self, data: str):
+        self.buffer += data
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            console.print(self.prefix + escape(line), highlight=False)
+
+    def flush(self):
+        if self.buffer:
+            console.print(self.prefix + escape(self.buffer), highlight=False)
+            self.buffer = ""
+
+
+def fleet_host(
+    host: str, recipe: str, hide: bool = False, force: bool = False, **options
+):
+    """
+    Run a recipe on one host of a fleet and return its result
+    """
+    stream = PrefixedStream(host)
+    start_time = time.time()
+    result = {"host": host, "ok": False, "error": None, "ran": None}
+    try:
+        with pool.session(host) as c:
+            remote_user = c.run("whoami", hide=True).stdout.strip()
+            ran = apply_recipe(
+                c,
+                RECIPES[recipe],
+                dict(options, user=remote_user),
+                force=force,
+                reconnect=lambda: pool.reconnect(host),
+                out_stream=stream,
+                err_stream=stream,
+                hide=hide,
+            )
+        result["ran"] = len(ran)
+        result["ok"] = True
+    except Exception as err:
+        message = str(err).strip()
+        result["error"] = message.splitlines()[-1] if message else repr(err)
+        logger.error(f"Fleet install failed on {host}: {err}")
+    finally:
+        stream.flush()
+    result["elapsed"] = time.time() - start_time
+    return result
+
+
+def read_inventory(filename: str):
+    """
+    Hosts from an inventory file, one per line, # for comments
+    """
+    hosts = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                hosts.append(line.split()[0])
+    return hosts
+
+
+def run_fleet(
+    hosts: list,
+    recipe: str,
+    workers: int = 10,
+    hide: bool = False,
+    force: bool = False,
+    **options,
+):
+    """
+    Run a recipe on every host with a bounded pool, continuing past failures
+    """
+    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(hosts)))) as executor:
+        futures = [
+            executor.submit(fleet_host, host, recipe, hide=hide, force=force, **options)
+            for host in hosts
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            if result["ok"]:
+                console.print(
+                    f":white_check_mark: {result['host']} completed in {utils.convert_time(result['elapsed'])}"
+                )
+            else:
+                error_console.print(f":x: {result['host']} failed: {result['error']}")
+            results.append(result)
+    return sorted(results, key=lambda result: hosts.index(result["host"]))
+
+
+def display_fleet_results(results: list, elapsed: float):
+    table = Table(
+        box=rich.box.SIMPLE,
+        caption=f"{sum(r['ok'] for r in results)}/{len(results)} hosts succeeded in {utils.convert_time(elapsed)}",
+    )
+    table.add_column("Host", style="cyan")
+    table.add_column("Result")
+    table.add_column("Steps run", justify="right")
+    table.add_column("Time", justify="right")
+    table.add_column("Error")
+    for result in results:
+        table.add_row(
+            result["host"],
+            "[green]ok[/green]" if result["ok"] else "[red]failed[/red]",
+            "" if result["ran"] is None else str(result["ran"]),
+            utils.convert_time(result["elapsed"]),
+            result["error"] or "",
+        )
+    console.print(table)
+
+
+@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
+def cloud_fleet(
+    recipe: Annotated[str, typer.Argument(help=f"Recipe to run: {', '.join(RECIPES)}")],
+    hosts: Annotated[
+        str, typer.Option(help="Comma separated hosts", envvar="HOSTS")
+    ] = None,
+    inventory: Annotated[
+        str, typer.Option("--inventory", "-i", help="File with one host per line")
+    ] = None,
+    workers: Annotated[
+        int, typer.Option(help="Hosts provisioned at the same time")
+    ] = 10,
+    target: Annotated[str, typer.Option(help="target (cibutler recipe)")] = "microk8s",
+    hide: Annotated[bool, typer.Option(help="Hide output")] = False,
+    force: Annotated[
+        bool, typer.Option("--force", help="Run every step, skip the checks")
+    ] = False,
+):
+    """
+    Run an install recipe on many remote hosts at once via ssh
+
+    Output is prefixed with the host, failed hosts do not stop the others.
+    Steps already satisfied on a host are skipped.
+    """
+    if recipe not in RECIPES:
+        error_console.print(
+            f":x: Unknown recipe {recipe}, use one of {', '.join(RECIPES)}"
+        )
+        raise typer.Exit(1)
+    host_list = [host.strip() for host in (hosts or "").split(",") if host.strip()]
+    if inventory:
+        host_list += read_inventory(inventory)
+    if not host_list:
+        error_console.print(":x: No hosts, use --hosts or --inventory")
+        raise typer.Exit(1)
+
+    options = {"target": target} if recipe == "cibutler" else {}
+    logger.info(f"Fleet {recipe} on {len(host_list)} hosts: {host_list}")
+    start_time = time.time()
+    results = run_fleet(
+        host_list, recipe, workers=workers, hide=hide, force=force, **options
     )
+    display_fleet_results(results, time.time() - start_time)
+    if not all(result["ok"] for result in results):
+        raise typer.Exit(1)
+
+
+@diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
+def cloud_install_cibutler(
+    host: Annotated[str, typer.Argument(help="host", envvar="HOST")] = None,
+    target: Annotated[str, typer.Option(help="target")] = "microk8s",
+):
+    """
+    Run CI Butler install on remote linux host via ssh
+    """
+    install_on_host(host, "cibutler", target=target)
 
 
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
@@ -324,37 +1143,7 @@ def cloud_install_ubuntu_minikube(
     """
     Install on remote ubuntu linux host via SSH with minikube
     """
-    remote_user = ssh(command="whoami", host=host, hide=hide)
-    start_time = time.time()
-    with console.status(f"Installing on {host}..."):
-        with Connection(host) as c:
-            console.print(f"Installing on {host} as user {remote_user}")
-            c.run("sudo apt-get update")
-            c.run("sudo apt install -y curl gnome-terminal docker.io python3-pip pipx")
-            c.run("sudo snap install helm --classic")
-            c.run("sudo snap install kubectl --classic")
-            c.run(
-                "curl -LO https://github.com/kubernetes/minikube/releases/latest/download/minikube-linux-amd64"
-            )
-            c.run(
-                "sudo install minikube-linux-amd64 /usr/local/bin/minikube && rm minikube-linux-amd64"
-            )
-            c.run(f"sudo usermod -aG docker {remote_user}")
-            # c.run("sudo newgrp docker")
-            c.run("pipx ensurepath")
-            c.run("pipx install hostsman")
-            c.run(
-                "sudo .local/share/pipx/venvs/hostsman/bin/hostsman -i osdu.localhost:127.0.0.1 osdu.local:127.0.0.1 airflow.localhost:127.0.0.1 airflow.local:127.0.0.1 minio.localhost:127.0.0.1 minio.local:127.0.0.1 keycloak.localhost:127.0.0.1 keycloak.local:127.0.0.1"
-            )
-            c.run(
-                'pipx install cibutler --index-url https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple --pip-args="--extra-index-url=https://community.opengroup.org/api/v4/projects/148/packages/pypi/simple"'
-            )
-            c.run(".local/bin/cibutler --version")
-
-    elapsed_time = time.time() - start_time
-    console.print(
-        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds"
-    )
+    install_on_host(host, "ubuntu-minikube", hide=hide)
 
 
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
@@ -365,31 +1154,7 @@ def cloud_install_ubuntu_k8s(
     """
     Install on remote ubuntu linux host via SSH with k8s
     """
-    remote_user = ssh(command="whoami", host=host, hide=hide)
-    start_time = time.time()
-    with console.status(f"Installing on {host}..."):
-        with Connection(host) as c:
-            console.print(f"Installing on {host} as user {remote_user}")
-            c.run("sudo apt-get update")
-            c.run("sudo apt install -y curl python3-pip pipx")
-            c.run("sudo snap install k8s --classic")
-            c.run("sudo snap install helm --classic")
-            c.run("pipx ensurepath")
-            c.run("pipx install hostsman")
-            c.run(
-                "sudo .local/share/pipx/venvs/hostsman/bin/hostsman -i osdu.localhost:127.0.0.1 osdu.local:127.0.0.1 airflow.localhost:127.0.0.1 airflow.local:127.0.0.1 minio.localhost:127.0.0.1 minio.local:127.0.0.1 keycloak.localhost:127.0.0.1 keycloak.local:127.0.0.1"
-            )
-            c.run(
-                'pipx install cibutler --index-url https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple --pip-args="--extra-index-url=https://community.opengroup.org/api/v4/projects/148/packages/pypi/simple"'
-            )
-            c.run(".local/bin/cibutler --version")
-            c.run("sudo k8s bootstrap")
-            c.run("sudo k8s status")
-
-    elapsed_time = time.time() - start_time
-    console.print(
-        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds"
-    )
+    install_on_host(host, "ubuntu-k8s", hide=hide)
 
 
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
@@ -400,45 +1165,7 @@ def cloud_install_ubuntu_microk8s(
     """
     Install on remote ubuntu linux host via SSH with MicroK8s
     """
-    remote_user = ssh(command="whoami", host=host, hide=hide)
-    start_time = time.time()
-    with console.status(f"Installing on {host}..."):
-        with Connection(host) as c:
-            console.print(f"Installing on {host} as user {remote_user}")
-            c.run("sudo apt-get update")
-            c.run("sudo apt install -y curl python3-pip pipx")
-            c.run("sudo snap install microk8s --classic")
-            c.run("sudo snap install helm --classic")
-            c.run("pipx ensurepath")
-            c.run("pipx install hostsman")
-            c.run(
-                "sudo .local/share/pipx/venvs/hostsman/bin/hostsman -i osdu.localhost:127.0.0.1 osdu.local:127.0.0.1 airflow.localhost:127.0.0.1 airflow.local:127.0.0.1 minio.localhost:127.0.0.1 minio.local:127.0.0.1 keycloak.localhost:127.0.0.1 keycloak.local:127.0.0.1"
-            )
-            c.run(
-                'pipx install cibutler --index-url https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple --pip-args="--extra-index-url=https://community.opengroup.org/api/v4/projects/148/packages/pypi/simple"'
-            )
-            c.run(".local/bin/cibutler --version")
-            c.run("sudo microk8s enable dns")
-            c.run("sudo microk8s enable storage")
-            c.run(f"sudo usermod -a -G microk8s {remote_user}")
-            c.run("sudo snap install kubectl --classic")
-            c.run("mkdir -p ~/.kube")
-            c.run("sudo microk8s status --wait-ready")
-            c.run("sudo microk8s enable dns ingress storage")
-        with Connection(host) as c:
-            c.run("cd ~/.kube && microk8s config > config")
-        # with Connection(host) as c:
-        # /data
-        # c.run("sudo microk8s kubectl get -o yaml -n kube-system deploy hostpath-provisioner | \
-    # sed 's~/var/snap/microk8s/common/default-storage~/data/snap/microk8s/common/default-storage~g' | \
-    # sudo microk8s kubectl apply -f -")
-
-    # c.run("sudo ufw allow in on cni0 && sudo ufw allow out on cni0")
-    # c.run("sudo ufw default allow routed")
-    elapsed_time = time.time() - start_time
-    console.print(
-        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds"
-    )
+    install_on_host(host, "ubuntu-microk8s", hide=hide)
 
 
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
@@ -449,36 +1176,7 @@ def cloud_install_ubuntu_k3s(
     """
     Install on remote ubuntu linux host via SSH with K3s
     """
-    remote_user = ssh(command="whoami", host=host, hide=hide)
-    start_time = time.time()
-    with console.status(f"Installing on {host}..."):
-        with Connection(host) as c:
-            console.print(f"Installing on {host} as user {remote_user}")
-            c.run("sudo apt-get update")
-            c.run("sudo apt install -y curl python3-pip pipx")
-            c.run("curl -sfL https://get.k3s.io | sh - ")
-            c.run("sudo snap install helm --classic")
-            c.run("sudo k3s kubectl get node")
-            c.run("pipx ensurepath")
-            c.run("pipx install hostsman")
-            c.run(
-                "sudo .local/share/pipx/venvs/hostsman/bin/hostsman -i osdu.localhost:127.0.0.1 osdu.local:127.0.0.1 airflow.localhost:127.0.0.1 airflow.local:127.0.0.1 minio.localhost:127.0.0.1 minio.local:127.0.0.1 keycloak.localhost:127.0.0.1 keycloak.local:127.0.0.1"
-            )
-            c.run(
-                'pipx install cibutler --index-url https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple --pip-args="--extra-index-url=https://community.opengroup.org/api/v4/projects/148/packages/pypi/simple"'
-            )
-            c.run(".local/bin/cibutler --version")
-            c.run("mkdir -p ~/.kube")
-            c.run("sudo k3s kubectl config view --raw > $HOME/.kube/config")
-            c.run("chown 600 $HOME/.kube/config")
-            c.run("kubectl get node")
-
-    # c.run("sudo ufw allow in on cni0 && sudo ufw allow out on cni0")
-    # c.run("sudo ufw default allow routed")
-    elapsed_time = time.time() - start_time
-    console.print(
-        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds"
-    )
+    install_on_host(host, "ubuntu-k3s", hide=hide)
 
 
 @diag_cli.command(rich_help_panel="Cloud Diagnostic Commands")
@@ -489,54 +1187,7 @@ def cloud_install_rocky_microk8s(
     """
     Install on remote Rocky linux host via SSH with MicroK8s
     """
-    remote_user = ssh(command="whoami", host=host, hide=hide)
-    start_time = time.time()
-    with console.status(f"Installing on {host}..."):
-        with Connection(host) as c:
-            console.print(f"Installing on {host} as user {remote_user}")
-            c.run("sudo dnf -y update")
-            c.run("sudo dnf install epel-release -y")
-            c.run("sudo dnf install snapd -y")
-            c.run("sudo ln -s /var/lib/snapd/snap /snap")
-            c.run(
-                "echo 'export PATH=$PATH:/var/lib/snapd/snap/bin' | sudo tee -a /etc/profile.d/snap.sh"
-            )
-            c.run("source /etc/profile.d/snap.sh")
-            c.run("sudo systemctl enable --now snapd.socket")
-            c.run("systemctl status snapd.socket")
-            c.run("sudo setenforce 0")
-            c.run(
-                "sudo sed -i 's/^SELINUX=.*/SELINUX=permissive/g' /etc/selinux/config"
-            )
-            c.run("sudo apt install -y curl python3-pip pipx")
-            c.run("sudo snap install microk8s --classic")
-            c.run("sudo snap install helm --classic")
-            c.run("sudo dnf install python3.11")
-            c.run("sudo dnf install python3.11-pip -y")
-            c.run("python3.11 -m pip install pipx")
-            c.run("pipx ensurepath")
-            c.run("pipx install hostsman")
-            c.run(
-                "sudo .local/share/pipx/venvs/hostsman/bin/hostsman -i osdu.localhost:127.0.0.1 osdu.local:127.0.0.1 airflow.localhost:127.0.0.1 airflow.local:127.0.0.1 minio.localhost:127.0.0.1 minio.local:127.0.0.1 keycloak.localhost:127.0.0.1 keycloak.local:127.0.0.1"
-            )
-            c.run(
-                'pipx install cibutler --index-url https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple --pip-args="--extra-index-url=https://community.opengroup.org/api/v4/projects/148/packages/pypi/simple"'
-            )
-            c.run(".local/bin/cibutler --version")
-            c.run("sudo microk8s enable dns")
-            c.run("sudo microk8s enable storage")
-            c.run(f"sudo usermod -a -G microk8s {remote_user}")
-            c.run("sudo snap install kubectl --classic")
-            c.run("mkdir -p ~/.kube")
-        with Connection(host) as c:
-            c.run("cd ~/.kube && microk8s config > config")
-
-    # c.run("sudo ufw allow in on cni0 && sudo ufw allow out on cni0")
-    # c.run("sudo ufw default allow routed")
-    elapsed_time = time.time() - start_time
-    console.print(
-        f":white_check_mark: Installation completed on {host} in {elapsed_time:.2f} seconds"
-    )
+    install_on_host(host, "rocky-microk8s", hide=hide)
 
 
 if __name__ == "__main__":
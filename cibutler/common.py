@@ -4,6 +4,10 @@ from dotenv import load_dotenv
 import os
 
 HOME = str(Path.home())
+# Version index, cluster state and other small files that are safe to delete
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(HOME, ".cache")), "cibutler"
+)
 
 # loading variables from .env file
 load_dotenv(Path.home().joinpath(".env.cibutler"))
@@ -12,6 +16,11 @@ LOGLEVEL = os.environ.get("LOGLEVEL", "INFO").upper()
 if LOGLEVEL not in ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]:
     LOGLEVEL = "INFO"
 
+# text (default) or json - one JSON object per line in the log file
+LOGFORMAT = os.environ.get("LOGFORMAT", "text").lower()
+if LOGFORMAT not in ["text", "json"]:
+    LOGFORMAT = "text"
+
 DEBUG = False
 if "DEBUG" in LOGLEVEL:
     # Log level set to DEBUG, this will produce a lot of output, use with caution
@@ -89,4 +89,6 @@ osdu_end_points = {
 }
 
 total_heap_required = 26
+# With install --low-memory, enough for a core profile
+low_memory_heap_required = 14
 logfile = "cibutler.log"
@@ -62,6 +62,93 @@ SERVICE_FLAG_MAP = {
     "Secret": ["core-plus-secret-deploy.enabled"],
 }
 
+# What each service needs running to be useful, infra included. Selecting a
+# service (or a profile) pulls in everything it depends on.
+SERVICE_DEPENDENCIES = {
+    "Airflow": ["PostgreSQL", "Common-Infra"],
+    "Elastic": ["Common-Infra"],
+    "Keycloak": ["PostgreSQL", "Common-Infra"],
+    "Minio": ["Common-Infra"],
+    "PostgreSQL": ["Common-Infra"],
+    "Common-Infra": [],
+    "RabbitMQ-Bootstrap": ["Common-Infra"],
+    "Partition": ["PostgreSQL", "Keycloak"],
+    "Entitlements": ["Partition", "Keycloak", "PostgreSQL"],
+    "Legal": ["Entitlements", "Partition", "RabbitMQ-Bootstrap"],
+    "Schema": ["Entitlements", "Partition", "Minio"],
+    "Storage": ["Entitlements", "Legal", "Partition", "Schema", "Minio"],
+    "Indexer": ["Storage", "Schema", "Entitlements", "Partition", "Elastic"],
+    "Search": ["Indexer", "Entitlements", "Partition", "Elastic"],
+    "Policy": ["Entitlements", "Partition", "Legal"],
+    "Register": ["Entitlements", "Partition", "PostgreSQL"],
+    "Notification": ["Register", "Entitlements", "Partition", "RabbitMQ-Bootstrap"],
+    "File": ["Storage", "Legal", "Entitlements", "Partition", "Minio"],
+    "Dataset": ["Storage", "File", "Schema", "Entitlements", "Partition"],
+    "Workflow": ["Airflow", "Entitlements", "Partition", "PostgreSQL"],
+    "Unit": ["Entitlements", "Partition"],
+    "Crs-catalog": ["Entitlements", "Partition"],
+    "Crs-conversion": ["Crs-catalog", "Entitlements", "Partition"],
+    "Wellbore": ["Storage", "Search", "Dataset", "Entitlements", "Partition"],
+    "Wellbore-Worker": ["Wellbore"],
+    "Secret": ["Entitlements", "Partition"],
+}
+
+# Named deployment profiles, expanded with SERVICE_DEPENDENCIES
+DEPLOYMENT_PROFILES = {
+    "full": list(SERVICE_FLAG_MAP.keys()),
+    "dev-core": ["Entitlements", "Legal", "Schema", "Storage"],
+    "minimal-search": ["Search"],
+    "ingest": ["Workflow", "File", "Dataset", "Search", "Notification"],
+}
+
+
+def resolve_services(services: list):
+    """
+    Services plus everything they depend on, in SERVICE_FLAG_MAP order
+    """
+    resolved = set()
+    pending = list(services)
+    while pending:
+        service = pending.pop()
+        if service in resolved:
+            continue
+        resolved.add(service)
+        pending.extend(SERVICE_DEPENDENCIES.get(service, []))
+    return [service for service in SERVICE_FLAG_MAP if service in resolved]
+
+
+def service_depths():
+    """
+    Longest dependency chain below each service, infra with no dependencies is 0
+    """
+    depths = {}
+
+    def depth(service):
+        if service not in depths:
+            depths[service] = 1 + max(
+                (depth(dep) for dep in SERVICE_DEPENDENCIES.get(service, [])),
+                default=-1,
+            )
+        return depths[service]
+
+    for service in SERVICE_DEPENDENCIES:
+        depth(service)
+    return depths
+
+
+def profile_services(profile: str):
+    if profile not in DEPLOYMENT_PROFILES:
+        raise typer.BadParameter(
+            f"Unknown profile {profile}, choose from {', '.join(DEPLOYMENT_PROFILES)}"
+        )
+    return resolve_services(DEPLOYMENT_PROFILES[profile])
+
+
+def deployment_profile_callback(value: str):
+    if value:
+        profile_services(value)
+    return value
+
 
 console = Console()
 error_console = Console(stderr=True, style="bold red")
@@ -155,9 +242,27 @@ def config(
         ),
     ]
     answers = inquirer.prompt(questions)
+    if answers:
+        selected = answers["osdu_services"]
+        answers["osdu_services"] = resolve_services(selected)
+        added = [s for s in answers["osdu_services"] if s not in selected]
+        if added:
+            console.print(f":link: Also enabling required services: {', '.join(added)}")
     return answers
 
 
+@diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
+def profiles():
+    """
+    List deployment profiles and the services each one installs
+    """
+    for name, services in DEPLOYMENT_PROFILES.items():
+        resolved = resolve_services(services)
+        console.print(
+            f"[bold]{name}[/bold] ({len(resolved)}/{len(SERVICE_FLAG_MAP)}): {', '.join(resolved)}"
+        )
+
+
 def prompt(ask, password=True, default=None, length=8):
     while True:
         value = Prompt.ask(ask, default=default, password=password)
@@ -182,7 +287,11 @@ def configure(
     if os.path.isfile(filename):
         console.print(f"{filename} exists")
     else:
-        downloader.download([url], "./")
+        try:
+            downloader.download([url], "./")
+        except downloader.DownloadError as err:
+            error_console.print(f":x: Unable to download {filename}: {err}")
+            raise typer.Exit(1)
     data = custom_values(filename=filename)
     if not data:
         error_console.print(f"Unable to read {filename}")
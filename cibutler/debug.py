@@ -9,6 +9,7 @@ from typing_extensions import Annotated
 from zipfile import ZipFile
 import cibutler.cik8s as cik8s
 import cibutler.cihelm as cihelm
+import cibutler.tunnel as tunnel
 
 logger = logging.getLogger(__name__)
 
@@ -89,13 +90,13 @@ def inspect(
             ":x: No current context set. Please run `cibutler use-context` to set the current context."
         )
         return
-    elif "minikube" in context:
+    elif "minikube" in context and not tunnel.tunnel_up():
         console.print(
-            ":warning: Minikube detected. Please make sure you have tunnel running.",
+            ":warning: Minikube detected and OSDU is not reachable. Please make sure you have tunnel running.",
             style="yellow",
         )
         if not force:
-            typer.confirm("Confirm tunnel is running?", abort=True)
+            typer.confirm("Continue without the tunnel?", abort=True)
 
     cik8s.log_kube_stats()
 
@@ -1,15 +1,23 @@
 """
-A rudimentary URL downloader (like wget or curl) to demonstrate Rich progress bars.
+URL downloader (like wget or curl) with Rich progress bars.
+
+Downloads go to a .part file that is resumed with HTTP Range requests,
+large files can be fetched in parallel segments, and an optional sha256
+is verified before the file is moved into place.
 """
 
-import os.path
+import os
 import sys
-from concurrent.futures import ThreadPoolExecutor
-import signal
-from functools import partial
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from threading import Event
 from typing import Iterable
-from urllib.request import urlopen
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from rich.progress import (
     BarColumn,
@@ -21,6 +29,16 @@ from rich.progress import (
     TransferSpeedColumn,
 )
 
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Files at least this large are split into segments when the server allows it
+SEGMENT_THRESHOLD = 32 * 1024 * 1024
+SEGMENTS = 4
+# Attempts to resume a body that broke off mid-stream
+STREAM_ATTEMPTS = 3
+TIMEOUT = (10, 60)
+
 progress = Progress(
     TextColumn("[bold blue]{task.fields[filename]}", justify="right"),
     BarColumn(bar_width=None),
@@ -33,43 +51,255 @@ progress = Progress(
     TimeRemainingColumn(),
 )
 
-
 done_event = Event()
 
+_session = None
+_session_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    pass
+
+
+def session() -> requests.Session:
+    """
+    Shared session, so downloads reuse pooled connections and retry
+    connection errors and 429/5xx responses with backoff
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504],
+                allowed_methods=["HEAD", "GET"],
+            )
+            adapter = HTTPAdapter(
+                max_retries=retry, pool_connections=4, pool_maxsize=16
+            )
+            _session = requests.Session()
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def probe(url: str):
+    """
+    Return (size, accepts_ranges) from a HEAD request, size is None when
+    the server does not send a Content-Length
+    """
+    try:
+        response = session().head(url, allow_redirects=True, timeout=TIMEOUT)
+    except requests.RequestException as err:
+        logger.debug("HEAD %s failed: %s", url, err)
+        return None, False
+    if not response.ok:
+        return None, False
+    size = response.headers.get("Content-Length")
+    size = int(size) if size and size.isdigit() else None
+    # Compressed responses report the encoded length, not the file size
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        size = None
+    accepts_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+    return size, accepts_ranges
 
-def handle_sigint(signum, frame):
-    done_event.set()
 
+def sha256sum(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(data)
+    return digest.hexdigest()
 
-signal.signal(signal.SIGINT, handle_sigint)
 
+def _check_cancelled():
+    if done_event.is_set():
+        raise DownloadError("Download cancelled")
 
-def copy_url(task_id: TaskID, url: str, path: str) -> None:
+
+def _stream(task_id: TaskID, url: str, part: str, size: int = None):
+    """
+    Download url into part, resuming from whatever part already holds
+    """
+    for attempt in range(1, STREAM_ATTEMPTS + 1):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        if size is not None and offset == size:
+            return
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        try:
+            with session().get(
+                url, headers=headers, stream=True, timeout=TIMEOUT
+            ) as response:
+                if response.status_code == 416:
+                    # Range not satisfiable: the part file is complete only if
+                    # it is exactly the expected size, otherwise it is stale
+                    if size is not None and offset == size:
+                        logger.info("%s already complete at %s bytes", part, offset)
+                        return
+                    logger.info("%s does not match %s, restarting", part, url)
+                    os.remove(part)
+                    continue
+                response.raise_for_status()
+                if offset and response.status_code != 206:
+                    logger.info("Server ignored Range for %s, restarting", url)
+                    offset = 0
+                if size is None:
+                    length = response.headers.get("Content-Length")
+                    if (
+                        length
+                        and length.isdigit()
+                        and "Content-Encoding" not in response.headers
+                    ):
+                        size = offset + int(length)
+                progress.update(task_id, total=size, completed=offset)
+                progress.start_task(task_id)
+                with open(part, "ab" if offset else "wb") as dest_file:
+                    for data in response.iter_content(CHUNK_SIZE):
+                        _check_cancelled()
+                        dest_file.write(data)
+                        progress.update(task_id, advance=len(data))
+            return
+        except (
+            requests.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+        ) as err:
+            if attempt == STREAM_ATTEMPTS:
+                raise DownloadError(f"{url}: {err}") from err
+            logger.warning("Download of %s interrupted (%s), resuming", url, err)
+        except requests.HTTPError as err:
+            raise DownloadError(f"{url}: {err}") from err
+    raise DownloadError(f"{url}: no attempts left to restart {part}")
+
+
+def _fetch_segment(task_id: TaskID, url: str, part: str, start: int, end: int):
+    """
+    Download bytes start..end (inclusive) into their place in part
+    """
+    headers = {"Range": f"bytes={start}-{end}"}
+    with session().get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+        if response.status_code != 206:
+            raise DownloadError(
+                f"{url}: expected 206 for segment {start}-{end}, got {response.status_code}"
+            )
+        with open(part, "r+b") as dest_file:
+            dest_file.seek(start)
+            for data in response.iter_content(CHUNK_SIZE):
+                _check_cancelled()
+                dest_file.write(data)
+                progress.update(task_id, advance=len(data))
+
+
+def _segmented(task_id: TaskID, url: str, part: str, size: int, segments: int):
+    """
+    Download url in parallel byte ranges into a preallocated part file.
+
+    Segments do not record their own progress and the part file is
+    preallocated, so it is removed when the download fails or is cancelled
+    and a later download restarts from the beginning.
+    """
+    with open(part, "wb") as dest_file:
+        dest_file.truncate(size)
+    progress.update(task_id, total=size, completed=0)
+    progress.start_task(task_id)
+    step = -(-size // segments)
+    ranges = [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [
+            pool.submit(_fetch_segment, task_id, url, part, start, end)
+            for start, end in ranges
+        ]
+        for future in as_completed(futures):
+            future.result()
+
+
+def copy_url(
+    task_id: TaskID,
+    url: str,
+    path: str,
+    sha256: str = None,
+    segments: int = SEGMENTS,
+) -> str:
     """Copy data from a url to a local file."""
     progress.console.log(f"Requesting {url}")
-    response = urlopen(url)
-    # This will break if the response doesn't contain content length
-    progress.update(task_id, total=int(response.info()["Content-length"]))
-    with open(path, "wb") as dest_file:
-        progress.start_task(task_id)
-        for data in iter(partial(response.read, 32768), b""):
-            dest_file.write(data)
-            progress.update(task_id, advance=len(data))
-            if done_event.is_set():
-                return
+    part = path + ".part"
+    size, accepts_ranges = probe(url)
+    has_partial = os.path.exists(part) and os.path.getsize(part)
+    if (
+        segments > 1
+        and accepts_ranges
+        and size is not None
+        and size >= SEGMENT_THRESHOLD
+        and not has_partial
+    ):
+        logger.info("Downloading %s in %s segments (%s bytes)", url, segments, size)
+        try:
+            _segmented(task_id, url, part, size, segments)
+        except BaseException as err:
+            # A preallocated part file would otherwise be resumed as if its
+            # zero padding had been downloaded
+            if os.path.exists(part):
+                os.remove(part)
+            if isinstance(err, requests.RequestException):
+                raise DownloadError(f"{url}: {err}") from err
+            raise
+    else:
+        _stream(task_id, url, part, size)
+
+    if sha256:
+        actual = sha256sum(part)
+        if actual.lower() != sha256.lower():
+            os.remove(part)
+            raise DownloadError(
+                f"{url}: checksum mismatch, expected sha256 {sha256} got {actual}"
+            )
+    os.replace(part, path)
     progress.console.log(f"Downloaded {path}")
+    return path
 
 
-def download(urls: Iterable[str], dest_dir: str):
-    """Download multiple files to the given directory."""
+def download(
+    urls: Iterable[str],
+    dest_dir: str,
+    checksums: dict = None,
+    segments: int = SEGMENTS,
+    max_workers: int = 4,
+) -> list:
+    """
+    Download multiple files to the given directory.
 
+    checksums maps url to an expected sha256. Returns the downloaded paths,
+    raises DownloadError naming every url that failed.
+    """
+    checksums = checksums or {}
+    done_event.clear()
+    paths = []
+    errors = []
     with progress:
-        with ThreadPoolExecutor(max_workers=4) as pool:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = {}
             for url in urls:
-                filename = url.split("/")[-1]
+                filename = url.split("/")[-1].split("?")[0] or "index.html"
                 dest_path = os.path.join(dest_dir, filename)
                 task_id = progress.add_task("download", filename=filename, start=False)
-                pool.submit(copy_url, task_id, url, dest_path)
+                future = pool.submit(
+                    copy_url, task_id, url, dest_path, checksums.get(url), segments
+                )
+                futures[future] = url
+            try:
+                for future in as_completed(futures):
+                    try:
+                        paths.append(future.result())
+                    except (DownloadError, requests.RequestException, OSError) as err:
+                        logger.error("Download failed %s: %s", futures[future], err)
+                        errors.append(str(err))
+            except KeyboardInterrupt:
+                # Let the workers stop at their next chunk, keeping .part files
+                done_event.set()
+                raise
+    if errors:
+        raise DownloadError("; ".join(errors))
+    return paths
 
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+import typer
+import os
+import json
+import time
+import base64
+import logging
+from collections import Counter
+from typing_extensions import Annotated
+from kubernetes import client, config
+import cibutler.cik8s as cik8s
+import cibutler.shell as shell
+from cibutler.common import CACHE_DIR, console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+# Elasticsearch from the CImpl chart (bitnami, security and TLS enabled)
+ES_POD_SELECTOR = "app.kubernetes.io/name=elasticsearch"
+ES_SECRET = "elasticsearch"
+ES_PASSWORD_KEY = "elasticsearch-password"
+ES_USER = "elastic"
+ES_URL = "https://localhost:9200"
+
+INDEXER_DEPLOYMENT = "indexer"
+
+BULK_TEMPLATE = "cibutler-bulk-load"
+# Legacy templates merge with the indexer's own mappings, so indices created
+# during the load pick up these settings too
+BULK_SETTINGS = {"index.refresh_interval": "-1", "index.number_of_replicas": "0"}
+# What bulk load mode changed, kept until it is restored so bulk-load-reset
+# can put it back after an interrupted load
+BULK_STATE_FILE = os.path.join(CACHE_DIR, "elastic-bulk-load.json")
+
+# The indexer works through its queue after the load job is done. It has
+# drained once no documents were indexed for DRAIN_QUIET seconds.
+DRAIN_QUIET = 30
+DRAIN_POLL = 5
+DRAIN_TIMEOUT = 900
+
+
+class ElasticError(Exception):
+    pass
+
+
+def es_pod(namespace: str = "default"):
+    config.load_kube_config()
+    pods = client.CoreV1Api().list_namespaced_pod(
+        namespace, label_selector=ES_POD_SELECTOR
+    )
+    for pod in pods.items:
+        if pod.status.phase == "Running":
+            return pod.metadata.name
+    raise ElasticError(f"No running elasticsearch pod in {namespace}")
+
+
+def es_password(namespace: str = "default"):
+    config.load_kube_config()
+    secret = client.CoreV1Api().read_namespaced_secret(ES_SECRET, namespace)
+    return base64.b64decode(secret.data[ES_PASSWORD_KEY]).decode("utf-8")
+
+
+class Elastic:
+    """
+    Talk to Elasticsearch with curl inside its own pod, so no port-forward or
+    ingress is needed. Credentials and bodies go through curl's stdin config,
+    not the command line.
+    """
+
+    def __init__(self, namespace: str = "default"):
+        self.namespace = namespace
+        self.pod = es_pod(namespace)
+        self.password = es_password(namespace)
+
+    def request(self, method: str, path: str, body: dict = None):
+        curl_config = [
+            f'url = "{ES_URL}{path}"',
+            f'request = "{method}"',
+            f'user = "{ES_USER}:{self.password}"',
+            'header = "Content-Type: application/json"',
+        ]
+        if body is not None:
+            curl_config.append(f"data = {json.dumps(json.dumps(body))}")
+        output = shell.run(
+            ["kubectl", "exec", "-i", self.pod, "-n", self.namespace, "--"]
+            + ["curl", "-sSk", "-K", "-"],
+            timeout=shell.QUERY_TIMEOUT,
+            input="\n".join(curl_config),
+        )  # nosec
+        if not output.ok:
+            raise ElasticError(f"{method} {path}: {output.stderr.strip()}")
+        try:
+            data = json.loads(output.stdout)
+        except ValueError:
+            raise ElasticError(f"{method} {path}: {output.stdout.strip()[:200]}")
+        if isinstance(data, dict) and "error" in data:
+            raise ElasticError(f"{method} {path}: {data['error']}")
+        return data
+
+    def doc_count(self):
+        stats = self.request("GET", "/_all/_stats/docs")
+        return int(stats["_all"]["primaries"]["docs"]["count"])
+
+    def index_total(self):
+        """
+        Index operations on primaries since the shards started, unlike
+        doc_count it also counts updates of existing documents
+        """
+        stats = self.request("GET", "/_all/_stats/indexing")
+        return int(stats["_all"]["primaries"]["indexing"]["index_total"])
+
+    def index_settings(self):
+        """
+        refresh_interval and number_of_replicas of every index
+        """
+        data = self.request(
+            "GET",
+            "/_all/_settings/index.refresh_interval,index.number_of_replicas?flat_settings=true",
+        )
+        return {index: value["settings"] for index, value in data.items()}
+
+
+def restore_settings(es: Elastic, original_settings: dict):
+    """
+    Put back the original settings; new indices get the most common
+    original replica count and the default refresh interval
+    """
+    replicas = Counter(
+        settings.get("index.number_of_replicas", "1")
+        for settings in original_settings.values()
+    ).most_common(1)
+    default_replicas = replicas[0][0] if replicas else "1"
+    es.request("DELETE", f"/_template/{BULK_TEMPLATE}")
+    # One request per distinct setting rather than per index
+    groups = {}
+    for index in es.index_settings():
+        original = original_settings.get(index, {})
+        key = (
+            original.get("index.refresh_interval"),
+            original.get("index.number_of_replicas", default_replicas),
+        )
+        groups.setdefault(key, []).append(index)
+    for (refresh_interval, number_of_replicas), indices in groups.items():
+        for start in range(0, len(indices), 50):
+            es.request(
+                "PUT",
+                f"/{','.join(indices[start : start + 50])}/_settings",
+                {
+                    "index.refresh_interval": refresh_interval,
+                    "index.number_of_replicas": number_of_replicas,
+                },
+            )
+    es.request("POST", "/_refresh")
+
+
+def read_bulk_state():
+    try:
+        with open(BULK_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class BulkLoadMode:
+    """
+    Context manager for a bulk data load: stop refreshes and replicas and add
+    indexer replicas on entry, always restore them and refresh on exit. After
+    a successful load it first waits for the indexer to drain its queue.
+
+    When Elasticsearch can not be reached the load goes ahead unchanged.
+    """
+
+    def __init__(self, namespace: str = "default", indexer_replicas: int = 2):
+        self.namespace = namespace
+        self.indexer_replicas = indexer_replicas
+        self.es = None
+        self.original_settings = {}
+        self.original_indexer = None
+        self.start_indexed = 0
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.time()
+        try:
+            self.es = Elastic(self.namespace)
+            self.original_settings = self.es.index_settings()
+            self.start_indexed = self.es.index_total()
+            self.es.request(
+                "PUT",
+                f"/_template/{BULK_TEMPLATE}",
+                {"index_patterns": ["*"], "order": 100, "settings": BULK_SETTINGS},
+            )
+            self.es.request("PUT", "/_all/_settings", BULK_SETTINGS)
+            console.log(
+                ":racing_car: Bulk load mode: refresh and replicas off while loading"
+            )
+            logger.info(f"Bulk load mode on for {len(self.original_settings)} indices")
+        except Exception as err:
+            logger.warning(f"Bulk load mode not enabled: {err}")
+            console.log(f"[yellow]:warning: Bulk load mode not enabled: {err}[/yellow]")
+            self.es = None
+        self._scale_indexer()
+        self._save_state()
+        return self
+
+    def _save_state(self):
+        if not self.es and self.original_indexer is None:
+            return
+        os.makedirs(os.path.dirname(BULK_STATE_FILE), exist_ok=True)
+        with open(BULK_STATE_FILE, "w") as f:
+            json.dump(
+                {
+                    "namespace": self.namespace,
+                    "settings": self.original_settings if self.es else None,
+                    "indexer_replicas": self.original_indexer,
+                },
+                f,
+            )
+
+    def _scale_indexer(self):
+        try:
+            status = cik8s.get_deployment_status(INDEXER_DEPLOYMENT, self.namespace)
+            replicas = (status or {}).get("replicas", 1)
+            if replicas < self.indexer_replicas:
+                cik8s.scale_workload(
+                    "Deployment",
+                    INDEXER_DEPLOYMENT,
+                    self.indexer_replicas,
+                    self.namespace,
+                )
+                self.original_indexer = replicas
+        except Exception as err:
+            logger.warning(f"Unable to scale {INDEXER_DEPLOYMENT}: {err}")
+
+    def indexed(self):
+        """
+        Documents indexed since entry, None when Elasticsearch is unreachable
+        """
+        if not self.es:
+            return None
+        try:
+            return self.es.index_total() - self.start_indexed
+        except (ElasticError, KeyError):
+            return None
+
+    def docs_per_second(self):
+        indexed = self.indexed()
+        if indexed is None:
+            return None
+        return indexed / max(time.time() - self.start_time, 1)
+
+    def wait_for_indexer(self):
+        """
+        Wait until the indexer has drained its queue, so the settings are not
+        restored and the indexer not scaled back while it is still working
+        """
+        deadline = time.time() + DRAIN_TIMEOUT
+        last = self.indexed()
+        quiet_since = time.time()
+        with console.status("Waiting for the indexer to finish"):
+            while last is not None and time.time() - quiet_since < DRAIN_QUIET:
+                if time.time() > deadline:
+                    logger.warning(
+                        f"Indexer still busy after {DRAIN_TIMEOUT}s, restoring settings"
+                    )
+                    return
+                time.sleep(DRAIN_POLL)
+                indexed = self.indexed()
+                if indexed != last:
+                    last = indexed
+                    quiet_since = time.time()
+
+    def restore(self):
+        restore_settings(self.es, self.original_settings)
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.es and exc_type is None:
+            self.wait_for_indexer()
+        restored = True
+        if self.original_indexer is not None:
+            try:
+                cik8s.scale_workload(
+                    "Deployment",
+                    INDEXER_DEPLOYMENT,
+                    self.original_indexer,
+                    self.namespace,
+                )
+            except Exception as err:
+                restored = False
+                logger.error(f"Unable to scale {INDEXER_DEPLOYMENT} back: {err}")
+        if not self.es:
+            if restored and os.path.exists(BULK_STATE_FILE):
+                os.remove(BULK_STATE_FILE)
+            return False
+        try:
+            self.restore()
+        except Exception as err:
+            logger.error(f"Unable to restore Elasticsearch settings: {err}")
+            error_console.log(
+                f":x: Unable to restore Elasticsearch settings, run [code]cibutler diag bulk-load-reset[/code]: {err}"
+            )
+            return False
+        if restored and os.path.exists(BULK_STATE_FILE):
+            os.remove(BULK_STATE_FILE)
+        duration = time.time() - self.start_time
+        indexed = self.indexed()
+        if indexed is not None:
+            console.log(
+                f":racing_car: Indexed {indexed} documents, {indexed / max(duration, 1):.1f} docs/sec"
+            )
+            logger.info(
+                f"Bulk load indexed {indexed} documents in {duration:.0f}s, {indexed / max(duration, 1):.1f} docs/sec"
+            )
+        return False
+
+
+@diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
+def bulk_load_reset(
+    namespace: Annotated[
+        str, typer.Option("--namespace", "-n", help="CImpl namespace")
+    ] = "default",
+    indexer_replicas: Annotated[
+        int,
+        typer.Option(help="Indexer replicas when the interrupted load left no record"),
+    ] = 1,
+):
+    """
+    Turn Elasticsearch bulk load settings off again after an interrupted data load
+
+    Puts back the refresh interval, index replicas and indexer replicas
+    recorded when the load started, or the defaults without that record.
+    """
+    state = read_bulk_state() or {}
+    try:
+        es = Elastic(namespace)
+    except Exception as err:
+        error_console.print(f":x: Unable to reach Elasticsearch: {err}")
+        raise typer.Exit(1)
+    try:
+        restore_settings(es, state.get("settings") or {})
+    except ElasticError as err:
+        error_console.print(f":x: Unable to reset Elasticsearch settings: {err}")
+        raise typer.Exit(1)
+    replicas = state.get("indexer_replicas") or indexer_replicas
+    try:
+        cik8s.scale_workload("Deployment", INDEXER_DEPLOYMENT, replicas, namespace)
+    except Exception as err:
+        error_console.print(f":x: Unable to scale {INDEXER_DEPLOYMENT} back: {err}")
+        raise typer.Exit(1)
+    if os.path.exists(BULK_STATE_FILE):
+        os.remove(BULK_STATE_FILE)
+    console.print(
+        f":white_check_mark: Elasticsearch settings reset, indices refreshed and {INDEXER_DEPLOYMENT} at {replicas} replica(s)"
+    )
+
+
+if __name__ == "__main__":
+    diag_cli()
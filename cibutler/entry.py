@@ -0,0 +1,100 @@
+"""
+cibutler console entry point.
+
+Read-only commands are sent to a running cibutler agent, which has the CLI
+imported and its clients and token warm. Everything else, and any failure to
+reach the agent, runs the CLI in this process. Only the standard library is
+imported before that choice, so forwarded commands skip the import cost.
+"""
+
+import os
+import sys
+import json
+import socket
+import shutil
+
+# Same as cibutler.common.CACHE_DIR, without importing rich and dotenv
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "cibutler",
+)
+SOCKET_FILE = os.path.join(CACHE_DIR, "agent.sock")
+CONNECT_TIMEOUT = 0.5
+
+# Set to run every command in process, even with an agent running
+NO_AGENT_ENV = "CIBUTLER_NO_AGENT"
+
+# Command prefixes the agent answers. They do not prompt and do not change
+# the cluster.
+AGENT_COMMANDS = [
+    ["status"],
+    ["info"],
+    ["groups"],
+    ["search"],
+    ["diag", "ready"],
+]
+
+
+def agent_command(argv: list):
+    """
+    Whether argv (without the program name) can be sent to the agent
+    """
+    if "--help" in argv or "--version" in argv:
+        return False
+    return any(argv[: len(prefix)] == prefix for prefix in AGENT_COMMANDS)
+
+
+def request(argv: list, path: str = SOCKET_FILE):
+    """
+    Run argv in the agent, returns its reply {exit_code, stdout, stderr}.
+    Raises OSError when there is no agent listening on path.
+    """
+    env = dict(os.environ)
+    # Rich sizes its output from COLUMNS when it is not writing to a terminal
+    env.setdefault("COLUMNS", str(shutil.get_terminal_size().columns))
+    message = {"argv": argv, "env": env, "cwd": os.getcwd()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(path)
+        # Commands may take as long as their own timeouts
+        sock.settimeout(None)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        data = b""
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    try:
+        return json.loads(data)
+    except ValueError:
+        raise OSError("Incomplete reply from cibutler agent")
+
+
+def main():
+    argv = sys.argv[1:]
+    if (
+        hasattr(socket, "AF_UNIX")
+        and not os.environ.get(NO_AGENT_ENV)
+        and agent_command(argv)
+        and os.path.exists(SOCKET_FILE)
+    ):
+        try:
+            reply = request(argv)
+        except OSError:
+            # Stale socket or agent stopped, the commands are read-only so
+            # running them here is safe
+            reply = None
+        if reply is not None:
+            sys.stdout.write(reply.get("stdout", ""))
+            sys.stderr.write(reply.get("stderr", ""))
+            sys.exit(reply.get("exit_code", 1))
+
+    from cibutler.main import cli
+
+    cli()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import typer
+import os
+import json
+import time
+import logging
+from datetime import datetime
+from kubernetes import client, config
+from typing_extensions import Annotated
+import cibutler.cik8s as cik8s
+import cibutler.utils as utils
+from cibutler.config import service_depths
+from cibutler.common import CACHE_DIR, console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+# Workload name fragments for services whose workloads are not simply named
+# after the service, checked before the service names themselves
+WORKLOAD_FRAGMENTS = [
+    ("wellbore-worker", "Wellbore-Worker"),
+    ("crs-conversion", "Crs-conversion"),
+    ("crs-catalog", "Crs-catalog"),
+    ("postgres", "PostgreSQL"),
+    ("elastic", "Elastic"),
+    ("minio", "Minio"),
+    ("keycloak", "Keycloak"),
+    ("rabbitmq", "RabbitMQ-Bootstrap"),
+    ("redis", "Common-Infra"),
+    ("airflow", "Airflow"),
+]
+
+# One-shot data loaders, resuming them would start the data load again
+SKIP_ON_RESUME = ["bootstrap-data"]
+
+# Every service from this dependency depth on starts in one tier: they only
+# need partition and entitlements up, the rest they retry on their own
+LAST_TIER = 5
+
+
+def workload_service(name: str):
+    for fragment, service in WORKLOAD_FRAGMENTS:
+        if fragment in name:
+            return service
+    depths = service_depths()
+    # Longest name first so the most specific service wins
+    for service in sorted(depths, key=len, reverse=True):
+        if service.lower() in name:
+            return service
+    return None
+
+
+def workload_tier(name: str):
+    """
+    Resume tier of a workload, from the dependency depth of its service.
+    Workloads of unknown services start last.
+    """
+    service = workload_service(name)
+    if service is None:
+        return LAST_TIER
+    return min(service_depths()[service], LAST_TIER)
+
+
+def state_file(namespace: str):
+    context = cik8s.get_currentcontext() or "unknown"
+    return os.path.join(CACHE_DIR, f"hibernate-{context}-{namespace}.json")
+
+
+def list_workloads(namespace: str = "default"):
+    """
+    Deployments and StatefulSets as (kind, name, replicas)
+    """
+    config.load_kube_config()
+    apps = client.AppsV1Api()
+    workloads = [
+        ("Deployment", d.metadata.name, d.spec.replicas or 0)
+        for d in apps.list_namespaced_deployment(namespace).items
+    ]
+    workloads += [
+        ("StatefulSet", s.metadata.name, s.spec.replicas or 0)
+        for s in apps.list_namespaced_stateful_set(namespace).items
+    ]
+    return workloads
+
+
+def tiers(workloads: list):
+    """
+    Group (kind, name, replicas) workloads into tiers, lowest first
+    """
+    grouped = {}
+    for workload in workloads:
+        grouped.setdefault(workload_tier(workload[1]), []).append(workload)
+    return [grouped[tier] for tier in sorted(grouped)]
+
+
+def scale_tier(tier: list, namespace: str, timeout: int, message: str):
+    """
+    Scale every workload of a tier at once, then wait for it to settle.
+    Returns False when the tier did not settle in time.
+    """
+    for kind, name, replicas in tier:
+        cik8s.scale_workload(kind, name, replicas, namespace=namespace)
+    start = time.time()
+    with console.status(message):
+        while not cik8s.workloads_settled(tier, namespace=namespace):
+            if time.time() - start > timeout:
+                return False
+            time.sleep(2)
+    return True
+
+
+def hibernate_cluster(namespace: str = "default", timeout: int = 300):
+    """
+    Record replicas, then scale to zero in reverse dependency order
+    """
+    workloads = [w for w in list_workloads(namespace) if w[2] > 0]
+    if not workloads:
+        return None
+    state = {
+        "namespace": namespace,
+        "hibernated": datetime.now().isoformat(timespec="seconds"),
+        "workloads": [
+            {"kind": kind, "name": name, "replicas": replicas}
+            for kind, name, replicas in workloads
+        ],
+    }
+    # Written first, so an interrupted hibernate can still be resumed. Keep
+    # what an earlier, interrupted hibernate recorded for stopped workloads.
+    path = state_file(namespace)
+    try:
+        with open(path) as f:
+            previous = json.load(f)["workloads"]
+    except (OSError, ValueError, KeyError):
+        previous = []
+    running = {(kind, name) for kind, name, _ in workloads}
+    state["workloads"] += [w for w in previous if (w["kind"], w["name"]) not in running]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(state, f, indent=2)
+    logger.info(f"Hibernating {len(workloads)} workloads in {namespace}, state {path}")
+
+    for tier in reversed(tiers(workloads)):
+        stopped = [(kind, name, 0) for kind, name, _ in tier]
+        names = ", ".join(name for _, name, _ in tier)
+        if not scale_tier(stopped, namespace, timeout, f"Stopping {names}..."):
+            logger.warning(f"Timed out stopping {names}")
+        console.log(f":zzz: Stopped {names}")
+    return state
+
+
+def resume_cluster(namespace: str = "default", timeout: int = 600):
+    """
+    Scale back to the recorded replicas tier by tier, waiting for each tier
+    to be ready before starting the next. Returns the tiers that timed out.
+    """
+    path = state_file(namespace)
+    try:
+        with open(path) as f:
+            recorded = {
+                (w["kind"], w["name"]): w["replicas"] for w in json.load(f)["workloads"]
+            }
+    except (OSError, ValueError, KeyError):
+        logger.warning(f"No hibernate state in {path}, resuming at 1 replica")
+        recorded = {}
+
+    workloads = []
+    for kind, name, _ in list_workloads(namespace):
+        if any(skip in name for skip in SKIP_ON_RESUME):
+            continue
+        replicas = recorded.get((kind, name), 0 if recorded else 1)
+        workloads.append((kind, name, replicas))
+    workloads = [w for w in workloads if w[2] > 0]
+
+    timed_out = []
+    for index, tier in enumerate(tiers(workloads)):
+        names = ", ".join(name for _, name, _ in tier)
+        start = time.time()
+        if scale_tier(tier, namespace, timeout, f"Starting tier {index}: {names}..."):
+            console.log(
+                f":white_check_mark: Tier {index} ready in {utils.convert_time(time.time() - start)}: {names}"
+            )
+        else:
+            console.log(
+                f"[yellow]:warning: Tier {index} not ready after {timeout}s: {names}[/yellow]"
+            )
+            timed_out.append(names)
+    if not timed_out and os.path.exists(path):
+        os.remove(path)
+    return timed_out
+
+
+@cli.command(rich_help_panel="CI Commands")
+def hibernate(
+    namespace: Annotated[
+        str, typer.Option("--namespace", "-n", help="CImpl namespace")
+    ] = "default",
+    force: Annotated[
+        bool, typer.Option("--force", "--yes", "-y", help="Do not prompt")
+    ] = False,
+):
+    """
+    Scale CImpl to zero to free CPU and memory, keeping all data :zzz:
+
+    Use [green]cibutler resume[/green] to start it again.
+    """
+    if not force:
+        typer.confirm(f"Scale every workload in {namespace} to zero?", abort=True)
+    start = time.time()
+    try:
+        state = hibernate_cluster(namespace)
+    except Exception as err:
+        error_console.print(f":x: Unable to hibernate: {err}")
+        raise typer.Exit(1)
+    if not state:
+        console.print(f"Nothing running in {namespace}")
+        return
+    console.print(
+        f":zzz: Hibernated {len(state['workloads'])} workloads in {utils.convert_time(time.time() - start)}"
+    )
+
+
+@cli.command(rich_help_panel="CI Commands")
+def resume(
+    namespace: Annotated[
+        str, typer.Option("--namespace", "-n", help="CImpl namespace")
+    ] = "default",
+    timeout: Annotated[
+        int, typer.Option(help="Seconds to wait for each tier to be ready")
+    ] = 600,
+):
+    """
+    Resume a hibernated CImpl, infra first then OSDU services in tiers :sunrise:
+    """
+    start = time.time()
+    try:
+        timed_out = resume_cluster(namespace, timeout=timeout)
+    except Exception as err:
+        error_console.print(f":x: Unable to resume: {err}")
+        raise typer.Exit(1)
+    duration = utils.convert_time(time.time() - start)
+    if timed_out:
+        error_console.print(
+            f":x: Resumed in {duration} but not ready: {'; '.join(timed_out)}"
+        )
+        raise typer.Exit(1)
+    console.print(f":sunrise: Resumed in {duration}")
+
+
+if __name__ == "__main__":
+    cli()
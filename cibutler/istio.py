@@ -29,16 +29,19 @@ def install_istio(
     Install istio
     """
     console.print(f":pushpin: Adding helm repo {repo}")
+    # Fails when an istio repo is already configured, which is fine
     run_shell_command(f"helm repo add istio {repo}")  # nosec
-    run_shell_command("helm repo update")  # nosec
-
-    run_shell_command(
+    commands = [
+        "helm repo update",
         f"helm upgrade --install istio-base istio/base --create-namespace -n {namespace}",
-    )
-    run_shell_command(f"helm upgrade --install istiod istio/istiod -n {namespace}")
-    run_shell_command(
-        f"helm upgrade --install istio-ingress istio/gateway -n {namespace} --set labels.istio=ingressgateway --skip-schema-validation"
-    )
+        f"helm upgrade --install istiod istio/istiod -n {namespace}",
+        f"helm upgrade --install istio-ingress istio/gateway -n {namespace} --set labels.istio=ingressgateway --skip-schema-validation",
+    ]
+    # Each step needs the one before, stop at the first failure
+    for command in commands:
+        if not run_shell_command(command):  # nosec
+            error_console.print(f":x: Failed: {command}")
+            return False
 
     if check_istio():
         console.print(
@@ -1,6 +1,17 @@
 from rich.console import Console
+from rich.markup import escape
 import time
+import json
+import re
+import sys
+import select
+import ctypes
+import ctypes.util
+import queue
+import atexit
 import logging
+import logging.handlers
+from datetime import datetime, timezone
 import typer
 import os
 from pathlib import Path
@@ -21,6 +32,101 @@ diag_cli = typer.Typer(
 )
 
 
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(module)s %(funcName)s %(lineno)d %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# The QueueListener of setup_logging, use_logfile swaps its file handler
+_listener = None
+
+
+def file_handler(
+    filename: str,
+    log_format: str = "text",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+):
+    handler = logging.handlers.RotatingFileHandler(
+        filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+def setup_logging(
+    level: str = "INFO",
+    filename: str = f"{Path.home()}/{conf.logfile}",
+    log_format: str = "text",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+):
+    """
+    Log to a size rotated file through a queue, so callers never wait on disk.
+    The file is written by a QueueListener thread, stopped (and flushed) at exit.
+    """
+    global _listener
+    handler = file_handler(filename, log_format, max_bytes, backup_count)
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, handler, respect_handler_level=True
+    )
+    _listener = listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def daemon_logfile(name: str):
+    return f"{Path.home()}/cibutler-{name}.log"
+
+
+def use_logfile(filename: str):
+    """
+    Send the log to filename from now on. Long-running processes (tunnel
+    supervisor, port-forward manager, agent) each get their own file: a
+    rotation in one process would rename the shared file under the others.
+    """
+    if _listener is None:
+        return
+    old = _listener.handlers
+    formatter = old[0].formatter if old else logging.Formatter(TEXT_FORMAT)
+    handler = file_handler(filename)
+    handler.setFormatter(formatter)
+    # stop writes out the queued records to the old file first
+    _listener.stop()
+    for previous in old:
+        previous.close()
+    _listener.handlers = (handler,)
+    _listener.start()
+    logger.info(f"Logging to {filename}, pid {os.getpid()}")
+
+
 @diag_cli.command(rich_help_panel="Diagnostic Commands", hidden=True)
 def logfile():
     """
@@ -30,6 +136,207 @@ def logfile():
     console.print(f"{home}/{conf.logfile}")
 
 
+class Inotify:
+    """
+    Minimal inotify watch of a directory through libc (Linux only)
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_NONBLOCK = 0x00000800
+    IN_CLOEXEC = 0x00080000
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = (
+            self.IN_MODIFY
+            | self.IN_CREATE
+            | self.IN_DELETE
+            | self.IN_MOVED_FROM
+            | self.IN_MOVED_TO
+        )
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {directory} failed")
+
+    def wait(self, timeout: float):
+        """
+        Block until something changed in the directory or timeout
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+        return bool(readable)
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Poller:
+    """
+    Fallback when inotify is not available
+    """
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+
+    def wait(self, timeout: float):
+        time.sleep(min(timeout, self.interval))
+        return True
+
+    def close(self):
+        pass
+
+
+def file_watcher(directory: str):
+    if sys.platform.startswith("linux"):
+        try:
+            return Inotify(directory)
+        except (OSError, AttributeError) as err:
+            logger.info("inotify not available, polling: %s", err)
+    return Poller()
+
+
+def last_lines(file, count: int, block_size: int = 4096):
+    """
+    The last count lines of a binary file, reading backwards in blocks.
+    Leaves the file positioned at the end.
+    """
+    file.seek(0, os.SEEK_END)
+    position = file.tell()
+    data = b""
+    while position > 0 and data.count(b"\n") <= count:
+        read_size = min(block_size, position)
+        position -= read_size
+        file.seek(position)
+        data = file.read(read_size) + data
+    file.seek(0, os.SEEK_END)
+    if not count:
+        return []
+    return [
+        line.decode("utf-8", errors="replace") for line in data.splitlines()[-count:]
+    ]
+
+
+TEXT_RECORD = re.compile(
+    r"^\d{4}-\d\d-\d\d \S+ (?P<level>[A-Z]+) (?P<module>\S+) (?P<function>\S+) (?P<line>\d+) (?P<message>.*)$"
+)
+LEVEL_STYLES = {
+    "DEBUG": "dim",
+    "INFO": "green",
+    "WARNING": "yellow",
+    "ERROR": "red",
+    "CRITICAL": "bold red",
+}
+
+
+class LogFilter:
+    """
+    Level, module and regex filters over text or JSON log lines.
+    Lines that are not a record (tracebacks) follow the record before them.
+    """
+
+    def __init__(self, level: str = None, module: str = None, pattern: str = None):
+        self.level = logging.getLevelName(level.upper()) if level else None
+        self.module = module
+        self.pattern = re.compile(pattern) if pattern else None
+        self.showing = True
+
+    def record(self, line: str):
+        """
+        Parsed record (dict) for a JSON or text log line, None otherwise
+        """
+        if line.startswith("{"):
+            try:
+                return json.loads(line)
+            except ValueError:
+                return None
+        match = TEXT_RECORD.match(line)
+        return match.groupdict() if match else None
+
+    def match(self, line: str, record: dict):
+        if record is None:
+            return self.showing
+        level = logging.getLevelName(record.get("level", ""))
+        self.showing = (
+            (self.level is None or (isinstance(level, int) and level >= self.level))
+            and (self.module is None or record.get("module") == self.module)
+            and (self.pattern is None or bool(self.pattern.search(line)))
+        )
+        return self.showing
+
+
+def print_line(line: str, record: dict, raw: bool = False):
+    if raw or record is None or "time" not in record:
+        console.print(line, markup=False, highlight=False)
+        return
+    style = LEVEL_STYLES.get(record.get("level"), "")
+    console.print(
+        f"[dim]{escape(record['time'])}[/dim] [{style}]{record.get('level', ''):8}[/{style}] "
+        f"[cyan]{escape(str(record.get('module')))}.{escape(str(record.get('function')))}:{record.get('line')}[/cyan] "
+        f"{escape(str(record.get('message', '')))}",
+        highlight=False,
+    )
+    if record.get("exception"):
+        console.print(record["exception"], markup=False, highlight=False)
+
+
+def follow(path: str, flag, watcher, lines: int = 20):
+    """
+    Yield lines of path: the last lines first, then new lines as they are
+    written, reopening the file when it is rotated or truncated
+    """
+    file = open(path, "rb")
+    try:
+        for line in last_lines(file, lines):
+            yield line
+        partial = b""
+        while not flag.exit():
+            chunk = file.read()
+            if chunk:
+                data = partial + chunk
+                *complete, partial = data.split(b"\n")
+                for line in complete:
+                    yield line.decode("utf-8", errors="replace")
+                continue
+
+            try:
+                current = os.stat(path)
+            except FileNotFoundError:
+                current = None
+            if current is None or current.st_ino != os.fstat(file.fileno()).st_ino:
+                # Rotated: continue with the new file once the old one is
+                # drained, lines may have been written since the read above
+                if current is not None:
+                    logger.debug("%s rotated, reopening", path)
+                    rest = partial + file.read()
+                    for line in rest.split(b"\n"):
+                        if line:
+                            yield line.decode("utf-8", errors="replace")
+                    file.close()
+                    file = open(path, "rb")
+                    partial = b""
+                    continue
+            elif current.st_size < file.tell():
+                # Truncated in place
+                file.seek(0)
+                partial = b""
+                continue
+            watcher.wait(0.5)
+    finally:
+        file.close()
+
+
 @diag_cli.command(rich_help_panel="CI Butler Diagnostic Commands")
 def tail(
     file_path: Annotated[
@@ -43,25 +350,49 @@ def tail(
             resolve_path=True,
         ),
     ] = f"{Path.home()}/{conf.logfile}",
+    lines: Annotated[
+        int, typer.Option("--lines", "-n", help="Number of lines to show first")
+    ] = 20,
+    level: Annotated[
+        str, typer.Option("--level", "-l", help="Minimum level, e.g. WARNING")
+    ] = None,
+    module: Annotated[
+        str, typer.Option("--module", "-m", help="Only records from this module")
+    ] = None,
+    grep: Annotated[
+        str, typer.Option("--grep", "-g", help="Only records matching this regex")
+    ] = None,
+    follow_file: Annotated[
+        bool, typer.Option("--follow/--no-follow", "-f", help="Follow new lines")
+    ] = True,
+    raw: Annotated[
+        bool, typer.Option("--raw", help="Print JSON records unformatted")
+    ] = False,
 ):
     """
-    tail a file (for log files)
+    tail a file (for log files), following rotation, with optional filters
     """
+    try:
+        log_filter = LogFilter(level=level, module=module, pattern=grep)
+    except re.error as err:
+        error_console.print(f":x: Invalid regex {grep}: {err}")
+        raise typer.Exit(1)
+
     flag = utils.GracefulExiter()
-    with open(file_path, "r") as file:
-        # Move the pointer to the end of the file
-        file.seek(0, 2)
-        file_size = file.tell()
-        # Move the pointer backwards to read the last 2KB
-        file.seek(max(file_size - 2*1024, 0))
-        while True:
-            if flag.exit():
-                raise typer.Exit()
-            line = file.readline()
-            if not line:
-                time.sleep(0.1)  # Sleep briefly
-                continue
-            console.print(line.strip())
+    if follow_file:
+        watcher = file_watcher(str(file_path.parent))
+        source = follow(str(file_path), flag, watcher, lines=lines)
+    else:
+        watcher = Poller()
+        with open(file_path, "rb") as file:
+            source = last_lines(file, lines)
+    try:
+        for line in source:
+            record = log_filter.record(line)
+            if log_filter.match(line, record):
+                print_line(line, record, raw=raw)
+    finally:
+        watcher.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+"""
+Low-memory overlay for dev installs on 16GB machines.
+
+A helm values file that trims requests, limits and heaps of the selected
+services, applied with install --low-memory after the chart's own values.
+"""
+
+import io
+import os
+import logging
+import threading
+import typer
+import ruamel.yaml
+from typing_extensions import Annotated
+import cibutler.config as config
+from cibutler.config import SERVICE_FLAG_MAP
+from cibutler.common import CACHE_DIR, console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+OVERLAY_FILE = os.path.join(CACHE_DIR, "low-memory-values.yaml")
+
+# The core-plus service charts size their container from these data values.
+# Limits are enforced, so the JVM default heap (25% of the container memory
+# limit) shrinks with them, the charts have no separate heap option.
+OSDU_SERVICE_RESOURCES = {
+    "requestsCpu": "20m",
+    "requestsMemory": "256Mi",
+    "limitsCpu": "1",
+    "limitsMemory": "768Mi",
+}
+
+# Services that index or fan out requests and need more heap to stay up
+OSDU_SERVICE_LIMITS_MEMORY = {
+    "Indexer": "1Gi",
+    "Search": "1Gi",
+    "Storage": "1Gi",
+    "Wellbore": "1Gi",
+}
+
+# Infra charts (bitnami based), by dotted helm value path
+INFRA_OVERRIDES = {
+    "Elastic": {
+        "elasticsearch.master.heapSize": "512m",
+        "elasticsearch.master.replicas": "1",
+        "elasticsearch.master.resources.requests.cpu": "250m",
+        "elasticsearch.master.resources.requests.memory": "1Gi",
+        "elasticsearch.master.resources.limits.memory": "1536Mi",
+        "elasticsearch.data.heapSize": "512m",
+        "elasticsearch.data.replicas": "1",
+        "elasticsearch.data.resources.requests.cpu": "250m",
+        "elasticsearch.data.resources.requests.memory": "1Gi",
+        "elasticsearch.data.resources.limits.memory": "1536Mi",
+        "elasticsearch.coordinating.replicaCount": "0",
+        "elasticsearch.ingest.replicaCount": "0",
+    },
+    "PostgreSQL": {"postgresql.primary.resourcesPreset": "small"},
+    "Keycloak": {"keycloak.resourcesPreset": "small", "keycloak.replicaCount": 1},
+    "Minio": {"minio.resourcesPreset": "micro"},
+    "Airflow": {
+        "airflow.web.resourcesPreset": "small",
+        "airflow.scheduler.resourcesPreset": "small",
+        "airflow.worker.resourcesPreset": "small",
+        "airflow.worker.replicaCount": 1,
+    },
+}
+
+
+def chart_name(service: str):
+    """
+    Subchart of a service, from its first enable flag
+    """
+    return SERVICE_FLAG_MAP[service][0].split(".")[0]
+
+
+def service_overrides(service: str):
+    """
+    Dotted helm value overrides for one service
+    """
+    if service in INFRA_OVERRIDES:
+        return dict(INFRA_OVERRIDES[service])
+    chart = chart_name(service)
+    if not chart.startswith("core-plus-"):
+        # Bootstrap jobs, they run once and exit
+        return {}
+    resources = dict(OSDU_SERVICE_RESOURCES)
+    if service in OSDU_SERVICE_LIMITS_MEMORY:
+        resources["limitsMemory"] = OSDU_SERVICE_LIMITS_MEMORY[service]
+    return {f"{chart}.data.{key}": value for key, value in resources.items()}
+
+
+def set_value(values: dict, path: str, value):
+    *parents, last = path.split(".")
+    for key in parents:
+        values = values.setdefault(key, {})
+    values[last] = value
+
+
+def low_memory_values(selected_services: list = None):
+    """
+    Nested helm values of the low-memory overlay for the selected services
+    """
+    if selected_services is None:
+        selected_services = list(SERVICE_FLAG_MAP.keys())
+    values = {"global": {"limitsEnabled": True}}
+    for service in SERVICE_FLAG_MAP:
+        if service not in selected_services:
+            continue
+        for path, value in service_overrides(service).items():
+            set_value(values, path, value)
+    return values
+
+
+def dump_values(values: dict):
+    yaml = ruamel.yaml.YAML()
+    stream = io.StringIO()
+    yaml.dump(values, stream)
+    return stream.getvalue()
+
+
+def write_overlay(selected_services: list = None, path: str = OVERLAY_FILE):
+    """
+    Write the overlay values file, returns its path
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(
+            "# Generated by cibutler for install --low-memory, changes are overwritten\n"
+        )
+        f.write(dump_values(low_memory_values(selected_services)))
+    logger.info(f"Low-memory overlay written to {path}")
+    return path
+
+
+class PeakMemory:
+    """
+    Sample memory in use from a background thread while an install runs.
+
+    sample returns GB in use or None when it can not be measured, peak_gb
+    stays None until a sample succeeds.
+    """
+
+    def __init__(self, sample, interval: int = 15):
+        self.sample = sample
+        self.interval = interval
+        self.peak_gb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                used = self.sample()
+            except Exception as err:
+                logger.debug(f"Memory sample failed: {err}")
+                used = None
+            if used is not None and (self.peak_gb is None or used > self.peak_gb):
+                self.peak_gb = used
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="peak-memory", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval)
+        if self.peak_gb is not None:
+            logger.info(f"Peak memory in use during install: {self.peak_gb:.2f} GiB")
+        return self.peak_gb
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.stop()
+        return False
+
+
+@diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
+def low_memory_overlay(
+    deployment_profile: Annotated[
+        str,
+        typer.Option(
+            callback=config.deployment_profile_callback,
+            help=f"Only services of a profile: {', '.join(config.DEPLOYMENT_PROFILES)}",
+        ),
+    ] = None,
+    output: Annotated[
+        str, typer.Option("--output", "-o", help="Write the values to a file")
+    ] = None,
+):
+    """
+    Show the helm values install --low-memory applies
+    """
+    services = None
+    if deployment_profile:
+        services = config.profile_services(deployment_profile)
+    if output:
+        write_overlay(services, output)
+        console.print(f":white_check_mark: Low-memory values written to {output}")
+    else:
+        console.print(dump_values(low_memory_values(services)), markup=False)
+
+
+if __name__ == "__main__":
+    diag_cli()
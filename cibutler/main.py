@@ -2,6 +2,7 @@
 # CI Butler Shane Hutchins
 import collections
 import collections.abc
+
 # Click in certain environments still references the legacy collections names.
 for _name in ("Mapping", "MutableMapping", "MutableSet", "MutableSequence"):
     if not hasattr(collections, _name):
@@ -46,6 +47,18 @@ import cibutler.cihelm as cihelm
 import cibutler.docs as docs
 import cibutler.update as update
 import cibutler.cloud as cloud
+import cibutler.triage as triage
+import cibutler.sizing as sizing
+import cibutler.snapshot as snapshot
+import cibutler.elastic as elastic
+import cibutler.hibernate as hibernate
+import cibutler.lowmem as lowmem
+import cibutler.mirror as mirror
+import cibutler.tunnel as tunnel
+import cibutler.portforward as portforward
+import cibutler.agent as agent
+import cibutler.batch as batch
+import cibutler.shell as shell
 
 # import cibutler.tf as tf
 import cibutler.conf as conf
@@ -53,16 +66,19 @@ import cibutler.debug as cidebug
 import cibutler.config as config
 import cibutler.check as cicheck
 from cibutler._version import __version__ as cibutler_version
-from cibutler.common import console, error_console, save_console_text, HOME, LOGLEVEL
+from cibutler.common import (
+    console,
+    error_console,
+    save_console_text,
+    HOME,
+    LOGLEVEL,
+    LOGFORMAT,
+)
 
 # loading variables from .env file
 
-logging.basicConfig(
-    level=LOGLEVEL,
-    format="%(asctime)s %(levelname)s %(module)s %(funcName)s %(lineno)d %(message)s",
-    filename=f"{HOME}/{conf.logfile}",
-    filemode="a",
-    encoding="utf-8",
+log.setup_logging(
+    level=LOGLEVEL, filename=f"{HOME}/{conf.logfile}", log_format=LOGFORMAT
 )
 logger = logging.getLogger("cibutler")
 
@@ -97,6 +113,14 @@ diag_cli.registered_commands += log.diag_cli.registered_commands
 diag_cli.registered_commands += cidebug.diag_cli.registered_commands
 diag_cli.registered_commands += config.diag_cli.registered_commands
 diag_cli.registered_commands += webui.diag_cli.registered_commands
+diag_cli.registered_commands += triage.diag_cli.registered_commands
+diag_cli.registered_commands += sizing.diag_cli.registered_commands
+diag_cli.registered_commands += snapshot.diag_cli.registered_commands
+diag_cli.registered_commands += elastic.diag_cli.registered_commands
+diag_cli.registered_commands += lowmem.diag_cli.registered_commands
+diag_cli.registered_commands += mirror.diag_cli.registered_commands
+diag_cli.registered_commands += tunnel.diag_cli.registered_commands
+diag_cli.registered_commands += portforward.diag_cli.registered_commands
 
 cli.add_typer(
     diag_cli,
@@ -113,6 +137,13 @@ cli.registered_commands += key.cli.registered_commands
 cli.registered_commands += osdu.cli.registered_commands
 cli.registered_commands += cihelm.cli.registered_commands
 cli.registered_commands += cicheck.cli.registered_commands
+cli.registered_commands += snapshot.cli.registered_commands
+cli.registered_commands += hibernate.cli.registered_commands
+cli.registered_commands += mirror.cli.registered_commands
+cli.registered_commands += tunnel.cli.registered_commands
+cli.registered_commands += portforward.cli.registered_commands
+cli.registered_commands += agent.cli.registered_commands
+cli.registered_commands += batch.cli.registered_commands
 
 
 def _version_callback(value: bool):
@@ -157,7 +188,7 @@ def delete(
     force: Annotated[
         bool, typer.Option("--force", "--yes", "-y", help="No confirmation prompt")
     ] = False,
-    profile: Annotated[str, typer.Option(hidden=True)] = None,
+    profile: Annotated[str, typer.Option(help="Minikube profile")] = None,
     minikube: Annotated[bool, typer.Option("-m", hidden=True)] = False,
 ):
     """
@@ -234,38 +265,43 @@ def uninstall(
         console.print(
             "Note: kubernetes admin level resources (limits, quota, policy, authorization rules) will be ignored."
         )
+        # Releases in the same namespace do not depend on each other, istio
+        # goes after CImpl
         with console.status("Uninstalling helm charts..."):
             console.print(
-                cihelm.helm_uninstall(name=notebook_name, namespace=namespace)
-            )
-            console.print(
-                cihelm.helm_uninstall(name="bootstrap-data-deploy", namespace=namespace)
+                cihelm.helm_uninstall_many(
+                    [notebook_name, "bootstrap-data-deploy", name], namespace=namespace
+                )
             )
-            console.print(cihelm.helm_uninstall(name=name, namespace=namespace))
             console.print(
-                cihelm.helm_uninstall(name="istio-ingress", namespace=istio_namespace)
-            )
-            console.print(
-                cihelm.helm_uninstall(name="istio-base", namespace=istio_namespace)
+                cihelm.helm_uninstall_many(
+                    ["istio-ingress", "istio-base", "istiod"],
+                    namespace=istio_namespace,
+                )
             )
+        console.log("Cleaning up remaining...")
+        with console.status("Deleting remaining secrets and deployments..."):
             console.print(
-                cihelm.helm_uninstall(name="istiod", namespace=istio_namespace)
+                cik8s.delete_items(["secret", "deployments"], namespace=namespace)
             )
-        console.log("Cleaning up remaining...")
-        with console.status("Deleting remaining secrets..."):
-            console.print(cik8s.delete_item("secret"))
-        with console.status("Deleting remaining deployments..."):
-            console.print(cik8s.delete_item("deployments"))
 
         with console.status("Patching all PVCs"):
             cik8s.patch_all_pvcs(namespace=namespace)
 
         # with console.status("Deleting remaining pvc..."):
         # console.print(cik8s.delete_item("pvc"))
-        with console.status(f"Deleting everything else in {namespace}..."):
-            console.print(cik8s.delete_all(namespace=namespace))
-        with console.status(f"Deleting everything else in {istio_namespace}..."):
-            console.print(cik8s.delete_all(namespace=istio_namespace))
+        with console.status(
+            f"Deleting everything else in {namespace} and {istio_namespace}..."
+        ):
+            results = shell.run_many(
+                [
+                    cik8s.delete_command("all", namespace=namespace),
+                    cik8s.delete_command("all", namespace=istio_namespace),
+                ],
+                timeout=shell.ACTION_TIMEOUT,
+            )
+            for result in results:
+                console.print(result.output)
     else:
         raise typer.Abort()
 
@@ -283,7 +319,11 @@ def envfile(
     """
     base_url = base_url.rstrip("/")
     url = base_url + "/api/config/v1/postman-environment"
-    downloader.download([url], "./")
+    try:
+        downloader.download([url], "./")
+    except downloader.DownloadError as err:
+        error_console.print(f":x: Unable to download postman env file: {err}")
+        raise typer.Exit(1)
 
 
 @diag_cli.command(rich_help_panel="Related Commands", hidden=True)
@@ -296,6 +336,12 @@ def success_message(
     duration_str: str,
     percent_memory: float,
     disk_size: int,
+    deployment_profile: str = None,
+    services: int = None,
+    memory_used_gb: float = None,
+    peak_memory_gb: float = None,
+    low_memory: bool = False,
+    mirror_summary: str = None,
 ):
     allocatable_gb_memory = cik8s.kube_allocatable_memory_gb()
     capacity_gb_memory = cik8s.kube_capacity_memory_gb()
@@ -312,7 +358,11 @@ def success_message(
     [bold]Installation time:[/bold] {duration_str}
     [bold]Minikube:[/bold] {minikube}, [bold]Kubernetes:[/bold] {not minikube}
     [bold]Kubernetes RAM:[/bold] {allocatable_gb_memory:.2f}/{capacity_gb_memory:.2f} GiB [bold]CPU:[/bold] {allocatable_cpu}
+    [bold]Profile:[/bold] {deployment_profile or "custom"} ({services or "all"} services) [bold]RAM in use:[/bold] {f"{memory_used_gb:.2f} GiB" if memory_used_gb is not None else "n/a"}
+    [bold]Peak RAM:[/bold] {f"{peak_memory_gb:.2f} GiB" if peak_memory_gb is not None else "n/a"} [bold]Low memory:[/bold] {low_memory}
     """
+    if mirror_summary:
+        output += f"[bold]Registry mirror:[/bold] {mirror_summary}\n    "
     if minikube:
         output += f"Minikube %RAM: {percent_memory}, MaxCPU: {max_cpu}, MaxMem: {max_memory}, Disk Size: {disk_size} GB"
 
@@ -327,6 +377,16 @@ def success_message(
     logger.info(output)
 
 
+def memory_in_use_gb(container: str = None):
+    """
+    Pod memory from the metrics API, else memory of the cluster's container
+    """
+    used = cik8s.pod_memory_usage_gb()
+    if used is None and container:
+        used = cidocker.container_memory_gb(container)
+    return used
+
+
 @cli.command(rich_help_panel="CI Commands")
 def install(
     version: Annotated[
@@ -358,6 +418,13 @@ def install(
             help="Data load option",
         ),
     ] = None,
+    deployment_profile: Annotated[
+        str,
+        typer.Option(
+            callback=config.deployment_profile_callback,
+            help=f"Install a subset of services: {', '.join(config.DEPLOYMENT_PROFILES)}",
+        ),
+    ] = None,
     percent_memory: Annotated[
         float, typer.Option(help="What percent of docker memory should be allocated")
     ] = 0.98,
@@ -378,12 +445,57 @@ def install(
     wait_for_complete: Annotated[
         bool, typer.Option("--wait", help="Monitor data load")
     ] = True,
+    bulk_load: Annotated[
+        bool,
+        typer.Option(
+            help="Turn off Elasticsearch refresh/replicas and scale up the indexer while loading data"
+        ),
+    ] = True,
     disk_size: Annotated[
         int, typer.Option(help="Disk size allocated to the minikube VM in GB")
     ] = 120,
+    minikube_profile: Annotated[
+        str,
+        typer.Option(
+            help="Minikube profile to install into (started if not running, see start-clusters)"
+        ),
+    ] = None,
+    nodes: Annotated[int, typer.Option(help="Minikube nodes")] = 1,
+    auto_size: Annotated[
+        bool,
+        typer.Option(
+            help="Size minikube CPU and memory from the chart's resource requests"
+        ),
+    ] = True,
     max_wait: Annotated[
         int, typer.Option(help="Maximum wait time for OSDU install in minutes")
     ] = 50,
+    fail_fast: Annotated[
+        bool,
+        typer.Option(
+            help="Stop waiting as soon as a pod is stuck in a known terminal failure"
+        ),
+    ] = True,
+    low_memory: Annotated[
+        bool,
+        typer.Option(
+            "--low-memory",
+            help="Trim heaps, requests and replicas to fit a core install in 16GB",
+        ),
+    ] = False,
+    registry_mirror: Annotated[
+        bool,
+        typer.Option(
+            help="Pull images through the local registry mirrors (see cibutler mirror) when they run, new minikube profiles then use containerd"
+        ),
+    ] = True,
+    restore_snapshot: Annotated[
+        bool,
+        typer.Option(
+            "--restore-snapshot",
+            help="Restore the data snapshot for this version and data load option instead of loading data",
+        ),
+    ] = False,
     force: Annotated[
         bool, typer.Option("--force", "--yes", "-y", help="Attempt to force install")
     ] = False,
@@ -436,7 +548,7 @@ def install(
             raise typer.Exit(1)
         configured_options = config.config(defaults=True)
     else:
-        target = check.check()
+        target = check.check(low_memory=low_memory)
         logger.info(f"Target selected: {target}")
         if "minikube" in target.lower():
             minikube = True
@@ -470,17 +582,49 @@ def install(
         else:
             data_load_flag = get_data_load_option()
 
+    data_snapshot = None
+    if data_load_flag and data_load_flag != "skip":
+        data_snapshot = snapshot.find_snapshot(version, data_load_flag)
+        if restore_snapshot and not data_snapshot:
+            console.print(
+                f"[yellow]:warning: No snapshot for {version}/{data_load_flag}, data will be loaded[/yellow]"
+            )
+        elif data_snapshot and not restore_snapshot:
+            console.print(
+                f":information: A data snapshot exists for {version}/{data_load_flag} ({data_snapshot['created']}), "
+                "use --restore-snapshot to restore it instead of loading data"
+            )
+            data_snapshot = None
+
     if minikube:
         running_on_docker = True
         mem_gb = cidocker.docker_mem_gb()
-        if conf.total_heap_required > mem_gb:
+        heap_required = (
+            conf.low_memory_heap_required if low_memory else conf.total_heap_required
+        )
+        if heap_required > mem_gb:
             console.print(
                 "[yellow]:warning: Due to low memory, enabling [/yellow]'max-memory'"
             )
             max_memory = True
 
-    if not force:
+    if deployment_profile:
+        configured_options = config.config(defaults=True)
+        configured_options["osdu_services"] = config.profile_services(
+            deployment_profile
+        )
+    elif not force:
         configured_options = config.config()
+    else:
+        configured_options["osdu_services"] = config.resolve_services(
+            configured_options["osdu_services"]
+        )
+
+    values_files = []
+    if low_memory:
+        values_files.append(lowmem.write_overlay(configured_options["osdu_services"]))
+
+    if not force:
         console.print("The following options will be used for installation:")
         console.print(
             f"Installing CImpl version: {version} from: {source}\nwith data load option: {data_load_flag}"
@@ -492,6 +636,10 @@ def install(
             console.print(
                 f"Percent Memory: {percent_memory}, Max CPU: {max_cpu}, Max Memory: {max_memory}, Disk Size: {disk_size}GB"
             )
+        if deployment_profile:
+            console.print(f"Deployment profile: {deployment_profile}")
+        if low_memory:
+            console.print(f"Low memory overlay: {values_files[0]}")
         console.print(f"Enabled OSDU Services: {configured_options['osdu_services']}")
         typer.confirm("Proceed with install?", abort=True)
 
@@ -506,19 +654,71 @@ def install(
     )
 
     start = time.time()
+    # The mirror counters are totals since the mirrors started
+    mirror_baseline = mirror.stats() if registry_mirror else None
 
     if running_on_docker:
         cidocker.log_docker_details()
 
-    if minikube:
+    if minikube and minikube_profile and ciminikube.status(profile=minikube_profile):
+        console.print(f":smile: Minikube profile {minikube_profile} already running")
+        cik8s.use_context(context=minikube_profile)
+    elif minikube:
+        sized_cpus = sized_memory = None
+        if auto_size and not (max_cpu and max_memory):
+            with console.status("Sizing minikube from the chart..."):
+                recommendation, _ = sizing.size_install(
+                    version, source, configured_options["osdu_services"], values_files
+                )
+            if recommendation:
+                sizing.display_recommendation(recommendation)
+                if recommendation["too_small"] and not force:
+                    typer.confirm("Continue with an undersized cluster?", abort=True)
+                # minikube sizes each node, --max-cpu/--max-memory win over
+                # the recommendation
+                if not max_cpu:
+                    sized_cpus = max(2, -(-recommendation["cpus"] // nodes))
+                if not max_memory:
+                    sized_memory = max(2, -(-recommendation["memory_gb"] // nodes))
+            else:
+                console.print(
+                    "[yellow]:warning: Unable to size from the chart, using defaults[/yellow]"
+                )
         ciminikube.config_minikube(
+            profile=minikube_profile,
             percent_memory=percent_memory,
             max_memory=max_memory,
             max_cpu=max_cpu,
             disk_size=disk_size,
+            cpus=sized_cpus,
+            memory=sized_memory,
         )
-        ciminikube.minikube_start(force=force)
-        if ciminikube.minikube_status():
+        mirrors = mirror.running() if registry_mirror else []
+        runtime = ciminikube.profile_runtime(profile=minikube_profile)
+        if mirrors and runtime not in (None, "containerd"):
+            # An existing profile keeps its runtime and docker daemon settings
+            console.print(
+                f"[yellow]:warning: Registry mirrors not used, the existing minikube profile runs {runtime}. Delete it to pull through the mirrors.[/yellow]"
+            )
+            mirrors = []
+        if mirrors:
+            console.print(
+                f":floppy_disk: Pulling through registry mirrors for {', '.join(mirrors)}"
+            )
+        ciminikube.minikube_start(
+            profile=minikube_profile,
+            force=force,
+            nodes=nodes,
+            cpus=sized_cpus,
+            memory=sized_memory,
+            # containerd can mirror every registry, the docker runtime only docker.io
+            container_runtime="containerd" if mirrors else runtime or "docker",
+            registry_mirror=mirror.registry_mirror_url() if mirrors else None,
+            insecure_registries=mirror.insecure_registries() if mirrors else None,
+        )
+        if mirrors:
+            mirror.configure_minikube_containerd(profile=minikube_profile, nodes=nodes)
+        if ciminikube.minikube_status(profile=minikube_profile):
             error_console.print(":x: Minikube in error state")
             raise typer.Exit(1)
         else:
@@ -538,7 +738,15 @@ def install(
         raise typer.Exit(1)
 
     cik8s.log_kube_stats()
-    install_cimpl(version=version, source=source, configured_options=configured_options)
+    peak_memory = lowmem.PeakMemory(
+        lambda: memory_in_use_gb((minikube_profile or "minikube") if minikube else None)
+    ).start()
+    install_cimpl(
+        version=version,
+        source=source,
+        configured_options=configured_options,
+        values_files=values_files,
+    )
 
     update_services(debug=debug)
 
@@ -548,17 +756,20 @@ def install(
         entitlement_workaround=True,
         quiet=quiet,
         max_wait=max_wait,
-        source=source
+        source=source,
+        fail_fast=fail_fast,
     ):
         error_console.log(
             f"Installation of {version} has failed on {platform.platform()}"
         )
         logger.error(f"Installation of {version} has failed on {platform.platform()}")
+        peak_memory.stop()
         cik8s.kube_log_node_info()
         cik8s.log_kube_stats()
         save_console_text()
         raise typer.Exit(1)
 
+    peak_memory_gb = peak_memory.stop()
     duration = time.time() - start
     duration_str = utils.convert_time(duration)
     console.log(
@@ -568,6 +779,20 @@ def install(
     cik8s.kube_log_node_info()
     cik8s.log_kube_stats()
 
+    memory_used_gb = cik8s.pod_memory_usage_gb()
+    if memory_used_gb is None and running_on_docker:
+        memory_used_gb = cidocker.docker_memory_consumption_gb()
+    logger.info(
+        f"Profile {deployment_profile or 'custom'}: {len(configured_options['osdu_services'])} services, installed in {duration_str}, RAM in use {memory_used_gb}"
+    )
+
+    mirror_stats = (
+        mirror.stats_since(mirror_baseline, mirror.stats()) if registry_mirror else None
+    )
+    mirror_summary = mirror.stats_message(mirror_stats) if mirror_stats else None
+    if mirror_summary:
+        logger.info(f"Registry mirror: {mirror_summary}")
+
     success_message(
         version=version,
         source=source,
@@ -577,6 +802,12 @@ def install(
         duration_str=duration_str,
         percent_memory=percent_memory,
         disk_size=disk_size,
+        deployment_profile=deployment_profile,
+        services=len(configured_options["osdu_services"]),
+        memory_used_gb=memory_used_gb,
+        peak_memory_gb=peak_memory_gb,
+        low_memory=low_memory,
+        mirror_summary=mirror_summary,
     )
 
     logger.info(
@@ -586,12 +817,38 @@ def install(
     if install_notebook:
         helm_install_notebook(notebook_source=notebook_source, version=notebook_version)
 
-    data_load(
-        data_load_flag=data_load_flag,
-        data_source=data_source,
-        data_version=data_version,
-        wait_for_complete=wait_for_complete,
-    )
+    if data_snapshot:
+        restore_start = time.time()
+        console.log(
+            f":camera: Restoring data snapshot {version}/{data_load_flag} from {data_snapshot['created']}"
+        )
+        try:
+            ready = snapshot.restore_snapshot(data_snapshot)
+        except Exception as err:
+            logger.error(f"Snapshot restore failed: {err}")
+            error_console.log(f":x: Snapshot restore failed: {err}")
+            raise typer.Exit(1)
+        if not ready:
+            error_console.log(
+                ":x: Snapshot restored, but the stateful components are not ready"
+            )
+            raise typer.Exit(1)
+        logger.info(
+            f"Snapshot {version}/{data_load_flag} restored in {utils.convert_time(time.time() - restore_start)}"
+        )
+    else:
+        data_load(
+            data_load_flag=data_load_flag,
+            data_source=data_source,
+            data_version=data_version,
+            wait_for_complete=wait_for_complete,
+            bulk_load=bulk_load,
+        )
+        if data_load_flag and data_load_flag != "skip" and wait_for_complete:
+            console.print(
+                f":information: Run [code]cibutler snapshot --version {version} -d {data_load_flag}[/code] "
+                "to reinstall with this data in minutes using --restore-snapshot"
+            )
     duration = time.time() - start
     duration_str = utils.convert_time(duration)
     logger.info(f"Install command completed in {duration_str}")
@@ -599,7 +856,9 @@ def install(
     save_console_text()
 
 
-def data_load(data_load_flag, data_source, data_version, wait_for_complete=True):
+def data_load(
+    data_load_flag, data_source, data_version, wait_for_complete=True, bulk_load=True
+):
     load_work_products = False
     logger.info(f"Data load option: {data_load_flag}")
     if data_load_flag and "skip" in data_load_flag:
@@ -614,6 +873,7 @@ def data_load(data_load_flag, data_source, data_version, wait_for_complete=True)
             version=data_version,
             load_work_products=load_work_products,
             wait_for_complete=wait_for_complete,
+            bulk_load=bulk_load,
         )
     else:
         data_load_flag = get_data_load_option()
@@ -626,6 +886,7 @@ def data_load(data_load_flag, data_source, data_version, wait_for_complete=True)
                 version=data_version,
                 load_work_products=load_work_products,
                 wait_for_complete=wait_for_complete,
+                bulk_load=bulk_load,
             )
 
 
@@ -641,6 +902,12 @@ def upload_data(
     wait_for_complete: Annotated[
         bool, typer.Option("--wait", help="Wait for complete")
     ] = True,
+    bulk_load: Annotated[
+        bool,
+        typer.Option(
+            help="Turn off Elasticsearch refresh/replicas and scale up the indexer while loading data"
+        ),
+    ] = True,
 ):
     """
     Upload data to CImpl
@@ -650,6 +917,7 @@ def upload_data(
         data_source=data_source,
         data_version=data_version,
         wait_for_complete=wait_for_complete,
+        bulk_load=bulk_load,
     )
 
 
@@ -665,9 +933,11 @@ def main(
     ] = None,
 ):
     """
-    Just for version callback
+    Version callback, and URL defaults from the port-forward manager
     """
-    pass
+    # Runs before the command's options are parsed, so envvar defaults apply
+    for name, value in portforward.url_defaults().items():
+        os.environ.setdefault(name, value)
 
 
 if __name__ == "__main__":
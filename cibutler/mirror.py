@@ -0,0 +1,336 @@
+"""
+Local pull-through registry mirrors, so recreated minikube and k3d clusters
+pull unchanged CImpl images from the host instead of the internet.
+
+A registry:2 proxy mirrors a single upstream, so each upstream registry gets
+its own container, port and cache volume.
+"""
+
+import os
+import base64
+import logging
+import typer
+import docker
+import requests
+from typing import List
+from typing_extensions import Annotated
+import cibutler.shell as shell
+from cibutler.common import CACHE_DIR, console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+MIRROR_IMAGE = "registry:2"
+CONTAINER_PREFIX = "cibutler-mirror"
+
+# Upstream registry: (remote url, mirror port). Metrics are on port + 100.
+MIRRORS = {
+    "docker.io": ("https://registry-1.docker.io", 5100),
+    "community.opengroup.org:5555": ("https://community.opengroup.org:5555", 5101),
+    "us-central1-docker.pkg.dev": ("https://us-central1-docker.pkg.dev", 5102),
+}
+METRICS_PORT_OFFSET = 100
+
+# How cluster nodes reach the host
+MINIKUBE_HOST = "host.minikube.internal"
+K3D_HOST = "host.k3d.internal"
+
+K3D_REGISTRIES_FILE = os.path.join(CACHE_DIR, "k3d-registries.yaml")
+
+
+def container_name(registry: str):
+    return f"{CONTAINER_PREFIX}-{MIRRORS[registry][1]}"
+
+
+def volume_name(registry: str):
+    return f"{container_name(registry)}-cache"
+
+
+def start_mirror(registry: str):
+    """
+    Start (or create) the mirror container of one upstream registry
+    """
+    client = docker.from_env()
+    name = container_name(registry)
+    remote, port = MIRRORS[registry]
+    try:
+        container = client.containers.get(name)
+        if container.status != "running":
+            container.start()
+        return container
+    except docker.errors.NotFound:
+        pass
+    logger.info(f"Creating registry mirror {name} for {remote} on port {port}")
+    return client.containers.run(
+        MIRROR_IMAGE,
+        name=name,
+        detach=True,
+        restart_policy={"Name": "unless-stopped"},
+        environment={
+            "REGISTRY_PROXY_REMOTEURL": remote,
+            "REGISTRY_HTTP_DEBUG_ADDR": "0.0.0.0:5001",
+            "REGISTRY_HTTP_DEBUG_PROMETHEUS_ENABLED": "true",
+        },
+        # Cluster nodes reach the mirror through the docker host gateway,
+        # metrics are only read from the host
+        ports={
+            "5000/tcp": port,
+            "5001/tcp": ("127.0.0.1", port + METRICS_PORT_OFFSET),
+        },
+        volumes={volume_name(registry): {"bind": "/var/lib/registry", "mode": "rw"}},
+        labels={"cibutler.mirror": registry},
+    )
+
+
+def stop_mirrors(remove: bool = False):
+    """
+    Stop the mirror containers, remove also deletes the cached images
+    """
+    client = docker.from_env()
+    for registry in MIRRORS:
+        try:
+            container = client.containers.get(container_name(registry))
+        except docker.errors.NotFound:
+            continue
+        container.stop()
+        if remove:
+            container.remove()
+            try:
+                client.volumes.get(volume_name(registry)).remove()
+            except docker.errors.NotFound:
+                pass
+
+
+def running():
+    """
+    Upstream registries with a running mirror, empty when docker is unavailable
+    """
+    try:
+        client = docker.from_env()
+        containers = client.containers.list(filters={"label": "cibutler.mirror"})
+    except Exception as err:
+        logger.debug(f"Unable to list registry mirrors: {err}")
+        return []
+    return [
+        c.labels["cibutler.mirror"]
+        for c in containers
+        if c.labels.get("cibutler.mirror") in MIRRORS
+    ]
+
+
+def parse_metrics(text: str):
+    """
+    Sum the registry_proxy_* counters of a prometheus text page, by name
+    """
+    totals = {}
+    for line in text.splitlines():
+        if not line.startswith("registry_proxy_"):
+            continue
+        name = line.split("{")[0].split(" ")[0]
+        try:
+            value = float(line.rsplit(" ", 1)[1])
+        except (IndexError, ValueError):
+            continue
+        totals[name] = totals.get(name, 0) + value
+    return totals
+
+
+def stats():
+    """
+    Hits, misses and bytes served from cache, summed over the running mirrors.
+    None when no mirror is running.
+    """
+    registries = running()
+    if not registries:
+        return None
+    result = {"hits": 0, "misses": 0, "pulled_bytes": 0, "served_bytes": 0}
+    for registry in registries:
+        port = MIRRORS[registry][1] + METRICS_PORT_OFFSET
+        try:
+            r = requests.get(f"http://127.0.0.1:{port}/metrics", timeout=5)
+            r.raise_for_status()
+        except requests.RequestException as err:
+            logger.info(f"Unable to read metrics of mirror {registry}: {err}")
+            continue
+        metrics = parse_metrics(r.text)
+        result["hits"] += metrics.get("registry_proxy_hits_total", 0)
+        result["misses"] += metrics.get("registry_proxy_misses_total", 0)
+        result["pulled_bytes"] += metrics.get("registry_proxy_pulled_bytes_total", 0)
+        result["served_bytes"] += metrics.get("registry_proxy_pushed_bytes_total", 0)
+    return result
+
+
+def stats_since(before: dict, after: dict):
+    """
+    Counters of after less before, what the mirrors did in between. A mirror
+    restarted in between resets its counters, so none go below zero.
+    """
+    if not after:
+        return None
+    before = before or {}
+    return {name: max(value - before.get(name, 0), 0) for name, value in after.items()}
+
+
+def stats_message(result: dict):
+    requests_total = result["hits"] + result["misses"]
+    rate = 100 * result["hits"] / requests_total if requests_total else 0
+    saved = max(result["served_bytes"] - result["pulled_bytes"], 0)
+    return (
+        f"{result['hits']:.0f} hits / {result['misses']:.0f} misses ({rate:.0f}%), "
+        f"{saved / 1024 / 1024 / 1024:.2f} GiB served from cache"
+    )
+
+
+def registry_mirror_url(host: str = MINIKUBE_HOST):
+    """
+    minikube --registry-mirror, it only covers docker.io. The other
+    registries are set up with configure_minikube_containerd.
+    """
+    if "docker.io" not in running():
+        return None
+    return f"http://{host}:{MIRRORS['docker.io'][1]}"
+
+
+def insecure_registries(host: str = MINIKUBE_HOST):
+    """
+    minikube --insecure-registry values, the mirrors serve plain http
+    """
+    return [f"{host}:{MIRRORS[registry][1]}" for registry in running()]
+
+
+def hosts_toml(registry: str, host: str = MINIKUBE_HOST):
+    """
+    containerd hosts.toml sending pulls of registry to its mirror first
+    """
+    remote, port = MIRRORS[registry]
+    return (
+        f'server = "{remote}"\n\n'
+        f'[host."http://{host}:{port}"]\n'
+        '  capabilities = ["pull", "resolve"]\n'
+    )
+
+
+def configure_minikube_containerd(profile: str = None, nodes: int = 1):
+    """
+    Point containerd on every minikube node at the running mirrors.
+    containerd reads certs.d per pull, no restart is needed.
+    """
+    cluster = profile or "minikube"
+    node_names = [cluster] + [f"{cluster}-m{n:02d}" for n in range(2, nodes + 1)]
+    for registry in running():
+        config_dir = f"/etc/containerd/certs.d/{registry}"
+        encoded = base64.b64encode(hosts_toml(registry).encode()).decode()
+        script = (
+            f"sudo mkdir -p {config_dir} && echo {encoded} | base64 -d "
+            f"| sudo tee {config_dir}/hosts.toml > /dev/null"
+        )
+        for node in node_names:
+            cmd = ["minikube", "ssh", "-p", cluster, "-n", node, "--", script]
+            output = shell.run(cmd, timeout=shell.QUERY_TIMEOUT)
+            if not output.ok:
+                logger.warning(
+                    f"Unable to configure mirror {registry} on {node}: {output.stderr}"
+                )
+            else:
+                logger.info(f"Registry mirror for {registry} configured on {node}")
+
+
+def k3d_registries(host: str = K3D_HOST, registries: list = None):
+    """
+    k3d registries.yaml for the mirrors
+    """
+    lines = ["mirrors:"]
+    for registry in registries if registries is not None else running():
+        lines += [
+            f'  "{registry}":',
+            "    endpoint:",
+            f"      - http://{host}:{MIRRORS[registry][1]}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def write_k3d_registries(path: str = K3D_REGISTRIES_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(k3d_registries())
+    return path
+
+
+@cli.command(rich_help_panel="CI Commands")
+def mirror(
+    registries: Annotated[
+        List[str],
+        typer.Option(
+            "--registry", "-r", help=f"Registries to mirror: {', '.join(MIRRORS)}"
+        ),
+    ] = None,
+):
+    """
+    Start local pull-through registry mirrors for minikube and k3d :floppy_disk:
+
+    Images pulled once are served from the host to every new cluster.
+    """
+    for registry in registries or []:
+        if registry not in MIRRORS:
+            error_console.print(
+                f":x: No mirror for {registry}, choose from {', '.join(MIRRORS)}"
+            )
+            raise typer.Exit(1)
+    try:
+        with console.status("Starting registry mirrors..."):
+            for registry in registries or MIRRORS:
+                start_mirror(registry)
+    except docker.errors.DockerException as err:
+        error_console.print(f":x: Unable to start registry mirrors: {err}")
+        raise typer.Exit(1)
+    for registry in running():
+        console.print(
+            f":white_check_mark: {registry} mirrored on port {MIRRORS[registry][1]}"
+        )
+    path = write_k3d_registries()
+    console.print(
+        ":information: minikube installs use the mirrors while they run. "
+        f"For k3d: [code]k3d cluster create --registry-config {path}[/code]"
+    )
+
+
+@cli.command(rich_help_panel="CI Commands")
+def mirror_stop(
+    remove: Annotated[
+        bool, typer.Option("--remove", help="Also delete the cached images")
+    ] = False,
+):
+    """
+    Stop the local registry mirrors
+    """
+    try:
+        stop_mirrors(remove=remove)
+    except docker.errors.DockerException as err:
+        error_console.print(f":x: Unable to stop registry mirrors: {err}")
+        raise typer.Exit(1)
+    console.print(":white_check_mark: Registry mirrors stopped")
+
+
+@diag_cli.command(rich_help_panel="Docker Diagnostic Commands")
+def mirror_stats():
+    """
+    Cache hits and misses of the local registry mirrors
+    """
+    result = stats()
+    if result is None:
+        error_console.print(
+            ":x: No registry mirror running, start one with cibutler mirror"
+        )
+        raise typer.Exit(1)
+    console.print(f":floppy_disk: Registry mirrors: {stats_message(result)}")
+
+
+if __name__ == "__main__":
+    cli()
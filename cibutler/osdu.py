@@ -7,10 +7,12 @@ from rich.table import Table
 from typing import Optional, List
 import tenacity
 import json
+import time
 from pathlib import Path
 from typing_extensions import Annotated
 from io import StringIO
 from osdu_api.auth.refresh_token import BaseTokenRefresher
+from osdu_api.providers import credentials
 from osdu_api.clients.entitlements.entitlements_client import EntitlementsClient
 from osdu_api.clients.search.search_client import SearchClient
 from osdu_api.clients.ingestion_workflow.ingestion_workflow_client import (
@@ -22,9 +24,11 @@ from osdu_api.clients.legal.legal_client import LegalClient
 from osdu_api.model.entitlements.group_member import GroupMember
 from osdu_api.model.search.query_request import QueryRequest
 import cibutler.cimpl as cimpl
+import cibutler.cik8s as cik8s
 import cibutler.conf as conf
 import cibutler.save as save
 import cibutler.utils as utils
+import cibutler.tunnel as tunnel
 import logging
 from cibutler.common import console, error_console
 from rich.console import Console
@@ -47,22 +51,81 @@ diag_cli = typer.Typer(
 BASE_URL = "http://osdu.localhost"
 CLOUD_PROVIDER = "baremetal"
 
+# Keep-alive connections to the ingress, reused across calls (and across
+# commands when running in the cibutler agent)
+session = requests.Session()
+
+# Token refreshers by (kube context, keycloak url, realm, client id):
+# (created, client secret, refresher). The refresher keeps its access token
+# until OSDU answers 401/403.
+REFRESHER_TTL = 600
+_refreshers = {}
+
+
+class CachedTokenRefresher(BaseTokenRefresher):
+    """
+    Token refresher kept in _refreshers. When Keycloak rejects a cached
+    client secret (rotated, or the cluster was reinstalled) the entry is
+    dropped and the token requested once more with the secret read again.
+    """
+
+    def __init__(self, key: tuple):
+        super().__init__()
+        self.key = key
+        self.cached = False
+
+    def refresh_token(self) -> str:
+        try:
+            return super().refresh_token()
+        except tenacity.RetryError:
+            if not self.cached:
+                raise
+        logger.info(
+            f"Token refresh failed with a cached client secret, retrying {self.key}"
+        )
+        _refreshers.pop(self.key, None)
+        self.cached = False
+        client_secret = cimpl.get_keycloak_client_secret()
+        os.environ["KEYCLOAK_CLIENT_SECRET"] = client_secret
+        self._credentials = credentials.get_credentials()
+        token = super().refresh_token()
+        _refreshers[self.key] = (time.time(), client_secret, self)
+        return token
+
 
 def setup(base_url: str, realm: str = "osdu", client_id: str = "osdu-admin"):
     """
     Get a refresh token
     """
-    client_secret = cimpl.get_keycloak_client_secret()
+    if not tunnel.tunnel_up(base_url):
+        error_console.print(
+            f":x: {base_url} is not reachable. Is minikube tunnel up? Try [code]cibutler tunnel-status[/code]"
+        )
+        raise typer.Exit(1)
+    keycloak_url = os.environ.get("KEYCLOAK_URL", "http://keycloak.localhost").rstrip(
+        "/"
+    )
+    # Another context is another cluster, with its own Keycloak secret
+    key = (cik8s.kube_context(), keycloak_url, realm, client_id)
+    cached = _refreshers.get(key)
+    if cached and time.time() - cached[0] < REFRESHER_TTL:
+        client_secret, cimpl_token_refresher = cached[1:]
+        cimpl_token_refresher.cached = True
+    else:
+        client_secret = cimpl.get_keycloak_client_secret()
+        cimpl_token_refresher = None
     os.environ["KEYCLOAK_AUTH_URL"] = (
-        f"http://keycloak.localhost/realms/{realm}/protocol/openid-connect/token"
+        f"{keycloak_url}/realms/{realm}/protocol/openid-connect/token"
     )
     os.environ["KEYCLOAK_CLIENT_ID"] = client_id
     os.environ["KEYCLOAK_CLIENT_SECRET"] = client_secret
     os.environ["CLOUD_PROVIDER"] = CLOUD_PROVIDER
     os.environ["BASE_URL"] = base_url
+    if cimpl_token_refresher:
+        return cimpl_token_refresher
 
     try:
-        cimpl_token_refresher = BaseTokenRefresher()
+        cimpl_token_refresher = CachedTokenRefresher(key)
         # token = cimpl_token_refresher.refresh_token()
         # if not token:
         # error_console.print("Error getting token")
@@ -70,6 +133,7 @@ def setup(base_url: str, realm: str = "osdu", client_id: str = "osdu-admin"):
         error_console.print("RetryError when attempting to get refresh token")
         console.print("Is minikube tunnel up?")
         raise typer.Exit(1)
+    _refreshers[key] = (time.time(), client_secret, cimpl_token_refresher)
     return cimpl_token_refresher
 
 
@@ -932,7 +996,7 @@ def workflows(
 def get_info(endpt, base_url=BASE_URL, timeout=5):
     url = base_url + endpt + "/info"
     try:
-        r = requests.get(url, timeout=timeout)
+        r = session.get(url, timeout=timeout)
     except requests.exceptions.Timeout:
         error_console.print(f"timeout: {url}")
         return None
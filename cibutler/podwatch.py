@@ -0,0 +1,384 @@
+import abc
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+import rich.box
+from rich.table import Table
+from kubernetes import client, config, watch
+from kubernetes.client.rest import ApiException
+import cibutler.utils as utils
+
+logger = logging.getLogger(__name__)
+
+
+def pod_state(pod):
+    """
+    Summarise a V1Pod into the fields shown on the progress dashboard
+    """
+    statuses = pod.status.container_statuses or []
+    init_statuses = pod.status.init_container_statuses or []
+    restarts = sum(s.restart_count or 0 for s in statuses + init_statuses)
+
+    # A pod is "not ready" when one of its containers is waiting, which matches
+    # what get_pods_not_running reports, or when it has not been scheduled yet.
+    reason = None
+    for status in init_statuses:
+        if status.state and status.state.waiting and status.state.waiting.reason:
+            reason = f"Init:{status.state.waiting.reason}"
+    for status in statuses:
+        if status.state and status.state.waiting:
+            reason = status.state.waiting.reason or "Waiting"
+    waiting = any(s.state and s.state.waiting for s in statuses)
+
+    message = None
+    last_terminated = None
+    for status in statuses:
+        if status.state and status.state.waiting and status.state.waiting.message:
+            message = status.state.waiting.message
+        if status.last_state and status.last_state.terminated:
+            last_terminated = status.last_state.terminated.reason
+
+    ready_at = None
+    scheduling_message = None
+    for condition in pod.status.conditions or []:
+        if condition.type == "Ready" and condition.status == "True":
+            ready_at = condition.last_transition_time
+        elif condition.type == "PodScheduled" and condition.status == "False":
+            reason = reason or condition.reason or "Pending"
+            scheduling_message = condition.message
+
+    # Replacement pods (delete-pod) keep the owner but get a new name, a
+    # rollout restart also gets a new ReplicaSet but keeps the Deployment
+    owner = None
+    workload = None
+    for reference in getattr(pod.metadata, "owner_references", None) or []:
+        if reference.controller:
+            owner = workload = f"{reference.kind}/{reference.name}"
+            template_hash = (pod.metadata.labels or {}).get("pod-template-hash")
+            if (
+                reference.kind == "ReplicaSet"
+                and template_hash
+                and reference.name.endswith(f"-{template_hash}")
+            ):
+                workload = f"Deployment/{reference.name[: -len(template_hash) - 1]}"
+
+    phase = pod.status.phase or "Unknown"
+    pending = phase == "Pending" and not statuses
+    if pending and not reason:
+        reason = "Pending"
+
+    return {
+        "name": pod.metadata.name,
+        "owner": owner,
+        "workload": workload,
+        "phase": phase,
+        "ready": ready_at is not None or phase == "Succeeded",
+        "not_ready": waiting or pending,
+        "restarts": restarts,
+        "reason": reason,
+        "message": message,
+        "last_terminated": last_terminated,
+        "scheduling_message": scheduling_message,
+        "created": pod.metadata.creation_timestamp,
+        "ready_at": ready_at,
+    }
+
+
+# Reasons a container flips between while one fault persists
+REASON_GROUPS = {"ErrImagePull": "ImagePull", "ImagePullBackOff": "ImagePull"}
+
+
+def reason_group(reason: str):
+    return REASON_GROUPS.get(reason, reason)
+
+
+def track_state(state: dict, previous: dict = None):
+    """
+    Carry over how long a pod has been stuck on its current reason, and the
+    restart count when the pod was first seen. A crash loop flips between
+    CrashLoopBackOff and running, the baseline is kept across those flips.
+    """
+    if previous and reason_group(previous["reason"]) == reason_group(state["reason"]):
+        state["reason_since"] = previous["reason_since"]
+    else:
+        state["reason_since"] = time.time()
+    state["restarts_baseline"] = (
+        previous["restarts_baseline"] if previous else state["restarts"]
+    )
+    return state
+
+
+def deployment_state(deployment):
+    status = deployment.status
+    return {
+        "name": deployment.metadata.name,
+        "replicas": deployment.spec.replicas or 0,
+        "ready": status.ready_replicas or 0,
+        "updated": status.updated_replicas or 0,
+        "available": status.available_replicas or 0,
+    }
+
+
+def helm_release_state(secret):
+    """
+    Summarise a helm release from the labels of its storage secret,
+    without decoding the release payload
+    """
+    labels = secret.metadata.labels or {}
+    return {
+        "name": labels.get("name", secret.metadata.name),
+        "status": labels.get("status", "unknown"),
+        "revision": int(labels.get("version", 0)),
+        "modified": secret.metadata.creation_timestamp,
+    }
+
+
+class ResourceWatcher(abc.ABC):
+    """
+    Keep an up to date view of one kind of resource in a namespace from a
+    single watch stream. on_change is called (on the watch thread) after
+    every change.
+    """
+
+    kind = "resource"
+    label_selector = None
+
+    def __init__(self, namespace: str = "default", on_change=None):
+        self.namespace = namespace
+        self.on_change = on_change
+        self.items = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watch = None
+        self._thread = None
+        self._api = None
+        self._resource_version = None
+
+    @abc.abstractmethod
+    def list_function(self):
+        """
+        The namespaced list API method of the resource
+        """
+
+    def key(self, obj):
+        return obj.metadata.name
+
+    @abc.abstractmethod
+    def summarize(self, obj, previous: dict = None):
+        """
+        State dict of one resource, previous is its last state
+        """
+
+    def start(self):
+        """
+        List the resources once and start following changes in the background.
+        Returns False if the kubernetes API is not reachable.
+        """
+        try:
+            config.load_kube_config()
+            self._relist()
+        except Exception as err:
+            logger.warning(
+                f"Unable to start {self.kind} watch in {self.namespace}: {err}"
+            )
+            return False
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"{self.kind}-watch-{self.namespace}", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._watch:
+            self._watch.stop()
+
+    def _list_kwargs(self):
+        if self.label_selector:
+            return {"label_selector": self.label_selector}
+        return {}
+
+    def _relist(self):
+        response = self.list_function()(self.namespace, **self._list_kwargs())
+        with self._lock:
+            previous = self.items
+            self.items = {}
+            for obj in response.items:
+                key = self.key(obj)
+                self.items[key] = self.summarize(obj, previous.get(key))
+        self._resource_version = response.metadata.resource_version
+        self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            try:
+                self.on_change(self)
+            except Exception as err:
+                logger.warning(f"{self.kind} watch callback failed: {err}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._watch = watch.Watch()
+            try:
+                for event in self._watch.stream(
+                    self.list_function(),
+                    self.namespace,
+                    resource_version=self._resource_version,
+                    timeout_seconds=60,
+                    **self._list_kwargs(),
+                ):
+                    obj = event["object"]
+                    self._resource_version = obj.metadata.resource_version
+                    self.update(event["type"], obj)
+                    if self._stop.is_set():
+                        break
+            except ApiException as err:
+                if err.status == 410:
+                    # Resource version too old, start again from a fresh list
+                    logger.info(f"{self.kind} watch expired, relisting")
+                    try:
+                        self._relist()
+                    except Exception as list_err:
+                        logger.warning(f"Unable to relist {self.kind}: {list_err}")
+                        self._stop.wait(5)
+                else:
+                    logger.warning(f"{self.kind} watch error: {err}")
+                    self._stop.wait(5)
+            except Exception as err:
+                logger.warning(f"{self.kind} watch error: {err}")
+                self._stop.wait(5)
+
+    def update(self, event_type: str, obj):
+        key = self.key(obj)
+        with self._lock:
+            if event_type == "DELETED":
+                self.items.pop(key, None)
+            else:
+                self.items[key] = self.summarize(obj, self.items.get(key))
+        self._changed()
+
+    def states(self):
+        with self._lock:
+            return [dict(state) for _, state in sorted(self.items.items())]
+
+
+class PodWatcher(ResourceWatcher):
+    """
+    Keep an up to date view of the pods in a namespace from a single watch stream
+    """
+
+    kind = "pod"
+
+    @property
+    def pods(self):
+        return self.items
+
+    def list_function(self):
+        if self._api is None:
+            self._api = client.CoreV1Api()
+        return self._api.list_namespaced_pod
+
+    def summarize(self, pod, previous: dict = None):
+        return track_state(pod_state(pod), previous)
+
+    def not_ready(self):
+        """
+        Pods not ready, as a dict of pod name to waiting reason
+        """
+        return {
+            state["name"]: state["reason"]
+            for state in self.states()
+            if state["not_ready"]
+        }
+
+    def table(self, caption: str = None):
+        """
+        Rich table of pod phase, restarts, waiting reason and time to ready
+        """
+        now = datetime.now(timezone.utc)
+        table = Table(box=rich.box.SIMPLE, caption=caption, caption_justify="left")
+        table.add_column("Pod", style="cyan", no_wrap=True)
+        table.add_column("Phase")
+        table.add_column("Restarts", justify="right")
+        table.add_column("Reason")
+        table.add_column("Ready in", justify="right")
+
+        for state in self.states():
+            if state["ready_at"] and state["created"]:
+                ready_in = utils.convert_time(
+                    (state["ready_at"] - state["created"]).total_seconds()
+                )
+                style = "green"
+            elif state["created"]:
+                ready_in = (
+                    f"({utils.convert_time((now - state['created']).total_seconds())})"
+                )
+                style = "yellow" if state["not_ready"] else None
+            else:
+                ready_in = "-"
+                style = None
+            restarts = state["restarts"]
+            table.add_row(
+                state["name"],
+                state["phase"],
+                f"[red]{restarts}[/red]" if restarts else "0",
+                state["reason"] or "",
+                ready_in,
+                style=style,
+            )
+        return table
+
+
+class DeploymentWatcher(ResourceWatcher):
+    kind = "deployment"
+
+    def list_function(self):
+        if self._api is None:
+            self._api = client.AppsV1Api()
+        return self._api.list_namespaced_deployment
+
+    def summarize(self, deployment, previous: dict = None):
+        return deployment_state(deployment)
+
+
+class HelmReleaseWatcher(ResourceWatcher):
+    """
+    Helm releases from the secrets helm stores them in, latest revision only
+    """
+
+    kind = "helm-release"
+    label_selector = "owner=helm"
+
+    def list_function(self):
+        if self._api is None:
+            self._api = client.CoreV1Api()
+        return self._api.list_namespaced_secret
+
+    def summarize(self, secret, previous: dict = None):
+        return helm_release_state(secret)
+
+    def releases(self):
+        """
+        Latest revision of each release
+        """
+        latest = {}
+        for state in self.states():
+            if state["revision"] >= latest.get(state["name"], {}).get("revision", -1):
+                latest[state["name"]] = state
+        return [latest[name] for name in sorted(latest)]
+
+
+def start_watcher(namespace: str = "default"):
+    """
+    Return a running PodWatcher or None when the API is not available
+    """
+    watcher = PodWatcher(namespace=namespace)
+    started = time.time()
+    if watcher.start():
+        logger.info(
+            f"Pod watch started in {namespace} with {len(watcher.pods)} pods ({time.time() - started:.2f}s)"
+        )
+        return watcher
+    return None
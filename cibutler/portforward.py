@@ -0,0 +1,371 @@
+"""
+Port-forward manager, for clusters without a reachable ingress IP or hosts
+entries.
+
+One background process holds forwards to the istio ingress, Keycloak, MinIO
+and Airflow on stable local ports, using the kubernetes client portforward
+API. Each connection looks up a ready pod behind the service, so forwards
+survive pod restarts.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import select
+import socket
+import logging
+import ipaddress
+import threading
+import subprocess
+import typer
+from typing import List
+from typing_extensions import Annotated
+from kubernetes import client, config
+from kubernetes.stream import portforward
+import cibutler.log as log
+from cibutler.common import CACHE_DIR, console, error_console
+from cibutler.tunnel import pid_alive
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+STATE_FILE = os.path.join(CACHE_DIR, "port-forward.json")
+LOG_FILE = "port-forward.log"
+BIND_ADDRESS = "127.0.0.1"
+BUFFER_SIZE = 64 * 1024
+
+# name: (namespace, service, service port, local port)
+FORWARDS = {
+    "ingress": ("istio-system", "istio-ingress", 80, 8080),
+    "keycloak": ("default", "keycloak", 80, 8180),
+    "minio": ("default", "minio", 9000, 9000),
+    "airflow": ("default", "airflow", 8080, 8280),
+}
+
+
+# Host names the ingress routes on, BASE_URL and KEYCLOAK_URL use them
+INGRESS_HOSTS = {"BASE_URL": "osdu.localhost", "KEYCLOAK_URL": "keycloak.localhost"}
+
+
+class ForwardError(Exception):
+    pass
+
+
+def resolves_to_loopback(host: str):
+    """
+    Whether host resolves to a loopback address. systemd-resolved and
+    browsers resolve *.localhost, plain glibc and macOS need hosts entries.
+    """
+    try:
+        addresses = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except OSError:
+        return False
+    return bool(addresses) and all(
+        ipaddress.ip_address(address[4][0]).is_loopback for address in addresses
+    )
+
+
+class Forward:
+    """
+    Listen on a local port and forward each connection to a ready pod of a
+    service
+    """
+
+    def __init__(self, name, namespace, service, service_port, local_port):
+        self.name = name
+        self.namespace = namespace
+        self.service = service
+        self.service_port = service_port
+        self.local_port = local_port
+        self.connections = 0
+        self.errors = 0
+        self._target = None
+        self._server = None
+
+    def resolve(self):
+        """
+        (pod, container port) behind the service port, cached until a
+        connection fails
+        """
+        if self._target:
+            return self._target
+        api = client.CoreV1Api()
+        service = api.read_namespaced_service(self.service, self.namespace)
+        target_port = self.service_port
+        for port in service.spec.ports or []:
+            if port.port == self.service_port:
+                target_port = port.target_port or port.port
+        selector = ",".join(
+            f"{k}={v}" for k, v in (service.spec.selector or {}).items()
+        )
+        if not selector:
+            raise ForwardError(f"Service {self.service} has no selector")
+        for pod in api.list_namespaced_pod(
+            self.namespace, label_selector=selector
+        ).items:
+            ready = any(
+                c.type == "Ready" and c.status == "True"
+                for c in pod.status.conditions or []
+            )
+            if pod.status.phase != "Running" or not ready:
+                continue
+            port = target_port
+            if isinstance(port, str) and not port.isdigit():
+                # Named target port, from the container ports
+                port = next(
+                    p.container_port
+                    for c in pod.spec.containers
+                    for p in c.ports or []
+                    if p.name == target_port
+                )
+            self._target = (pod.metadata.name, int(port))
+            logger.info(f"Forward {self.name}: {self.service} -> {self._target}")
+            return self._target
+        raise ForwardError(f"No ready pod for service {self.namespace}/{self.service}")
+
+    def _pump(self, conn):
+        try:
+            pod, port = self.resolve()
+            pf = portforward(
+                client.CoreV1Api().connect_get_namespaced_pod_portforward,
+                pod,
+                self.namespace,
+                ports=str(port),
+            )
+            remote = pf.socket(port)
+            remote.setblocking(True)
+            sockets = [conn, remote]
+            while True:
+                readable, _, failed = select.select(sockets, [], sockets, 60)
+                if failed:
+                    break
+                done = False
+                for sock in readable:
+                    data = sock.recv(BUFFER_SIZE)
+                    if not data:
+                        done = True
+                        break
+                    (remote if sock is conn else conn).sendall(data)
+                if done:
+                    break
+            remote.close()
+            error = pf.error(port)
+            if error:
+                raise ForwardError(error)
+        except Exception as err:
+            self.errors += 1
+            # The pod may be gone, look it up again on the next connection
+            self._target = None
+            logger.warning(f"Forward {self.name} connection failed: {err}")
+        finally:
+            conn.close()
+
+    def listen(self):
+        self._server = socket.create_server((BIND_ADDRESS, self.local_port))
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._pump, args=(conn,), daemon=True).start()
+
+    def close(self):
+        if self._server:
+            self._server.close()
+
+
+def read_state():
+    """
+    State of the running manager, None when it is not running
+    """
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if pid_alive(state.get("pid")) else None
+
+
+def url_defaults(state: dict = None):
+    """
+    BASE_URL and KEYCLOAK_URL through the ingress forward, empty when the
+    manager is not running
+    """
+    state = state if state is not None else read_state()
+    if not state or "ingress" not in state.get("ports", {}):
+        return {}
+    # Checked once by the manager, so the CLI does not resolve on every run
+    if not state.get("hosts_resolve"):
+        return {}
+    port = state["ports"]["ingress"]
+    # The ingress routes by host name
+    return {name: f"http://{host}:{port}" for name, host in INGRESS_HOSTS.items()}
+
+
+def serve_forwards(names: list = None):
+    """
+    Run the forwards until SIGTERM or Ctrl-C
+    """
+    log.use_logfile(log.daemon_logfile("port-forward"))
+    config.load_kube_config()
+    forwards = []
+    for name in names or FORWARDS:
+        forward = Forward(name, *FORWARDS[name])
+        try:
+            forward.listen()
+        except OSError as err:
+            logger.error(f"Unable to listen on {forward.local_port} for {name}: {err}")
+            continue
+        threading.Thread(target=forward.serve, daemon=True).start()
+        forwards.append(forward)
+    if not forwards:
+        raise ForwardError("No port could be forwarded")
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(STATE_FILE, "w") as f:
+        json.dump(
+            {
+                "pid": os.getpid(),
+                "ports": {fw.name: fw.local_port for fw in forwards},
+                "hosts_resolve": all(
+                    resolves_to_loopback(host) for host in INGRESS_HOSTS.values()
+                ),
+            },
+            f,
+            indent=2,
+        )
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    try:
+        while not stopped.wait(1):
+            pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for forward in forwards:
+            forward.close()
+        if os.path.exists(STATE_FILE):
+            os.remove(STATE_FILE)
+
+
+def start_background(names: list = None):
+    state = read_state()
+    if state:
+        return state
+    cmd = [sys.executable, "-m", "cibutler.main", "diag", "port-forward-serve"]
+    for name in names or []:
+        cmd += ["--forward", name]
+    with open(LOG_FILE, "a") as output:
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=output,
+            stderr=output,
+            start_new_session=True,
+        )
+    # The manager writes its state once the ports are bound
+    deadline = time.time() + 30
+    while time.time() < deadline and proc.poll() is None:
+        state = read_state()
+        if state:
+            return state
+        time.sleep(0.5)
+    raise ForwardError(f"Port-forward manager did not start, see {LOG_FILE}")
+
+
+def print_state(state: dict):
+    for name, port in state["ports"].items():
+        namespace, service, service_port, _ = FORWARDS[name]
+        console.print(
+            f":link: {name}: {BIND_ADDRESS}:{port} -> {namespace}/{service}:{service_port}"
+        )
+    for key, value in url_defaults(state).items():
+        console.print(f"{key}={value}")
+    if "ingress" in state["ports"] and not state.get("hosts_resolve"):
+        console.print(
+            f"[yellow]:warning: {' and '.join(INGRESS_HOSTS.values())} do not resolve to "
+            f"{BIND_ADDRESS}, BASE_URL and KEYCLOAK_URL are not defaulted. Add them to "
+            "/etc/hosts to use the forwarded ingress.[/yellow]"
+        )
+
+
+@diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands", hidden=True)
+def port_forward_serve(
+    forward: Annotated[
+        List[str], typer.Option("--forward", help="Forwards to run (default all)")
+    ] = None,
+):
+    """
+    Run the port-forward manager in the foreground
+    """
+    serve_forwards(forward)
+
+
+@cli.command(rich_help_panel="CI Commands")
+def port_forward(
+    forward: Annotated[
+        List[str],
+        typer.Option("--forward", "-f", help=f"Forwards to run: {', '.join(FORWARDS)}"),
+    ] = None,
+    background: Annotated[
+        bool, typer.Option("--background", "-b", help="Run in background")
+    ] = False,
+):
+    """
+    Forward OSDU, Keycloak, MinIO and Airflow to stable local ports :link:
+
+    For clusters without ingress IP or hosts entries. While it runs, BASE_URL
+    and KEYCLOAK_URL default to the forwarded ingress.
+    """
+    for name in forward or []:
+        if name not in FORWARDS:
+            error_console.print(
+                f":x: Unknown forward {name}, choose from {', '.join(FORWARDS)}"
+            )
+            raise typer.Exit(1)
+    if background:
+        try:
+            state = start_background(forward)
+        except ForwardError as err:
+            error_console.print(f":x: {err}")
+            raise typer.Exit(1)
+        console.print(
+            f":white_check_mark: Port-forward manager running, pid {state['pid']}"
+        )
+        print_state(state)
+        return
+    console.print("Forwarding, press Ctrl-C to stop")
+    try:
+        serve_forwards(forward)
+    except ForwardError as err:
+        error_console.print(f":x: {err}")
+        raise typer.Exit(1)
+
+
+@cli.command(rich_help_panel="CI Commands")
+def port_forward_stop():
+    """
+    Stop the background port-forward manager
+    """
+    state = read_state()
+    if not state:
+        console.print("No port-forward manager running")
+        return
+    os.kill(state["pid"], signal.SIGTERM)
+    console.print(":white_check_mark: Port-forward manager stopped")
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,34 +1,265 @@
+"""
+Running external commands (helm, kubectl, gcloud, minikube).
+
+Commands run as asyncio subprocesses: stdout and stderr are captured, and
+with stream also logged and printed line by line as they arrive. Without
+capture the command writes straight to the terminal, so prompts that do not
+end a line show. A timeout kills the command. Every finished command is passed to the timing hooks.
+run_many runs independent commands concurrently and can stop the others
+at the first failure.
+"""
+
+import time
 import shlex
+import asyncio
 import logging
 import subprocess
-from rich.console import Console
+from cibutler.common import console, error_console
 
-console = Console()
-error_console = Console(stderr=True, style="bold red")
+logger = logging.getLogger(__name__)
 
+# Called with the CommandResult of every finished command
+timing_hooks = []
 
-def run_shell_command(command_line):
-    command_line_args = shlex.split(command_line)
+# For quick kubectl and helm queries, so a hung API server does not hang the
+# CLI
+QUERY_TIMEOUT = 60
+# For helm uninstall and kubectl delete, which wait for hooks and finalizers
+ACTION_TIMEOUT = 600
 
-    logging.info('Subprocess: "' + command_line + '"')
-    logging.info(command_line_args)
+# Longest output line read, kubectl jsonpath output is a single line
+READ_LIMIT = 16 * 1024 * 1024
 
-    try:
-        subprocess.call(
-            command_line_args,
-            # stdout=subprocess.DEVNULL,  # Suppress standard output
-            # stderr=subprocess.STDOUT,    # Redirect standard error to standard output
-            # shell=False,                 # Use shell=False for security reasons
+
+class CommandResult:
+    """
+    Outcome of one command. returncode is None when it timed out, was
+    cancelled or its output could not be read, 127 when it was not found.
+    """
+
+    def __init__(self, args, returncode=None, stdout="", stderr="", seconds=0.0):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.seconds = seconds
+        self.timed_out = False
+        self.cancelled = False
+        self.unreadable = False
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def command(self):
+        return shlex.join(self.args)
+
+    @property
+    def output(self):
+        """
+        stdout, or stderr when there is no stdout (helm and kubectl errors)
+        """
+        return (self.stdout or self.stderr).strip()
+
+    def __repr__(self):
+        return f"CommandResult({self.command!r}, returncode={self.returncode}, seconds={self.seconds:.2f})"
+
+
+def add_timing_hook(hook):
+    timing_hooks.append(hook)
+
+
+def log_timing(result: CommandResult):
+    if result.cancelled:
+        logger.info(f"Subprocess cancelled: {result.command}")
+    elif result.unreadable:
+        logger.warning(f"Subprocess killed, unreadable output: {result.command}")
+    elif result.timed_out:
+        logger.warning(
+            f"Subprocess timed out after {result.seconds:.1f}s: {result.command}"
         )
-    except (OSError, subprocess.CalledProcessError) as exception:
-        logging.info("Exception occurred: " + str(exception))
-        logging.info("Subprocess failed")
-        return False
     else:
-        # no exception was raised
-        logging.info("Subprocess finished")
+        logger.info(
+            f"Subprocess exit {result.returncode} in {result.seconds:.1f}s: {result.command}"
+        )
+
+
+add_timing_hook(log_timing)
+
+
+def split(command):
+    return shlex.split(command) if isinstance(command, str) else list(command)
+
+
+async def _read(reader, lines: list, name: str, stream: bool, stderr: bool):
+    async for raw in reader:
+        line = raw.decode("utf-8", errors="replace").rstrip("\n")
+        lines.append(line)
+        if stream:
+            logger.info(f"{name}: {line}")
+            (error_console if stderr else console).print(
+                line, markup=False, highlight=False, emoji=False
+            )
+
+
+async def _write(writer, text: str):
+    try:
+        writer.write(text.encode("utf-8"))
+        await writer.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # The command exited without reading all of it
+        pass
+    finally:
+        writer.close()
+
+
+async def run_async(
+    command,
+    timeout: float = None,
+    stream: bool = False,
+    stdin=subprocess.DEVNULL,
+    env: dict = None,
+    cwd: str = None,
+    capture: bool = True,
+    input: str = None,
+    stdout_file=None,
+):
+    """
+    Run command (a string is split like a shell would), returns a
+    CommandResult. It never raises for a failing or missing command.
+    Without capture stdout and stderr are inherited and left empty in the
+    result. input is written to stdin, stdout_file (a binary file) takes
+    stdout in place of the result, for archives.
+    """
+    output = asyncio.subprocess.PIPE if capture else None
+    if input is not None:
+        stdin = asyncio.subprocess.PIPE
+    args = split(command)
+    result = CommandResult(args)
+    stdout, stderr = [], []
+    start = time.time()
+    logger.info(f'Subprocess: "{result.command}"')
+    try:
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=stdin,
+                stdout=output if stdout_file is None else stdout_file,
+                stderr=output,
+                env=env,
+                cwd=cwd,
+                limit=READ_LIMIT,
+            )
+        except OSError as err:
+            result.returncode = 127
+            stderr.append(str(err))
+            return result
+        try:
+            readers = []
+            if capture:
+                readers.append(_read(proc.stderr, stderr, args[0], stream, True))
+                if stdout_file is None:
+                    readers.append(_read(proc.stdout, stdout, args[0], stream, False))
+            if input is not None:
+                readers.append(_write(proc.stdin, input))
+            await asyncio.wait_for(asyncio.gather(*readers, proc.wait()), timeout)
+            result.returncode = proc.returncode
+        except ValueError as err:
+            # A line longer than READ_LIMIT, the rest of the output is lost
+            result.unreadable = True
+            stderr.append(f"Unable to read output: {err}")
+            if proc.returncode is None:
+                proc.kill()
+            await proc.wait()
+        except asyncio.TimeoutError:
+            result.timed_out = True
+            proc.kill()
+            await proc.wait()
+        except asyncio.CancelledError:
+            result.cancelled = True
+            proc.kill()
+            await proc.wait()
+            raise
+    finally:
+        result.stdout = "\n".join(stdout)
+        result.stderr = "\n".join(stderr)
+        result.seconds = time.time() - start
+        for hook in timing_hooks:
+            hook(result)
+    return result
+
+
+async def run_many_async(
+    commands: list,
+    timeout: float = None,
+    stream: bool = False,
+    fail_fast: bool = False,
+    limit: int = 8,
+):
+    """
+    Run commands concurrently, at most limit at a time. With fail_fast the
+    first failure cancels the others. Results are in the order of commands.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(command):
+        async with semaphore:
+            return await run_async(command, timeout=timeout, stream=stream)
+
+    tasks = [asyncio.ensure_future(bounded(command)) for command in commands]
+    if fail_fast:
+        for finished in asyncio.as_completed(tasks):
+            if not (await finished).ok:
+                for task in tasks:
+                    task.cancel()
+                break
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = []
+    for command, task in zip(commands, tasks):
+        if task.cancelled() or task.exception():
+            result = CommandResult(split(command))
+            result.cancelled = True
+            results.append(result)
+        else:
+            results.append(task.result())
+    return results
+
+
+def run(command, timeout: float = None, stream: bool = False, **kwargs):
+    """
+    Run one command, see run_async
+    """
+    return asyncio.run(run_async(command, timeout=timeout, stream=stream, **kwargs))
+
+
+def run_many(
+    commands: list,
+    timeout: float = None,
+    stream: bool = False,
+    fail_fast: bool = False,
+    limit: int = 8,
+):
+    """
+    Run independent commands concurrently, see run_many_async
+    """
+    return asyncio.run(
+        run_many_async(
+            commands, timeout=timeout, stream=stream, fail_fast=fail_fast, limit=limit
+        )
+    )
+
 
-    return True
+def run_shell_command(command_line, timeout: float = None):
+    """
+    Run a command showing its output, returns True when it exits 0
+    """
+    # stdin and the output are inherited, some commands (gcloud) may prompt
+    result = run(command_line, timeout=timeout, stdin=None, capture=False)
+    if not result.ok:
+        logger.info(f"Subprocess failed with exit {result.returncode}")
+    return result.ok
 
 
 if __name__ == "__main__":
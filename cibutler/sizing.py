@@ -0,0 +1,292 @@
+import typer
+import math
+import logging
+import ruamel.yaml
+import rich.box
+from rich.table import Table
+from typing_extensions import Annotated
+from kubernetes.utils import parse_quantity
+import cibutler.cidocker as cidocker
+import cibutler.shell as shell
+from cibutler.cimpl import helm_service_values
+from cibutler.config import SERVICE_FLAG_MAP
+from cibutler.common import console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+WORKLOAD_KINDS = ["Deployment", "StatefulSet", "DaemonSet", "ReplicaSet", "Job", "Pod"]
+
+# Assumed for containers that do not declare requests
+DEFAULT_CPU_REQUEST = 0.1
+DEFAULT_MEMORY_REQUEST = 256 * 1024 * 1024
+
+# Kubernetes control plane, istio and kube-system pods on the minikube node
+OVERHEAD_CPU = 2
+OVERHEAD_MEMORY_GB = 4
+
+GB = 1024 * 1024 * 1024
+
+
+def render_chart(
+    version: str, source: str, values: list = None, values_files: list = None
+):
+    """
+    Render the chart with helm template and return the manifest text
+    """
+    cmd = ["helm", "template", "cimpl-sizing", source]
+    if source.startswith("oci://"):
+        cmd += ["--version", version]
+    for value in values or []:
+        cmd += ["--set", value]
+    for path in values_files or []:
+        cmd += ["-f", path]
+    logger.info(f"Rendering chart for sizing: {source} {version}")
+    result = shell.run(cmd, timeout=shell.QUERY_TIMEOUT)
+    if not result.ok:
+        logger.error(f"helm template failed: {result.stderr}")
+        return None
+    return result.stdout
+
+
+def load_manifests(text: str):
+    yaml = ruamel.yaml.YAML(typ="safe", pure=True)
+    yaml.allow_duplicate_keys = True
+    return [doc for doc in yaml.load_all(text) if isinstance(doc, dict)]
+
+
+def _quantity(resources: dict, key: str, name: str):
+    value = (resources or {}).get(key, {}) or {}
+    if name in value and value[name] is not None:
+        return float(parse_quantity(value[name]))
+    return None
+
+
+def pod_resources(pod_spec: dict):
+    """
+    Effective cpu/memory requests and limits of one pod.
+
+    Containers run together so they add up, init containers run one at a
+    time so only the largest counts, as the scheduler does.
+    """
+    totals = {
+        "cpu_request": 0.0,
+        "memory_request": 0.0,
+        "cpu_limit": 0.0,
+        "memory_limit": 0.0,
+        "unset": 0,
+    }
+    for container in pod_spec.get("containers") or []:
+        resources = container.get("resources") or {}
+        cpu = _quantity(resources, "requests", "cpu")
+        memory = _quantity(resources, "requests", "memory")
+        if cpu is None or memory is None:
+            totals["unset"] += 1
+        cpu = cpu if cpu is not None else DEFAULT_CPU_REQUEST
+        memory = memory if memory is not None else DEFAULT_MEMORY_REQUEST
+        totals["cpu_request"] += cpu
+        totals["memory_request"] += memory
+        totals["cpu_limit"] += _quantity(resources, "limits", "cpu") or cpu
+        totals["memory_limit"] += _quantity(resources, "limits", "memory") or memory
+
+    for container in pod_spec.get("initContainers") or []:
+        resources = container.get("resources") or {}
+        for name in ["cpu", "memory"]:
+            request = _quantity(resources, "requests", name) or 0
+            limit = _quantity(resources, "limits", name) or request
+            totals[f"{name}_request"] = max(totals[f"{name}_request"], request)
+            totals[f"{name}_limit"] = max(totals[f"{name}_limit"], limit)
+    return totals
+
+
+def workload_resources(manifests: list):
+    """
+    Resources of each workload in the rendered chart, multiplied by replicas
+    """
+    workloads = []
+    for doc in manifests:
+        kind = doc.get("kind")
+        if kind not in WORKLOAD_KINDS:
+            continue
+        spec = doc.get("spec") or {}
+        if kind == "Pod":
+            pod_spec = spec
+            replicas = 1
+        else:
+            pod_spec = (spec.get("template") or {}).get("spec") or {}
+            if kind == "Job":
+                replicas = spec.get("parallelism", 1)
+            else:
+                replicas = spec.get("replicas", 1)
+        if replicas is None:
+            replicas = 1
+        totals = pod_resources(pod_spec)
+        workload = {
+            "kind": kind,
+            "name": (doc.get("metadata") or {}).get("name", "unknown"),
+            "replicas": replicas,
+        }
+        for key in ["cpu_request", "memory_request", "cpu_limit", "memory_limit"]:
+            workload[key] = totals[key] * replicas
+        workload["unset"] = totals["unset"]
+        workloads.append(workload)
+    return workloads
+
+
+def totals(workloads: list):
+    result = {
+        "cpu_request": 0.0,
+        "memory_request": 0.0,
+        "cpu_limit": 0.0,
+        "memory_limit": 0.0,
+        "unset": 0,
+    }
+    for workload in workloads:
+        # Jobs (bootstraps) are short lived, they only need to fit, not add up
+        if workload["kind"] == "Job":
+            continue
+        for key in result:
+            result[key] += workload[key]
+    jobs = [w for w in workloads if w["kind"] == "Job"]
+    if jobs:
+        result["cpu_request"] += max(w["cpu_request"] for w in jobs)
+        result["memory_request"] += max(w["memory_request"] for w in jobs)
+    return result
+
+
+def recommend(
+    total: dict,
+    host_cpus: int,
+    host_memory_gb: float,
+    headroom: float = 0.25,
+):
+    """
+    Recommend minikube cpus and memory (GB) from the summed requests.
+
+    The minimum is requests plus headroom and node overhead. Memory is raised
+    towards the summed limits when the host can afford it. too_small is set
+    when the host cannot fit the minimum.
+    """
+    min_cpus = math.ceil(total["cpu_request"] * (1 + headroom) + OVERHEAD_CPU)
+    min_memory_gb = math.ceil(
+        total["memory_request"] * (1 + headroom) / GB + OVERHEAD_MEMORY_GB
+    )
+    limit_memory_gb = math.ceil(total["memory_limit"] / GB + OVERHEAD_MEMORY_GB)
+
+    # Leave the host (docker itself) a little room
+    available_memory_gb = math.floor(host_memory_gb) - 1
+    cpus = max(min_cpus, 2)
+    memory_gb = max(min_memory_gb, min(limit_memory_gb, available_memory_gb))
+    return {
+        "cpus": min(cpus, host_cpus) if host_cpus else cpus,
+        "memory_gb": min(memory_gb, available_memory_gb),
+        "min_cpus": min_cpus,
+        "min_memory_gb": min_memory_gb,
+        "limit_memory_gb": limit_memory_gb,
+        "too_small": min_cpus > host_cpus or min_memory_gb > available_memory_gb,
+    }
+
+
+def size_install(
+    version: str,
+    source: str,
+    selected_services: list = None,
+    values_files: list = None,
+):
+    """
+    Render the chart for the selected services and recommend minikube sizing.
+    Returns (recommendation, workloads) or (None, None) when the chart can not
+    be rendered.
+    """
+    if selected_services is None:
+        selected_services = list(SERVICE_FLAG_MAP.keys())
+    text = render_chart(
+        version, source, helm_service_values(selected_services), values_files
+    )
+    if not text:
+        return None, None
+    workloads = workload_resources(load_manifests(text))
+    if not workloads:
+        logger.warning(f"No workloads found rendering {source} {version}")
+        return None, None
+    total = totals(workloads)
+    host_cpus = cidocker.docker_info_ncpu()
+    host_memory_gb = cidocker.docker_info_memtotal() / GB
+    recommendation = recommend(total, host_cpus, host_memory_gb)
+    recommendation.update(total)
+    recommendation["host_cpus"] = host_cpus
+    recommendation["host_memory_gb"] = host_memory_gb
+    logger.info(f"Sizing for {version}: {recommendation}")
+    return recommendation, workloads
+
+
+def display_recommendation(recommendation: dict):
+    console.print(
+        f":information: Chart requests {recommendation['cpu_request']:.1f} CPU / {recommendation['memory_request'] / GB:.1f}GB, "
+        f"limits {recommendation['cpu_limit']:.1f} CPU / {recommendation['memory_limit'] / GB:.1f}GB"
+    )
+    if recommendation["unset"]:
+        console.print(
+            f":information: {recommendation['unset']} containers do not declare requests, assumed {DEFAULT_CPU_REQUEST} CPU / {DEFAULT_MEMORY_REQUEST // 1024 // 1024}Mi each"
+        )
+    if recommendation["too_small"]:
+        error_console.print(
+            f":warning: Docker has {recommendation['host_cpus']} CPU / {recommendation['host_memory_gb']:.1f}GB, "
+            f"the selected services need at least {recommendation['min_cpus']} CPU / {recommendation['min_memory_gb']}GB. "
+            "Give docker more resources or deselect services."
+        )
+    console.print(
+        f":pushpin: Recommended minikube size {recommendation['cpus']} CPU / {recommendation['memory_gb']}GB"
+    )
+
+
+@diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
+def sizing(
+    version: Annotated[str, typer.Option(help="Chart version")],
+    source: Annotated[str, typer.Option(help="Chart source (OCI registry or local)")],
+    workloads: Annotated[
+        bool, typer.Option("--workloads", help="Show resources per workload")
+    ] = False,
+):
+    """
+    Size minikube from the cpu/memory requests and limits in the chart
+    """
+    with console.status(f"Rendering {source} {version}..."):
+        recommendation, items = size_install(version, source)
+    if not recommendation:
+        error_console.print(f":x: Unable to render {source} {version}")
+        raise typer.Exit(1)
+
+    if workloads:
+        table = Table(box=rich.box.SIMPLE)
+        table.add_column("Workload", style="cyan")
+        table.add_column("Kind")
+        table.add_column("Replicas", justify="right")
+        table.add_column("CPU req", justify="right")
+        table.add_column("Mem req", justify="right")
+        table.add_column("CPU lim", justify="right")
+        table.add_column("Mem lim", justify="right")
+        for item in sorted(items, key=lambda x: x["memory_request"], reverse=True):
+            table.add_row(
+                item["name"],
+                item["kind"],
+                str(item["replicas"]),
+                f"{item['cpu_request']:.2f}",
+                f"{item['memory_request'] / 1024 / 1024:.0f}Mi",
+                f"{item['cpu_limit']:.2f}",
+                f"{item['memory_limit'] / 1024 / 1024:.0f}Mi",
+            )
+        console.print(table)
+
+    display_recommendation(recommendation)
+
+
+if __name__ == "__main__":
+    diag_cli()
@@ -0,0 +1,487 @@
+import typer
+import os
+import json
+import time
+import hashlib
+import logging
+import platform
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import rich.box
+from rich.table import Table
+from typing_extensions import Annotated
+from kubernetes import client, config
+import cibutler.cik8s as cik8s
+import cibutler.shell as shell
+import cibutler.utils as utils
+from cibutler.cimpl import data_load_callback
+from cibutler.common import HOME, console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+# Bumped when the archive layout changes, older snapshots are then ignored
+SNAPSHOT_FORMAT = 1
+
+SNAPSHOT_DIR = os.environ.get(
+    "CIBUTLER_SNAPSHOT_DIR", os.path.join(HOME, ".cibutler", "snapshots")
+)
+
+# Stateful components and the PVC name fragments that identify them
+COMPONENTS = {
+    "postgresql": ["postgres"],
+    "elasticsearch": ["elasticsearch", "elastic"],
+    "minio": ["minio"],
+}
+
+HELPER_IMAGE = "busybox:1.36"
+HELPER_MOUNT = "/data"
+# Archives of a loaded Elasticsearch claim run to several GB
+COPY_TIMEOUT = 60 * 60
+
+
+def snapshot_path(version: str, data_load_flag: str):
+    return os.path.join(SNAPSHOT_DIR, version, data_load_flag or "none")
+
+
+def read_manifest(path: str):
+    """
+    Snapshot manifest, None when missing, incomplete or in an older format
+    """
+    try:
+        with open(os.path.join(path, "manifest.json")) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        logger.info(f"Ignoring snapshot {path} in format {manifest.get('format')}")
+        return None
+    return manifest
+
+
+def find_snapshot(version: str, data_load_flag: str):
+    return read_manifest(snapshot_path(version, data_load_flag))
+
+
+def list_snapshots():
+    snapshots = []
+    if not os.path.isdir(SNAPSHOT_DIR):
+        return snapshots
+    for version in sorted(os.listdir(SNAPSHOT_DIR)):
+        version_dir = os.path.join(SNAPSHOT_DIR, version)
+        if not os.path.isdir(version_dir):
+            continue
+        for flag in sorted(os.listdir(version_dir)):
+            manifest = read_manifest(os.path.join(version_dir, flag))
+            if manifest:
+                snapshots.append(manifest)
+    return snapshots
+
+
+def component(pvc_name: str):
+    for name, fragments in COMPONENTS.items():
+        if any(fragment in pvc_name for fragment in fragments):
+            return name
+    return None
+
+
+def select_pvcs(namespace: str = "default"):
+    """
+    Bound PVCs of the stateful components, as dicts of name, component and size
+    """
+    config.load_kube_config()
+    claims = client.CoreV1Api().list_namespaced_persistent_volume_claim(namespace)
+    selected = []
+    for pvc in claims.items:
+        name = pvc.metadata.name
+        if component(name) and pvc.status.phase == "Bound":
+            selected.append(
+                {
+                    "name": name,
+                    "component": component(name),
+                    "size": (pvc.spec.resources.requests or {}).get("storage"),
+                }
+            )
+    return selected
+
+
+def pvc_workloads(claim_names: list, namespace: str = "default"):
+    """
+    Deployments and StatefulSets that mount any of the claims,
+    as (kind, name, replicas)
+    """
+    config.load_kube_config()
+    apps = client.AppsV1Api()
+    claims = set(claim_names)
+    workloads = []
+    for deployment in apps.list_namespaced_deployment(namespace).items:
+        volumes = deployment.spec.template.spec.volumes or []
+        if any(
+            v.persistent_volume_claim and v.persistent_volume_claim.claim_name in claims
+            for v in volumes
+        ):
+            workloads.append(
+                ("Deployment", deployment.metadata.name, deployment.spec.replicas or 0)
+            )
+    for sts in apps.list_namespaced_stateful_set(namespace).items:
+        name = sts.metadata.name
+        replicas = sts.spec.replicas or 0
+        templates = [t.metadata.name for t in sts.spec.volume_claim_templates or []]
+        # StatefulSet claims are named <template>-<statefulset>-<ordinal>
+        owned = {
+            f"{template}-{name}-{ordinal}"
+            for template in templates
+            for ordinal in range(replicas)
+        }
+        volumes = sts.spec.template.spec.volumes or []
+        mounted = {
+            v.persistent_volume_claim.claim_name
+            for v in volumes
+            if v.persistent_volume_claim
+        }
+        if claims & (owned | mounted):
+            workloads.append(("StatefulSet", name, replicas))
+    return workloads
+
+
+def wait_for(check, timeout: int, interval: int = 2):
+    start = time.time()
+    while not check():
+        if time.time() - start > timeout:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def scale(
+    workloads: list,
+    replicas: int = None,
+    namespace: str = "default",
+    timeout: int = 600,
+):
+    """
+    Scale workloads to replicas (or back to their recorded replicas) and wait
+    """
+    target = [
+        (kind, name, count if replicas is None else replicas)
+        for kind, name, count in workloads
+    ]
+    for kind, name, count in target:
+        cik8s.scale_workload(kind, name, count, namespace=namespace)
+    with console.status(f"Scaling {', '.join(name for _, name, _ in target)}..."):
+        return wait_for(
+            lambda: cik8s.workloads_settled(target, namespace=namespace), timeout
+        )
+
+
+def helper_pod_name(pvc: str):
+    return f"cibutler-snapshot-{int(time.time())}-{pvc}"[:63].rstrip("-")
+
+
+def start_helper(pvc: str, namespace: str = "default", timeout: int = 180):
+    """
+    Start a pod with the claim mounted and return its name (None on timeout)
+    """
+    core = client.CoreV1Api()
+    name = helper_pod_name(pvc)
+    pod = {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "name": name,
+            "labels": {"app": "cibutler-snapshot"},
+            # Keep istio from injecting a sidecar into a short lived helper
+            "annotations": {"sidecar.istio.io/inject": "false"},
+        },
+        "spec": {
+            "restartPolicy": "Never",
+            # Stops on its own should cibutler be interrupted
+            "activeDeadlineSeconds": 4 * 60 * 60,
+            "containers": [
+                {
+                    "name": "helper",
+                    "image": HELPER_IMAGE,
+                    "command": ["sleep", "86400"],
+                    "volumeMounts": [{"name": "data", "mountPath": HELPER_MOUNT}],
+                }
+            ],
+            "volumes": [{"name": "data", "persistentVolumeClaim": {"claimName": pvc}}],
+        },
+    }
+    core.create_namespaced_pod(namespace, pod)
+
+    def running():
+        return core.read_namespaced_pod(name, namespace).status.phase == "Running"
+
+    # Helpers start in parallel, so no console.status here
+    if not wait_for(running, timeout):
+        stop_helper(name, namespace)
+        return None
+    return name
+
+
+def stop_helper(name: str, namespace: str = "default"):
+    try:
+        client.CoreV1Api().delete_namespaced_pod(
+            name, namespace, grace_period_seconds=0
+        )
+    except Exception as err:
+        logger.warning(f"Unable to delete snapshot helper {name}: {err}")
+
+
+def sha256sum(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def copy_out(pvc: str, archive: str, namespace: str = "default"):
+    """
+    Stream a tar of the claim into archive, returns its sha256
+    """
+    pod = start_helper(pvc, namespace=namespace)
+    if not pod:
+        raise RuntimeError(f"Snapshot helper for {pvc} did not start")
+    try:
+        with open(archive, "wb") as f:
+            result = shell.run(
+                ["kubectl", "exec", pod, "-n", namespace, "--"]
+                + ["tar", "czf", "-", "-C", HELPER_MOUNT, "."],
+                timeout=COPY_TIMEOUT,
+                stdout_file=f,
+            )  # nosec
+        if not result.ok:
+            raise RuntimeError(f"Unable to archive {pvc}: {result.stderr}")
+    finally:
+        stop_helper(pod, namespace)
+    return sha256sum(archive)
+
+
+def copy_in(pvc: str, archive: str, namespace: str = "default"):
+    """
+    Replace the contents of the claim with archive
+    """
+    pod = start_helper(pvc, namespace=namespace)
+    if not pod:
+        raise RuntimeError(f"Snapshot helper for {pvc} did not start")
+    try:
+        with open(archive, "rb") as f:
+            result = shell.run(
+                ["kubectl", "exec", "-i", pod, "-n", namespace, "--", "sh", "-c"]
+                + [
+                    f"find {HELPER_MOUNT} -mindepth 1 -delete && tar xzf - -C {HELPER_MOUNT}"
+                ],
+                timeout=COPY_TIMEOUT,
+                stdin=f,
+            )  # nosec
+        if not result.ok:
+            raise RuntimeError(f"Unable to restore {pvc}: {result.stderr}")
+    finally:
+        stop_helper(pod, namespace)
+
+
+def take_snapshot(
+    version: str, data_load_flag: str, namespace: str = "default", workers: int = 3
+):
+    """
+    Stop the stateful components, archive their PVCs and start them again.
+    Returns the manifest.
+    """
+    pvcs = select_pvcs(namespace)
+    if not pvcs:
+        raise RuntimeError(f"No PostgreSQL, Elasticsearch or MinIO PVCs in {namespace}")
+    path = snapshot_path(version, data_load_flag)
+    os.makedirs(path, exist_ok=True)
+    # A manifest is only written once every archive is complete
+    if os.path.exists(os.path.join(path, "manifest.json")):
+        os.remove(os.path.join(path, "manifest.json"))
+
+    workloads = pvc_workloads([pvc["name"] for pvc in pvcs], namespace)
+    logger.info(
+        f"Snapshot {version}/{data_load_flag}: pvcs {pvcs} workloads {workloads}"
+    )
+    if not scale(workloads, replicas=0, namespace=namespace):
+        scale(workloads, namespace=namespace)
+        raise RuntimeError("Timed out stopping the stateful components")
+    try:
+        with (
+            console.status(f"Copying {len(pvcs)} volumes..."),
+            ThreadPoolExecutor(max_workers=workers) as pool,
+        ):
+            futures = {
+                pvc["name"]: pool.submit(
+                    copy_out,
+                    pvc["name"],
+                    os.path.join(path, f"{pvc['name']}.tar.gz"),
+                    namespace,
+                )
+                for pvc in pvcs
+            }
+            for pvc in pvcs:
+                pvc["archive"] = f"{pvc['name']}.tar.gz"
+                pvc["sha256"] = futures[pvc["name"]].result()
+                pvc["bytes"] = os.path.getsize(os.path.join(path, pvc["archive"]))
+    finally:
+        scale(workloads, namespace=namespace)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "data_load_flag": data_load_flag,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "pvcs": pvcs,
+    }
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def restore_snapshot(manifest: dict, namespace: str = "default", workers: int = 3):
+    """
+    Stop the stateful components, replace their PVC contents from the
+    snapshot and wait for them to be ready again
+    """
+    path = snapshot_path(manifest["version"], manifest["data_load_flag"])
+    for pvc in manifest["pvcs"]:
+        if sha256sum(os.path.join(path, pvc["archive"])) != pvc["sha256"]:
+            raise RuntimeError(f"Snapshot archive {pvc['archive']} is corrupt")
+    existing = {pvc["name"] for pvc in select_pvcs(namespace)}
+    missing = [pvc["name"] for pvc in manifest["pvcs"] if pvc["name"] not in existing]
+    if missing:
+        raise RuntimeError(f"PVCs in snapshot not found in {namespace}: {missing}")
+
+    workloads = pvc_workloads([pvc["name"] for pvc in manifest["pvcs"]], namespace)
+    if not scale(workloads, replicas=0, namespace=namespace):
+        scale(workloads, namespace=namespace)
+        raise RuntimeError("Timed out stopping the stateful components")
+    try:
+        with (
+            console.status(f"Restoring {len(manifest['pvcs'])} volumes..."),
+            ThreadPoolExecutor(max_workers=workers) as pool,
+        ):
+            futures = [
+                pool.submit(
+                    copy_in, pvc["name"], os.path.join(path, pvc["archive"]), namespace
+                )
+                for pvc in manifest["pvcs"]
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        ready = scale(workloads, namespace=namespace)
+    return ready
+
+
+@cli.command(rich_help_panel="CI Commands")
+def snapshot(
+    version: Annotated[
+        str, typer.Option(help="Installed CImpl version", envvar="HELM_VERSION")
+    ],
+    data_load_flag: Annotated[
+        str,
+        typer.Option(
+            "--data-load-flag",
+            "-d",
+            callback=data_load_callback,
+            help="Data load option that was loaded",
+        ),
+    ],
+    namespace: Annotated[
+        str, typer.Option("--namespace", "-n", help="CImpl namespace")
+    ] = "default",
+):
+    """
+    Snapshot PostgreSQL, Elasticsearch and MinIO data for install --restore-snapshot :camera:
+
+    Snapshots are keyed by CImpl version and data load option.
+    The stateful components are briefly stopped while their volumes are copied.
+    """
+    start = time.time()
+    try:
+        manifest = take_snapshot(version, data_load_flag, namespace=namespace)
+    except Exception as err:
+        logger.error(f"Snapshot failed: {err}")
+        error_console.print(f":x: Snapshot failed: {err}")
+        raise typer.Exit(1)
+    size = sum(pvc["bytes"] for pvc in manifest["pvcs"])
+    console.print(
+        f":white_check_mark: Snapshot {version}/{data_load_flag} of {len(manifest['pvcs'])} volumes "
+        f"({utils.convert_size(size)}) in {utils.convert_time(time.time() - start)}"
+    )
+
+
+@cli.command(rich_help_panel="CI Commands")
+def restore(
+    version: Annotated[
+        str, typer.Option(help="Installed CImpl version", envvar="HELM_VERSION")
+    ],
+    data_load_flag: Annotated[
+        str,
+        typer.Option(
+            "--data-load-flag",
+            "-d",
+            callback=data_load_callback,
+            help="Data load option of the snapshot",
+        ),
+    ],
+    namespace: Annotated[
+        str, typer.Option("--namespace", "-n", help="CImpl namespace")
+    ] = "default",
+):
+    """
+    Restore a data snapshot into the installed CImpl :camera:
+    """
+    manifest = find_snapshot(version, data_load_flag)
+    if not manifest:
+        error_console.print(f":x: No snapshot for {version}/{data_load_flag}")
+        raise typer.Exit(1)
+    start = time.time()
+    try:
+        ready = restore_snapshot(manifest, namespace=namespace)
+    except Exception as err:
+        logger.error(f"Restore failed: {err}")
+        error_console.print(f":x: Restore failed: {err}")
+        raise typer.Exit(1)
+    if not ready:
+        error_console.print(":x: Restored, but the stateful components are not ready")
+        raise typer.Exit(1)
+    console.print(
+        f":white_check_mark: Restored snapshot {version}/{data_load_flag} in {utils.convert_time(time.time() - start)}"
+    )
+
+
+@diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
+def snapshots():
+    """
+    List data snapshots
+    """
+    table = Table(box=rich.box.SIMPLE)
+    table.add_column("Version", style="cyan")
+    table.add_column("Data load")
+    table.add_column("Volumes", justify="right")
+    table.add_column("Size", justify="right")
+    table.add_column("Created")
+    for manifest in list_snapshots():
+        table.add_row(
+            manifest["version"],
+            manifest["data_load_flag"],
+            str(len(manifest["pvcs"])),
+            utils.convert_size(sum(pvc["bytes"] for pvc in manifest["pvcs"])),
+            manifest["created"],
+        )
+    console.print(table)
+    console.print(f"Snapshots in {SNAPSHOT_DIR}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,223 @@
+import typer
+import time
+import logging
+import rich.box
+from rich.panel import Panel
+from typing_extensions import Annotated
+from kubernetes import client, config
+import cibutler.podwatch as podwatch
+import cibutler.cik8s as cik8s
+from cibutler.common import console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+IMAGE_PULL_REASONS = ["ImagePullBackOff", "ErrImagePull", "InvalidImageName"]
+CONFIG_REASONS = ["CreateContainerConfigError", "CreateContainerError"]
+
+# Restarted together by the restart-entitlements fix
+ENTITLEMENTS_WORKLOAD = "Deployment/entitlements"
+
+
+def classify(
+    states: list,
+    image_pull_grace: int = 300,
+    config_grace: int = 300,
+    unschedulable_grace: int = 120,
+    crash_restarts: int = 5,
+):
+    """
+    Classify pod states into known terminal failures.
+
+    Returns a list of findings: pod, kind, diagnosis and an optional fix.
+    A finding without a fix (or whose fix was already tried) is fatal.
+    """
+    now = time.time()
+    findings = []
+    for state in states:
+        reason = state["reason"] or ""
+        stuck = now - state.get("reason_since", now)
+        name = state["name"]
+        workload = state.get("workload") or state.get("owner") or name
+
+        if reason in IMAGE_PULL_REASONS and (
+            reason == "InvalidImageName" or stuck >= image_pull_grace
+        ):
+            findings.append(
+                {
+                    "pod": name,
+                    "workload": workload,
+                    "kind": "image-pull",
+                    "diagnosis": f"{reason} for {int(stuck)}s: {state['message'] or 'image cannot be pulled'}. Check the image name/tag exists and the registry is reachable.",
+                    "fix": "delete-pod" if reason != "InvalidImageName" else None,
+                }
+            )
+        elif (
+            reason == "CrashLoopBackOff"
+            and state["restarts"] >= crash_restarts
+            and state["restarts"] > state.get("restarts_baseline", 0)
+        ):
+            diagnosis = (
+                f"CrashLoopBackOff with {state['restarts']} restarts (still growing)."
+            )
+            if state["last_terminated"] == "OOMKilled":
+                diagnosis += (
+                    " Last exit was OOMKilled, the container needs more memory."
+                )
+            elif state["last_terminated"]:
+                diagnosis += f" Last exit: {state['last_terminated']}."
+            findings.append(
+                {
+                    "pod": name,
+                    "workload": workload,
+                    "kind": "crash-loop",
+                    "diagnosis": diagnosis
+                    + f" Review with [code]kubectl logs {name} --previous[/code]",
+                    "fix": (
+                        "restart-entitlements"
+                        if workload == ENTITLEMENTS_WORKLOAD
+                        else None
+                    ),
+                }
+            )
+        elif reason in CONFIG_REASONS and stuck >= config_grace:
+            findings.append(
+                {
+                    "pod": name,
+                    "workload": workload,
+                    "kind": "config",
+                    "diagnosis": f"{reason} for {int(stuck)}s: {state['message'] or 'missing secret or configmap'}.",
+                    "fix": None,
+                }
+            )
+        elif (
+            reason == "Unschedulable"
+            and state["scheduling_message"]
+            and "Insufficient" in state["scheduling_message"]
+            and stuck >= unschedulable_grace
+        ):
+            resources = [
+                resource
+                for resource in ["cpu", "memory"]
+                if f"Insufficient {resource}" in state["scheduling_message"]
+            ]
+            findings.append(
+                {
+                    "pod": name,
+                    "workload": workload,
+                    "kind": "insufficient-resources",
+                    "diagnosis": f"Cannot be scheduled, insufficient {' and '.join(resources) or 'resources'}: {state['scheduling_message']} Give the cluster more {'/'.join(resources) or 'resources'} (e.g. --max-memory/--max-cpu with minikube).",
+                    "fix": None,
+                }
+            )
+    return findings
+
+
+def apply_fix(finding: dict, namespace: str = "default"):
+    """
+    Run the targeted fix for a finding
+    """
+    logger.info(f"Applying fix {finding['fix']} for {finding['pod']}")
+    if finding["fix"] == "delete-pod":
+        console.log(f":wrench: Deleting {finding['pod']} to retry the image pull")
+        cik8s.delete_pod(finding["pod"], namespace=namespace)
+    elif finding["fix"] == "restart-entitlements":
+        console.log(":wrench: Restarting entitlements (deployment and bootstrap)")
+        cik8s.rollout_restart(
+            ["entitlements", "entitlements-bootstrap"], namespace=namespace
+        )
+
+
+def display_findings(findings: list, title: str = "Install Failure Diagnosis"):
+    output = ""
+    for finding in findings:
+        output += f"\n:x: [bold]{finding['pod']}[/bold] ({finding['kind']})\n    {finding['diagnosis']}\n"
+    console.print(
+        Panel(
+            output,
+            border_style="red",
+            box=rich.box.SQUARE,
+            expand=True,
+            title=f"[cyan]{title}[/cyan]",
+        )
+    )
+
+
+class Escalation:
+    """
+    Track findings across check_running cycles: try each fix once per
+    workload, then fail. delete-pod and rollout restart replace the pods
+    under new names (and a new ReplicaSet), so attempts are keyed by the
+    workload. With fix off the findings are only reported.
+    """
+
+    def __init__(self, namespace: str = "default", fix: bool = True):
+        self.namespace = namespace
+        self.fix = fix
+        self.attempted = set()
+        self.reported = set()
+
+    def check(self, states: list):
+        """
+        Return the fatal findings (empty when the install should keep going)
+        """
+        fatal = []
+        for finding in classify(states):
+            key = (finding["workload"], finding["fix"])
+            if self.fix and finding["fix"] and key not in self.attempted:
+                self.attempted.add(key)
+                apply_fix(finding, namespace=self.namespace)
+            else:
+                fatal.append(finding)
+        for finding in fatal:
+            if (finding["workload"], finding["kind"]) in self.reported:
+                continue
+            self.reported.add((finding["workload"], finding["kind"]))
+            logger.error(
+                f"Install failure {finding['kind']} {finding['pod']}: {finding['diagnosis']}"
+            )
+            if not self.fix:
+                console.log(
+                    f":warning: {finding['pod']} ({finding['kind']}): {finding['diagnosis']}"
+                )
+        return fatal
+
+
+@diag_cli.command(rich_help_panel="CImpl Diagnostic Commands")
+def triage(
+    namespace: Annotated[
+        str, typer.Option("--namespace", "-n", help="Namespace to check")
+    ] = "default",
+):
+    """
+    Diagnose pods stuck in known failure states (image pull, crash loop, config, scheduling)
+    """
+    try:
+        config.load_kube_config()
+        pods = client.CoreV1Api().list_namespaced_pod(namespace)
+    except Exception as err:
+        error_console.print(f":x: Error talking to kubernetes API: {err}")
+        raise typer.Exit(1)
+
+    # Single snapshot, so there is no history to wait on
+    states = [podwatch.track_state(podwatch.pod_state(pod)) for pod in pods.items]
+    for state in states:
+        state["restarts_baseline"] = 0
+    findings = classify(
+        states, image_pull_grace=0, config_grace=0, unschedulable_grace=0
+    )
+    if findings:
+        display_findings(findings, title=f"Pod Diagnosis ({namespace})")
+        raise typer.Exit(1)
+    console.print(f":thumbs_up: No known failure states in {namespace}")
+
+
+if __name__ == "__main__":
+    diag_cli()
@@ -0,0 +1,310 @@
+"""
+Supervised minikube tunnel.
+
+A background supervisor keeps minikube tunnel running: it checks the istio
+ingress IP and osdu.localhost every CHECK_INTERVAL seconds and restarts the
+tunnel with backoff when they fail. Other commands read its status file
+(tunnel_up) instead of waiting for OSDU calls to time out.
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import logging
+import subprocess
+from urllib.parse import urlparse
+import typer
+from typing_extensions import Annotated
+from kubernetes import client, config
+import cibutler.log as log
+from cibutler.common import CACHE_DIR, console, error_console
+
+logger = logging.getLogger(__name__)
+
+cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+diag_cli = typer.Typer(
+    rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
+)
+
+PID_FILE = os.path.join(CACHE_DIR, "tunnel.pid")
+STATUS_FILE = os.path.join(CACHE_DIR, "tunnel-status.json")
+LOG_FILE = "tunnel.log"
+
+CHECK_INTERVAL = 10
+# Consecutive failed checks before the tunnel is restarted
+FAILURES_BEFORE_RESTART = 3
+MAX_BACKOFF = 120
+
+INGRESS_SERVICE = "istio-ingress"
+INGRESS_NAMESPACE = "istio-system"
+OSDU_URL = "http://osdu.localhost"
+
+
+def pid_alive(pid: int):
+    try:
+        os.kill(pid, 0)
+    except (OSError, TypeError):
+        return False
+    return True
+
+
+def supervisor_pid():
+    """
+    PID of the running supervisor, None when there is none
+    """
+    try:
+        with open(PID_FILE) as f:
+            pid = int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+    return pid if pid_alive(pid) else None
+
+
+def read_status():
+    try:
+        with open(STATUS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_status(**status):
+    status["checked"] = time.time()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = STATUS_FILE + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f, indent=2)
+    os.replace(tmp, STATUS_FILE)
+
+
+def reachable(url: str = OSDU_URL, timeout: float = 1.0):
+    """
+    Cheap TCP connect to the host of url
+    """
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        with socket.create_connection((parsed.hostname, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def ingress_ip():
+    """
+    External IP of the istio ingress, None until the tunnel assigns one
+    """
+    config.load_kube_config()
+    service = client.CoreV1Api().read_namespaced_service(
+        INGRESS_SERVICE, INGRESS_NAMESPACE
+    )
+    load_balancer = service.status.load_balancer
+    for ingress in (load_balancer.ingress if load_balancer else None) or []:
+        if ingress.ip or ingress.hostname:
+            return ingress.ip or ingress.hostname
+    return None
+
+
+def check_health():
+    """
+    Returns (healthy, ingress_ip, error)
+    """
+    try:
+        ip = ingress_ip()
+    except Exception as err:
+        return False, None, f"ingress: {err}"
+    if not ip:
+        return False, None, "istio ingress has no external IP"
+    if not reachable(OSDU_URL):
+        return False, ip, f"{OSDU_URL} not reachable"
+    return True, ip, None
+
+
+def tunnel_up(url: str = OSDU_URL):
+    """
+    Whether OSDU is reachable, from the supervisor status when it is fresh,
+    else from a quick connect
+    """
+    status = read_status()
+    if (
+        status
+        and supervisor_pid()
+        and time.time() - status.get("checked", 0) < 3 * CHECK_INTERVAL
+        and urlparse(url).hostname == urlparse(OSDU_URL).hostname
+    ):
+        return status.get("state") == "up"
+    return reachable(url)
+
+
+def backoff(restarts: int):
+    return min(2**restarts, MAX_BACKOFF)
+
+
+def supervise(profile: str = None, interval: int = CHECK_INTERVAL):
+    """
+    Run minikube tunnel, restarting it when health checks keep failing
+    """
+    cmd = ["minikube", "tunnel", "--alsologtostderr"]
+    if profile:
+        cmd += ["--profile", profile]
+    proc = None
+    restarts = 0
+    failures = 0
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    log.use_logfile(log.daemon_logfile("tunnel"))
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with open(PID_FILE, "w") as f:
+        f.write(str(os.getpid()))
+
+    try:
+        with open(LOG_FILE, "a") as output:
+            while not stopping:
+                if proc is None or proc.poll() is not None:
+                    if proc is not None:
+                        restarts += 1
+                        wait = backoff(restarts)
+                        logger.warning(
+                            f"minikube tunnel exited ({proc.returncode}), restarting in {wait}s"
+                        )
+                        write_status(
+                            state="restarting",
+                            restarts=restarts,
+                            error=f"tunnel exited {proc.returncode}",
+                        )
+                        time.sleep(wait)
+                        if stopping:
+                            break
+                    proc = subprocess.Popen(cmd, stdout=output, stderr=output)
+                    failures = 0
+                    logger.info(f"minikube tunnel started, pid {proc.pid}")
+
+                healthy, ip, error = check_health()
+                if healthy:
+                    failures = 0
+                    restarts = 0
+                else:
+                    failures += 1
+                    logger.info(f"Tunnel check failed ({failures}): {error}")
+                write_status(
+                    state="up" if healthy else "down",
+                    ingress_ip=ip,
+                    tunnel_pid=proc.pid,
+                    restarts=restarts,
+                    error=error,
+                )
+                if failures >= FAILURES_BEFORE_RESTART:
+                    logger.warning(f"Tunnel unhealthy, restarting: {error}")
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=10)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                    continue
+                time.sleep(interval)
+    finally:
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+        write_status(state="stopped", restarts=restarts, error=None)
+        if os.path.exists(PID_FILE):
+            os.remove(PID_FILE)
+
+
+def start_supervisor(profile: str = None):
+    """
+    Start the supervisor as a detached process, returns its pid
+    """
+    pid = supervisor_pid()
+    if pid:
+        return pid
+    cmd = [sys.executable, "-m", "cibutler.main", "diag", "tunnel-supervise"]
+    if profile:
+        cmd += ["--profile", profile]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    logger.info(f"Tunnel supervisor started, pid {proc.pid}")
+    return proc.pid
+
+
+def stop_supervisor(timeout: int = 15):
+    pid = supervisor_pid()
+    if not pid:
+        return False
+    os.kill(pid, signal.SIGTERM)
+    deadline = time.time() + timeout
+    while pid_alive(pid) and time.time() < deadline:
+        time.sleep(0.5)
+    return True
+
+
+@diag_cli.command(rich_help_panel="Kubernetes Diagnostic Commands", hidden=True)
+def tunnel_supervise(
+    profile: Annotated[str, typer.Option(help="Minikube profile")] = None,
+):
+    """
+    Run the tunnel supervisor in the foreground
+    """
+    supervise(profile=profile)
+
+
+@cli.command(rich_help_panel="CI Commands")
+def tunnel_status():
+    """
+    Show whether the minikube tunnel is up
+    """
+    status = read_status()
+    pid = supervisor_pid()
+    if not pid:
+        if reachable(OSDU_URL):
+            console.print(
+                f":white_check_mark: {OSDU_URL} reachable (tunnel not supervised)"
+            )
+            return
+        error_console.print(
+            f":x: {OSDU_URL} not reachable, start the tunnel with [code]cibutler tunnel --background[/code]"
+        )
+        raise typer.Exit(1)
+    age = int(time.time() - status["checked"]) if status else None
+    if status and status.get("state") == "up":
+        console.print(
+            f":white_check_mark: Tunnel up, ingress {status.get('ingress_ip')}, "
+            f"checked {age}s ago, supervisor pid {pid}"
+        )
+        return
+    error_console.print(
+        f":x: Tunnel {status.get('state') if status else 'starting'}: "
+        f"{(status or {}).get('error')}, restarts {(status or {}).get('restarts', 0)}, see {LOG_FILE}"
+    )
+    raise typer.Exit(1)
+
+
+@cli.command(rich_help_panel="CI Commands")
+def tunnel_stop():
+    """
+    Stop the supervised minikube tunnel
+    """
+    if stop_supervisor():
+        console.print(":white_check_mark: Tunnel stopped")
+    else:
+        console.print("No supervised tunnel running")
+
+
+if __name__ == "__main__":
+    cli()
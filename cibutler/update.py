@@ -6,15 +6,21 @@ import time
 import importlib
 import logging
 import os
+import json
 import platform
+import atexit
+import tempfile
+import threading
+import requests
 from typing_extensions import Annotated
-from pypi_simple import PyPISimple
-from packaging.version import Version
+from pypi_simple import NoSuchProjectError, ProjectPage, PyPISimple
+from packaging.version import InvalidVersion, Version
 
 
 import cibutler._version as _version
 from cibutler._version import __version__ as cibutler_version
 from cibutler import __app_name__
+from cibutler.common import CACHE_DIR
 
 try:
     __version__ = importlib.metadata.version("cibutler")
@@ -29,26 +35,168 @@ error_console = Console(stderr=True, style="bold red")
 cli = typer.Typer()
 
 
+INDEX_URL = "https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple"
+
+# Versions are re-checked in the background once the cache is older than this
+VERSION_CACHE_TTL = 24 * 60 * 60
+VERSION_CACHE_FILE = os.path.join(CACHE_DIR, "versions.json")
+VERSION_TIMEOUT = (3, 10)
+# A short command waits this long at exit for a refresh still running
+REFRESH_EXIT_WAIT = 2
+
+_refresh_thread = None
+
+
+def sort_versions(versions):
+    """
+    Parse with packaging.Version and sort oldest to newest, skipping invalid versions
+    """
+    parsed = []
+    for version in versions:
+        try:
+            parsed.append(Version(version.strip()))
+        except InvalidVersion:
+            logger.debug("Ignoring invalid version %s", version)
+    return [str(version) for version in sorted(set(parsed))]
+
+
+def read_version_cache():
+    try:
+        with open(VERSION_CACHE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def cache_entry(index_url: str, project: str):
+    return read_version_cache().get(f"{index_url.rstrip('/')}/{project}")
+
+
+def write_cache_entry(index_url: str, project: str, entry: dict):
+    cache = read_version_cache()
+    cache[f"{index_url.rstrip('/')}/{project}"] = entry
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write then rename so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp, VERSION_CACHE_FILE)
+    except OSError as err:
+        logger.warning("Unable to write version cache: %s", err)
+
+
+def is_stale(entry: dict, ttl: int = VERSION_CACHE_TTL):
+    return not entry or time.time() - entry.get("checked", 0) > ttl
+
+
+def fetch_versions(index_url: str = INDEX_URL, project: str = "cibutler"):
+    """
+    Query the index for project versions, sending the cached ETag and
+    Last-Modified so an unchanged index answers 304 without a body.
+    Updates the cache and returns the sorted versions.
+    """
+    entry = cache_entry(index_url, project) or {}
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    with PyPISimple(endpoint=index_url) as client:
+        url = client.get_project_url(project)
+        response = client.s.get(
+            url,
+            headers=dict(headers, Accept=client.accept),
+            timeout=VERSION_TIMEOUT,
+        )
+        if response.status_code == 304 and "versions" in entry:
+            logger.debug("Version index unchanged for %s", project)
+            versions = entry["versions"]
+        else:
+            if response.status_code == 404:
+                raise NoSuchProjectError(project, url)
+            response.raise_for_status()
+            page = ProjectPage.from_response(response, project)
+            versions = sort_versions(
+                package.version for package in page.packages if package.version
+            )
+    write_cache_entry(
+        index_url,
+        project,
+        {
+            "versions": versions,
+            "etag": response.headers.get("ETag", entry.get("etag")),
+            "last_modified": response.headers.get(
+                "Last-Modified", entry.get("last_modified")
+            ),
+            "checked": time.time(),
+        },
+    )
+    return versions
+
+
+def _refresh(index_url: str, project: str):
+    try:
+        fetch_versions(index_url, project)
+    except Exception as err:
+        logger.info("Background version check failed: %s", err)
+
+
+def _join_refresh():
+    if _refresh_thread is not None:
+        _refresh_thread.join(REFRESH_EXIT_WAIT)
+
+
+def refresh_in_background(index_url: str = INDEX_URL, project: str = "cibutler"):
+    """
+    Refresh a stale version cache on a daemon thread, so it never delays a
+    command. Quick commands give it up to REFRESH_EXIT_WAIT seconds at exit.
+    """
+    global _refresh_thread
+    if not is_stale(cache_entry(index_url, project)):
+        return None
+    if _refresh_thread is not None and _refresh_thread.is_alive():
+        return _refresh_thread
+    if _refresh_thread is None:
+        atexit.register(_join_refresh)
+    _refresh_thread = threading.Thread(
+        target=_refresh, args=(index_url, project), name="version-check", daemon=True
+    )
+    _refresh_thread.start()
+    return _refresh_thread
+
+
+def cached_versions(index_url: str = INDEX_URL, project: str = "cibutler"):
+    """
+    Versions from the cache without any network access (None when never
+    checked), refreshing the cache in the background when it is stale
+    """
+    refresh_in_background(index_url, project)
+    entry = cache_entry(index_url, project)
+    return entry["versions"] if entry else None
+
+
 def update_available():
     """
     Is there an update available?
     """
     versions = available_versions()
-    console.print(versions)
     if versions:
-        latest = versions.split()[-1]
-        return Version(__version__) < Version(latest)
+        return Version(__version__) < Version(versions[-1])
     else:
         return None
 
 
 def update_message():
     """
-    Display a message about version or update available
+    Display a message about version or update available.
+
+    Uses the cached index only, the check for newer versions runs in the background.
     """
-    versions = available_versions()
+    versions = cached_versions()
     if versions:
-        latest = versions.split()[-1]
+        latest = versions[-1]
         if Version(__version__) < Version(latest):
             console.print(
                 f"[yellow]You’re using v{__version__} — a newer version (v{latest}) is available![/yellow]"
@@ -61,32 +209,31 @@ def update_message():
 def available_versions(
     index_url: Annotated[
         str, typer.Option(envvar="INDEX_URL", help="INDEX URL")
-    ] = "https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple",
+    ] = INDEX_URL,
     project: str = "cibutler",
+    refresh: bool = False,
 ):
-    versions = ""
-    with PyPISimple(endpoint=index_url) as client:
-        try:
-            requests_page = client.get_project_page(project)
-        except ConnectionError as err:
-            error_console.print(f"{err}")
-            return None
-        except Exception:
-            console.print(
-                ":warning: Unable to check for updated version", style="yellow"
-            )
-            return None
-        for package in requests_page.packages:
-            # console.print(package.version)
-            # versions.append(package.version)
-            versions += f"{package.version.strip()} "
-    return versions
+    """
+    Sorted versions of project, from the cache while it is fresh
+    """
+    entry = cache_entry(index_url, project)
+    if not refresh and not is_stale(entry):
+        return entry["versions"]
+    try:
+        return fetch_versions(index_url, project)
+    except requests.ConnectionError as err:
+        error_console.print(f"{err}")
+    except Exception as err:
+        logger.info("Unable to check for updated version: %s", err)
+        console.print(":warning: Unable to check for updated version", style="yellow")
+    # Offline or index error, an old answer is better than none
+    return entry["versions"] if entry else None
 
 
 @cli.command(rich_help_panel="Utility Commands")
 def update(
     index_url: str = typer.Option(
-        "https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple",
+        INDEX_URL,
         "--index-url",
         help="index-url",
     ),
@@ -108,7 +255,7 @@ def update(
 @cli.command(rich_help_panel="Utility Commands", name="version")
 def version_command(
     index_url: str = typer.Option(
-        "https://community.opengroup.org/api/v4/projects/1558/packages/pypi/simple",
+        INDEX_URL,
         "--index-url",
         help="index-url",
     ),
@@ -153,7 +300,13 @@ def version_command(
     #    error_console.print("Error: Unable to locate Pip")
     #    raise typer.Exit(3)
 
-    output = available_versions(index_url=index_url, project=project)
+    versions = available_versions(index_url=index_url, project=project, refresh=True)
+    if versions is None:
+        output = "Unable to check for available versions"
+    elif pre:
+        output = " ".join(versions)
+    else:
+        output = " ".join(v for v in versions if not Version(v).is_prerelease)
 
     console.print(
         Panel(text, box=rich.box.SQUARE, expand=True, title="[green]Current[/green]")
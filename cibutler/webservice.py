@@ -0,0 +1,306 @@
+"""
+Async service layer for the web UI.
+
+Page handlers await these instead of calling the CLI commands, so OSDU
+HTTP calls and the kubectl secret lookup for the token never run on the
+NiceGUI event loop.
+"""
+
+import time
+import asyncio
+import logging
+import functools
+import httpx
+import typer
+import tenacity
+from nicegui import run
+import cibutler.conf as conf
+import cibutler.osdu as osdu
+import cibutler.podwatch as podwatch
+
+logger = logging.getLogger(__name__)
+
+# Page data is reused across reloads and clients for this long
+CACHE_TTL = 30
+# Keycloak access tokens are valid for 5 minutes by default
+TOKEN_TTL = 240
+# Entries kept per cached function, searches are cached by their query
+CACHE_SIZE = 128
+TIMEOUT = 10
+
+# Coalesce bursts of watch events (e.g. during an install) into one push
+PUSH_INTERVAL = 0.5
+
+_client = None
+_cluster_feeds = {}
+
+
+class ServiceError(Exception):
+    pass
+
+
+def ttl_cache(ttl: int = CACHE_TTL, maxsize: int = CACHE_SIZE):
+    """
+    Cache an async function by its arguments for ttl seconds.
+
+    Concurrent callers share the call in flight and failures are not
+    cached. Expired entries are dropped on insert and at most maxsize are
+    kept, the oldest go first. The wrapper gains cache_clear().
+    """
+
+    def decorator(func):
+        cache = {}
+
+        def prune(now):
+            for key in [key for key, entry in cache.items() if entry[0] <= now]:
+                del cache[key]
+            # Insertion ordered, so the first entries are the oldest
+            while len(cache) >= maxsize:
+                del cache[next(iter(cache))]
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            entry = cache.get(key)
+            if entry and entry[0] > time.monotonic():
+                return await asyncio.shield(entry[1])
+            now = time.monotonic()
+            cache.pop(key, None)
+            prune(now)
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            cache[key] = (now + ttl, task)
+            try:
+                # Shielded so one client cancelling does not cancel the others
+                return await asyncio.shield(task)
+            except Exception:
+                if cache.get(key, (None, None))[1] is task:
+                    del cache[key]
+                raise
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+def client() -> httpx.AsyncClient:
+    """
+    Shared async HTTP client, so pages reuse pooled connections
+    """
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=TIMEOUT)
+    return _client
+
+
+async def close():
+    global _client
+    stop_cluster_feeds()
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_info(endpt: str, base_url: str = osdu.BASE_URL):
+    url = base_url + endpt + "/info"
+    try:
+        r = await client().get(url)
+    except httpx.HTTPError as err:
+        logger.warning("Error %s: %s", url, err)
+        return None
+    if r.is_success:
+        return r.json()
+    logger.error("Error %s: %s %s", url, r.status_code, r.text)
+    return None
+
+
+@ttl_cache()
+async def info_all(base_url: str = osdu.BASE_URL):
+    """
+    Info of every OSDU service, fetched concurrently
+    """
+    base_url = base_url.rstrip("/")
+    names = sorted(conf.osdu_end_points)
+    results = await asyncio.gather(
+        *[get_info(conf.osdu_end_points[name]["api"], base_url) for name in names]
+    )
+    return {name: info for name, info in zip(names, results) if info}
+
+
+def _refresh_token(base_url: str, realm: str, client_id: str):
+    try:
+        return osdu.setup(
+            base_url=base_url, realm=realm, client_id=client_id
+        ).refresh_token()
+    except (typer.Exit, tenacity.RetryError) as err:
+        raise ServiceError(
+            f"Unable to get a token from keycloak for {base_url}, is minikube tunnel up?"
+        ) from err
+
+
+@ttl_cache(TOKEN_TTL)
+async def access_token(
+    base_url: str = osdu.BASE_URL, realm: str = "osdu", client_id: str = "osdu-admin"
+):
+    """
+    Access token from the OSDU Python SDK, in a worker thread
+    """
+    return await run.io_bound(_refresh_token, base_url.rstrip("/"), realm, client_id)
+
+
+async def fresh_access_token(
+    base_url: str = osdu.BASE_URL, realm: str = "osdu", client_id: str = "osdu-admin"
+):
+    access_token.cache_clear()
+    return await access_token(base_url, realm, client_id)
+
+
+async def osdu_request(
+    method: str,
+    service: str,
+    path: str,
+    base_url: str = osdu.BASE_URL,
+    realm: str = "osdu",
+    **kwargs,
+):
+    """
+    Authenticated request to an OSDU service, returns the JSON body
+    """
+    base_url = base_url.rstrip("/")
+    token = await access_token(base_url, realm)
+    url = base_url + conf.osdu_end_points[service]["api"] + path
+    headers = {"Authorization": f"Bearer {token}", "data-partition-id": realm}
+    try:
+        r = await client().request(method, url, headers=headers, **kwargs)
+    except httpx.HTTPError as err:
+        raise ServiceError(f"{url}: {err}") from err
+    if not r.is_success:
+        raise ServiceError(f"{url}: {r.status_code} {r.text}")
+    return r.json()
+
+
+@ttl_cache()
+async def groups(base_url: str = osdu.BASE_URL, realm: str = "osdu"):
+    return await osdu_request("GET", "entitlements", "/groups", base_url, realm)
+
+
+@ttl_cache()
+async def legal_tags(base_url: str = osdu.BASE_URL, realm: str = "osdu"):
+    return await osdu_request(
+        "GET", "legal", "/legaltags", base_url, realm, params={"valid": "true"}
+    )
+
+
+@ttl_cache()
+async def search(
+    query: str,
+    kind: str = "*:*:*:*",
+    limit: int = 20,
+    base_url: str = osdu.BASE_URL,
+    realm: str = "osdu",
+):
+    return await osdu_request(
+        "POST",
+        "search",
+        "/query",
+        base_url,
+        realm,
+        json={"kind": kind, "query": query, "limit": limit},
+    )
+
+
+class ClusterFeed:
+    """
+    One set of watches (pods, deployments, helm releases) per namespace,
+    shared by every connected client. Watch threads mark the feed dirty and
+    subscribers are called on the event loop, at most every PUSH_INTERVAL.
+    """
+
+    def __init__(self, namespace: str = "default"):
+        self.namespace = namespace
+        self.pods = podwatch.PodWatcher(namespace, on_change=self._changed)
+        self.deployments = podwatch.DeploymentWatcher(
+            namespace, on_change=self._changed
+        )
+        self.releases = podwatch.HelmReleaseWatcher(namespace, on_change=self._changed)
+        self.subscribers = set()
+        self.started = False
+        self._loop = None
+        self._dirty = None
+        self._pusher = None
+        self._starting = asyncio.Lock()
+
+    def _start_watches(self):
+        return all(
+            watcher.start() for watcher in [self.pods, self.deployments, self.releases]
+        )
+
+    async def start(self):
+        """
+        Start the watches, returns False when the kubernetes API is not reachable
+        """
+        async with self._starting:
+            if self.started:
+                return True
+            self._loop = asyncio.get_running_loop()
+            self._dirty = asyncio.Event()
+            # The initial lists are blocking API calls
+            self.started = await run.io_bound(self._start_watches)
+            if not self.started:
+                self.stop()
+                return False
+            self._pusher = self._loop.create_task(self._push())
+            logger.info(
+                "Cluster feed started in %s with %s pods",
+                self.namespace,
+                len(self.pods.items),
+            )
+            return True
+
+    def stop(self):
+        for watcher in [self.pods, self.deployments, self.releases]:
+            watcher.stop()
+        if self._pusher:
+            self._pusher.cancel()
+        self.started = False
+
+    def _changed(self, watcher):
+        # Called on a watch thread
+        if self._loop and self._dirty:
+            self._loop.call_soon_threadsafe(self._dirty.set)
+
+    async def _push(self):
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            for callback in list(self.subscribers):
+                try:
+                    callback()
+                except Exception as err:
+                    logger.warning("Cluster feed subscriber failed: %s", err)
+            await asyncio.sleep(PUSH_INTERVAL)
+
+    def subscribe(self, callback):
+        self.subscribers.add(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.discard(callback)
+
+
+async def cluster_feed(namespace: str = "default"):
+    """
+    The shared, started ClusterFeed for a namespace (None when the API is unreachable)
+    """
+    feed = _cluster_feeds.get(namespace)
+    if feed is None:
+        feed = _cluster_feeds[namespace] = ClusterFeed(namespace)
+    if not await feed.start():
+        _cluster_feeds.pop(namespace, None)
+        return None
+    return feed
+
+
+def stop_cluster_feeds():
+    for feed in _cluster_feeds.values():
+        feed.stop()
+    _cluster_feeds.clear()
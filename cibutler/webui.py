@@ -1,13 +1,14 @@
 import typer
-from nicegui import ui, app, events, native
+from nicegui import ui, app, background_tasks, events, native
+import json
 import logging
 import asyncio
 from typing import Optional
-from datetime import datetime
-import cibutler.osdu as osdu
+from datetime import datetime, timezone
+import cibutler.utils as utils
+import cibutler.webservice as webservice
 from cibutler._version import __version__
 from rich.console import Console
-# import httpx
 
 logger = logging.getLogger(__name__)
 
@@ -22,9 +23,6 @@ diag_cli = typer.Typer(
     rich_markup_mode="rich", help="Community Implementation", no_args_is_help=True
 )
 
-# api = httpx.AsyncClient()
-# running_query: Optional[asyncio.Task] = None
-# results = []
 # ui.markdown('This is **Markdown**.')
 # ui.html('This is <strong>HTML</strong>.')
 # ui.icon('thumb_up')
@@ -92,7 +90,8 @@ def osdu_page_layout():
                 ui.menu_item(
                     "Legal Tags", on_click=lambda: ui.navigate.to("/osdu/legal_tags")
                 )
-                # ui.menu_item("Search", on_click=lambda: ui.navigate.to("/osdu/search"))
+                ui.menu_item("Search", on_click=lambda: ui.navigate.to("/osdu/search"))
+                ui.menu_item("Cluster", on_click=lambda: ui.navigate.to("/cluster"))
         ui.label("CI Butler")
         ui.button("shutdown cibutler", on_click=app.shutdown)
 
@@ -108,85 +107,200 @@ def osdu_page_layout():
         ui.timer(1.0, lambda: label.set_text(f"{datetime.now():%X}"))
 
 
-@ui.page("/osdu/info")
-def osdu_info_page():
+def page_header():
     with ui.row():
         ui.button("Back", on_click=ui.navigate.back)
         ui.button("Reload", on_click=ui.navigate.reload)
-    with ui.card():
-        ui.label("OSDU Endpoints Info")
-        ui.code(osdu.get_info_all())
+
+
+def skeleton(lines: int = 6):
+    """
+    Loading placeholder, replaced once the data arrives
+    """
+    with ui.column().classes("w-full gap-2") as placeholder:
+        for _ in range(lines):
+            ui.skeleton().classes("w-96 h-4")
+    return placeholder
+
+
+async def load_into(card, title: str, fetch):
+    """
+    Render the page shell with a skeleton, then fill in the card once fetch
+    (a coroutine function) completes
+    """
+    with card:
+        ui.label(title)
+        placeholder = skeleton()
+    # Deliver the page first, the data follows over the websocket
+    await ui.context.client.connected()
+    try:
+        data = await fetch()
+    except webservice.ServiceError as err:
+        placeholder.delete()
+        with card:
+            ui.label(f"{err}").classes("text-negative")
+        return
+    placeholder.delete()
+    with card:
+        ui.code(json.dumps(data, indent=2), language="json")
+
+
+@ui.page("/osdu/info")
+async def osdu_info_page():
+    page_header()
+    await load_into(ui.card(), "OSDU Endpoints Info", webservice.info_all)
 
 
 @ui.page("/osdu/groups")
-def osdu_groups_page():
-    with ui.row():
-        ui.button("Back", on_click=ui.navigate.back)
-        ui.button("Reload", on_click=ui.navigate.reload)
-    with ui.card():
-        ui.label("OSDU Groups")
-        ui.code(osdu.groups())
+async def osdu_groups_page():
+    page_header()
+    await load_into(ui.card(), "OSDU Groups", webservice.groups)
 
 
 @ui.page("/osdu/legal_tags")
-def osdu_legal_tags_page():
-    with ui.row():
-        ui.button("Back", on_click=ui.navigate.back)
-        ui.button("Reload", on_click=ui.navigate.reload)
-    with ui.card():
-        ui.label("OSDU Legal Tags")
-        ui.code(osdu.legal_tags())
+async def osdu_legal_tags_page():
+    page_header()
+    await load_into(ui.card(), "OSDU Legal Tags", webservice.legal_tags)
 
 
 @ui.page("/osdu/refesh_token")
-def osdu_refresh_token_page():
-    with ui.row():
-        ui.button("Back", on_click=ui.navigate.back)
-        ui.button("Reload", on_click=ui.navigate.reload)
-    with ui.card():
-        ui.label("OSDU Refresh Token")
-        ui.code(osdu.refresh_token())
+async def osdu_refresh_token_page():
+    page_header()
+    await load_into(ui.card(), "OSDU Refresh Token", webservice.fresh_access_token)
 
 
-"""
-@ui.page('/osdu/search')
+def pod_rows(feed):
+    now = datetime.now(timezone.utc)
+    rows = []
+    for state in feed.pods.states():
+        if state["ready_at"] and state["created"]:
+            age = state["ready_at"] - state["created"]
+        elif state["created"]:
+            age = now - state["created"]
+        else:
+            age = None
+        rows.append(
+            {
+                "name": state["name"],
+                "phase": state["phase"],
+                "ready": "yes" if state["ready"] else "no",
+                "restarts": state["restarts"],
+                "reason": state["reason"] or "",
+                "age": utils.convert_time(age.total_seconds()) if age else "-",
+            }
+        )
+    return rows
+
+
+def columns(*names):
+    return [{"name": name, "label": name.title(), "field": name} for name in names]
+
+
+@ui.page("/cluster")
+async def cluster_page(namespace: str = "default"):
+    """
+    Pods, deployments and helm releases, pushed from one shared watch
+    """
+    page_header()
+    with ui.card().classes("w-full"):
+        ui.label(f"Cluster ({namespace})")
+        placeholder = skeleton()
+    await ui.context.client.connected()
+    feed = await webservice.cluster_feed(namespace)
+    placeholder.delete()
+    if not feed:
+        ui.label(
+            "Unable to reach the kubernetes API, check the current context"
+        ).classes("text-negative")
+        return
+
+    with ui.card().classes("w-full"):
+        ui.label("Helm releases")
+        releases = ui.table(
+            columns=columns("name", "status", "revision"), rows=[], row_key="name"
+        ).classes("w-full")
+    with ui.card().classes("w-full"):
+        ui.label("Deployments")
+        deployments = ui.table(
+            columns=columns("name", "replicas", "ready", "updated", "available"),
+            rows=[],
+            row_key="name",
+        ).classes("w-full")
+    with ui.card().classes("w-full"):
+        summary = ui.label()
+        pods = ui.table(
+            columns=columns("name", "phase", "ready", "restarts", "reason", "age"),
+            rows=[],
+            row_key="name",
+        ).classes("w-full")
+
+    def render():
+        releases.rows = [
+            {key: release[key] for key in ["name", "status", "revision"]}
+            for release in feed.releases.releases()
+        ]
+        deployments.rows = feed.deployments.states()
+        pods.rows = pod_rows(feed)
+        ready = sum(1 for row in pods.rows if row["ready"] == "yes")
+        summary.set_text(f"Pods {ready}/{len(pods.rows)} ready")
+        for table in [releases, deployments, pods]:
+            table.update()
+
+    render()
+    feed.subscribe(render)
+    ui.context.client.on_delete(lambda: feed.unsubscribe(render))
+
+
+# Wait this long after the last keystroke before querying
+SEARCH_DEBOUNCE = 0.4
+
+
+@ui.page("/osdu/search")
 def osdu_search_page():
-    with ui.row():
-        ui.button('Back', on_click=ui.navigate.back)
-        ui.button('Reload', on_click=ui.navigate.reload)
-    with ui.card():
+    page_header()
+    running_query: Optional[asyncio.Task] = None
+
+    async def run_search(query: str):
+        await asyncio.sleep(SEARCH_DEBOUNCE)
+        with results:
+            results.clear()
+            skeleton(3)
+        try:
+            data = await webservice.search(query, kind=kind.value or "*:*:*:*")
+        except webservice.ServiceError as err:
+            results.clear()
+            with results:
+                ui.label(f"{err}").classes("text-negative")
+            return
+        results.clear()
+        with results:
+            ui.label(f"{data.get('totalCount', 0)} records").classes("text-caption")
+            for item in data.get("results", []):
+                with ui.card().classes("w-full"):
+                    ui.label(item.get("id", "")).classes("text-subtitle2")
+                    ui.label(f"{item.get('kind', '')}  {item.get('createTime', '')}")
+
+    def search(e: events.ValueChangeEventArguments):
+        nonlocal running_query
+        if running_query:
+            # Cancel the previous query; happens when you type fast
+            running_query.cancel()
+        search_field.classes("mt-2", remove="mt-24")
+        if not e.value:
+            results.clear()
+            running_query = None
+            return
+        running_query = background_tasks.create(run_search(e.value), name="search")
+
+    with ui.card().classes("w-full"):
         ui.label("OSDU Search")
-        # create a search field which is initially focused and leaves space at the top
-        search_field = ui.input(on_change=lambda: e, search(results)) \
-        .props('autofocus outlined rounded item-aligned input-class="ml-3"') \
-        .classes('w-96 self-center mt-24 transition-all')
-        results = ui.row()
-"""
-
-
-async def search(e: events.ValueChangeEventArguments, results) -> None:
-    """Search for cocktails as you type."""
-    global running_query  # pylint: disable=global-statement # noqa: PLW0603
-    if running_query:
-        running_query.cancel()  # cancel the previous query; happens when you type fast
-    # search_field.classes('mt-2', remove='mt-24')  # move the search field up
-    # results.clear()
-    # store the http coroutine in a task so we can cancel it later if needed
-    running_query = asyncio.create_task(
-        api.get(f"https://www.thecocktaildb.com/api/json/v1/1/search.php?s={e.value}")
-    )
-    response = await running_query
-    if response.text == "":
-        return
-    with results:  # enter the context of the results row
-        for drink in (
-            response.json()["drinks"] or []
-        ):  # iterate over the response data of the api
-            with ui.image(drink["strDrinkThumb"]).classes("w-64"):
-                ui.label(drink["strDrink"]).classes(
-                    "absolute-bottom text-subtitle2 text-center"
-                )
-    running_query = None
+        kind = ui.input("Kind", value="*:*:*:*").classes("w-96")
+        search_field = (
+            ui.input("Query", on_change=search)
+            .props('autofocus outlined rounded item-aligned input-class="ml-3"')
+            .classes("w-96 self-center mt-24 transition-all")
+        )
+        results = ui.column().classes("w-full")
 
 
 @diag_cli.command(rich_help_panel="CImpl Diagnostic Commands", hidden=True)
@@ -197,7 +311,9 @@ def webui():
     console.print("Starting CIButler WebUI...")
     ui.separator()
     ui.link("OSDU Actions", osdu_page_layout)
+    ui.link("Cluster", cluster_page)
     app.on_startup(lambda: console.print("CIButler WebUI ready to go on ", app.urls))
+    app.on_shutdown(webservice.close)
     ui.run(
         host="127.0.0.1",
         port=native.find_open_port(),
@@ -0,0 +1,80 @@
+import os
+import threading
+import typer
+from typer.main import get_command
+import cibutler.agent as agent
+import cibutler.cik8s as cik8s
+import cibutler.entry as entry
+
+app = typer.Typer()
+
+
+@app.command()
+def status(threshold: int = 1):
+    print(f"base url {os.environ.get('BASE_URL')}")
+    raise typer.Exit(threshold)
+
+
+@app.command()
+def info():
+    print(f"context {cik8s.kube_context()}")
+
+
+@app.command()
+def install():
+    print("installing")
+
+
+def test_agent_command():
+    assert entry.agent_command(["status", "--threshold", "3"])
+    assert entry.agent_command(["diag", "ready", "-n", "osdu"])
+    assert not entry.agent_command(["diag", "ingress"])
+    assert not entry.agent_command(["status", "--help"])
+    assert not entry.agent_command(["install"])
+    assert not entry.agent_command([])
+
+
+def test_request_round_trip(tmp_path, monkeypatch):
+    path = str(tmp_path / "agent.sock")
+    monkeypatch.setattr(agent, "ENV_FILE", str(tmp_path / "missing.env"))
+    server = agent.AgentServer(path, get_command(app))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setenv("BASE_URL", "http://osdu.example")
+        reply = entry.request(["status", "--threshold", "3"], path=path)
+        assert reply["exit_code"] == 3
+        assert reply["stdout"] == "base url http://osdu.example\n"
+        # The agent's own environment is left as it was
+        monkeypatch.delenv("BASE_URL")
+        reply = entry.request(["status", "--threshold", "0"], path=path)
+        assert reply == {"exit_code": 0, "stdout": "base url None\n", "stderr": ""}
+        # Only read-only commands are run
+        reply = entry.request(["install"], path=path)
+        assert reply["exit_code"] == 2
+        assert reply["stdout"] == ""
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def kubeconfig(path, context):
+    path.write_text(
+        f"""apiVersion: v1
+kind: Config
+clusters: [{{name: {context}, cluster: {{server: "https://{context}"}}}}]
+users: [{{name: {context}, user: {{}}}}]
+contexts: [{{name: {context}, context: {{cluster: {context}, user: {context}}}}}]
+current-context: {context}
+"""
+    )
+    return str(path)
+
+
+def test_run_command_uses_client_kubeconfig(tmp_path, monkeypatch):
+    monkeypatch.setattr(agent, "ENV_FILE", str(tmp_path / "missing.env"))
+    own = kubeconfig(tmp_path / "own", "agent-cluster")
+    monkeypatch.setattr(agent.kube_config, "KUBE_CONFIG_DEFAULT_LOCATION", own)
+    client = kubeconfig(tmp_path / "client", "client-cluster")
+    reply = agent.run_command(get_command(app), ["info"], env={"KUBECONFIG": client})
+    assert reply["stdout"] == "context client-cluster\n"
+    assert agent.kube_config.KUBE_CONFIG_DEFAULT_LOCATION == own
@@ -0,0 +1,57 @@
+import time
+import typer
+import pytest
+from typer.main import get_command
+import cibutler.batch as batch
+from cibutler.common import console
+
+app = typer.Typer()
+
+
+@app.command()
+def echo(text: str, delay: float = 0):
+    time.sleep(delay)
+    console.print(f"echo {text}")
+
+
+@app.command()
+def fail(code: int = 3):
+    raise typer.Exit(code)
+
+
+def test_parse():
+    text = """
+# set up
+cibutler echo 'one two'
+echo three  # inline comment
+wait
+wait
+echo four
+"""
+    assert batch.parse(text) == [
+        [(3, ["echo", "one two"]), (4, ["echo", "three"])],
+        [(7, ["echo", "four"])],
+    ]
+    with pytest.raises(batch.BatchError):
+        batch.parse("batch other.txt")
+    with pytest.raises(batch.BatchError):
+        batch.parse("echo 'unclosed")
+
+
+def test_run_batch_stops_after_failure(capsys):
+    groups = batch.parse("echo one\nfail\necho two\nwait\necho three\n")
+    results = batch.run_batch(get_command(app), groups)
+    assert {n: r[1] for n, r in results.items()} == {1: 0, 2: 3, 3: None, 5: None}
+    assert "echo two" not in capsys.readouterr().out
+
+
+def test_run_batch_parallel(capsys):
+    groups = batch.parse(
+        "echo slow --delay 0.3\necho fast\nfail --code 2\nwait\necho last\n"
+    )
+    results = batch.run_batch(get_command(app), groups, jobs=3, keep_going=True)
+    assert {n: r[1] for n, r in results.items()} == {1: 0, 2: 0, 3: 2, 5: 0}
+    out = capsys.readouterr().out
+    # Each line's output follows its own header, the slow line finishes last
+    assert "--- line 2: echo fast\necho fast\n" in out
+    assert out.index("echo fast") < out.index("echo slow") < out.index("echo last")
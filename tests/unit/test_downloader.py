@@ -0,0 +1,101 @@
+import hashlib
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cibutler.downloader as downloader
+
+BODY = bytes(range(256)) * 512
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves BODY with Range support; /nolength streams without Content-Length,
+    /ignorerange advertises ranges but answers GET with the whole body
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_body(head=True)
+
+    def do_GET(self):
+        self.send_body()
+
+    def send_body(self, head=False):
+        body = BODY
+        status = 200
+        header = self.headers.get("Range")
+        if header and self.path not in ("/nolength", "/ignorerange"):
+            start, _, end = header.removeprefix("bytes=").partition("-")
+            if int(start) >= len(BODY):
+                self.send_response(416)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            end = int(end) if end else len(BODY) - 1
+            body = BODY[int(start) : end + 1]
+            status = 206
+        self.send_response(status)
+        if self.path == "/nolength":
+            self.send_header("Connection", "close")
+        else:
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_resume_partial(server, tmp_path):
+    (tmp_path / "file.bin.part").write_bytes(BODY[:1000])
+    paths = downloader.download([f"{server}/file.bin"], str(tmp_path))
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+    assert paths == [str(tmp_path / "file.bin")]
+    assert not (tmp_path / "file.bin.part").exists()
+
+
+def test_resume_stale_partial(server, tmp_path):
+    # Longer than the file, the server answers 416
+    (tmp_path / "file.bin.part").write_bytes(BODY + b"stale")
+    downloader.download([f"{server}/file.bin"], str(tmp_path))
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+def test_segmented_failure_removes_part(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_THRESHOLD", 1024)
+    with pytest.raises(downloader.DownloadError, match="expected 206"):
+        downloader.download([f"{server}/ignorerange"], str(tmp_path), segments=3)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_segmented(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(downloader, "SEGMENT_THRESHOLD", 1024)
+    downloader.download([f"{server}/file.bin"], str(tmp_path), segments=3)
+    assert (tmp_path / "file.bin").read_bytes() == BODY
+
+
+def test_no_content_length(server, tmp_path):
+    downloader.download([f"{server}/nolength"], str(tmp_path))
+    assert (tmp_path / "nolength").read_bytes() == BODY
+
+
+def test_checksum(server, tmp_path):
+    url = f"{server}/file.bin"
+    downloader.download(
+        [url], str(tmp_path), checksums={url: hashlib.sha256(BODY).hexdigest()}
+    )
+    other = tmp_path / "other"
+    other.mkdir()
+    with pytest.raises(downloader.DownloadError, match="checksum mismatch"):
+        downloader.download([url], str(other), checksums={url: "0" * 64})
+    assert list(other.iterdir()) == []
@@ -0,0 +1,120 @@
+import cibutler.elastic as elastic
+
+
+class FakeElastic:
+    """Two indices before the load, a third created during it"""
+
+    def __init__(self, namespace="default"):
+        self.requests = []
+        self.indexed = 100
+        self.indices = {
+            "osdu-a": {"index.refresh_interval": "5s", "index.number_of_replicas": "0"},
+            "osdu-b": {"index.number_of_replicas": "0"},
+        }
+
+    def request(self, method, path, body=None):
+        self.requests.append((method, path, body))
+        return {}
+
+    def index_total(self):
+        return self.indexed
+
+    def index_settings(self):
+        return {index: dict(settings) for index, settings in self.indices.items()}
+
+
+def test_bulk_load_mode_restores_settings(monkeypatch, tmp_path):
+    fake = FakeElastic()
+    monkeypatch.setattr(elastic, "BULK_STATE_FILE", str(tmp_path / "bulk.json"))
+    monkeypatch.setattr(elastic, "DRAIN_QUIET", 0)
+    monkeypatch.setattr(elastic, "Elastic", lambda namespace: fake)
+    monkeypatch.setattr(elastic.cik8s, "get_deployment_status", lambda *args: None)
+    monkeypatch.setattr(elastic.cik8s, "scale_workload", lambda *args: None)
+
+    with elastic.BulkLoadMode():
+        assert ("PUT", "/_all/_settings", elastic.BULK_SETTINGS) in fake.requests
+        fake.indices["osdu-c"] = {"index.refresh_interval": "-1"}
+        assert elastic.read_bulk_state()["settings"] == FakeElastic().indices
+        fake.indexed = 400
+
+    puts = {
+        path: body
+        for method, path, body in fake.requests
+        if method == "PUT" and path.endswith("/_settings") and path != "/_all/_settings"
+    }
+    assert puts["/osdu-a/_settings"] == {
+        "index.refresh_interval": "5s",
+        "index.number_of_replicas": "0",
+    }
+    # Indices without an original refresh_interval go back to the default
+    assert puts["/osdu-b,osdu-c/_settings"] == {
+        "index.refresh_interval": None,
+        "index.number_of_replicas": "0",
+    }
+    assert ("DELETE", f"/_template/{elastic.BULK_TEMPLATE}", None) in fake.requests
+    assert fake.requests[-1][:2] == ("POST", "/_refresh")
+    assert elastic.read_bulk_state() is None
+
+
+def test_bulk_load_mode_waits_for_indexer(monkeypatch, tmp_path):
+    fake = FakeElastic()
+    monkeypatch.setattr(elastic, "BULK_STATE_FILE", str(tmp_path / "bulk.json"))
+    events = []
+    monkeypatch.setattr(elastic, "Elastic", lambda namespace: fake)
+    monkeypatch.setattr(
+        elastic.cik8s, "get_deployment_status", lambda *args: {"replicas": 1}
+    )
+    monkeypatch.setattr(
+        elastic.cik8s, "scale_workload", lambda *args: events.append(("scale", args[2]))
+    )
+    now = [0.0]
+    monkeypatch.setattr(elastic.time, "time", lambda: now[0])
+
+    def sleep(seconds):
+        now[0] += seconds
+        # The indexer keeps indexing for the first 20 seconds
+        if now[0] <= 20:
+            fake.indexed += 10
+        events.append(("indexed", fake.indexed))
+
+    monkeypatch.setattr(elastic.time, "sleep", sleep)
+
+    with elastic.BulkLoadMode() as bulk_mode:
+        fake.indexed = 400
+        assert bulk_mode.indexed() == 300
+
+    # Scaled up on entry, back only after the indexing stopped
+    assert events[0] == ("scale", 2)
+    assert events[-1] == ("scale", 1)
+    assert events[-2] == ("indexed", 440)
+    assert now[0] >= 20 + elastic.DRAIN_QUIET
+
+
+def test_bulk_load_reset_after_interrupted_load(monkeypatch, tmp_path):
+    fake = FakeElastic()
+    scaled = []
+    monkeypatch.setattr(elastic, "BULK_STATE_FILE", str(tmp_path / "bulk.json"))
+    monkeypatch.setattr(elastic, "Elastic", lambda namespace: fake)
+    monkeypatch.setattr(
+        elastic.cik8s, "get_deployment_status", lambda *args: {"replicas": 1}
+    )
+    monkeypatch.setattr(
+        elastic.cik8s, "scale_workload", lambda *args: scaled.append(args[2])
+    )
+    fake.indices["osdu-a"]["index.number_of_replicas"] = "1"
+    bulk_mode = elastic.BulkLoadMode().__enter__()
+    # Interrupted, __exit__ never ran
+    fake.indices = {index: dict(elastic.BULK_SETTINGS) for index in fake.indices}
+    fake.requests.clear()
+
+    elastic.bulk_load_reset(namespace="default", indexer_replicas=1)
+
+    puts = {
+        path: body
+        for method, path, body in fake.requests
+        if method == "PUT" and path.endswith("/_settings")
+    }
+    assert puts["/osdu-a/_settings"]["index.number_of_replicas"] == "1"
+    assert puts["/osdu-a/_settings"]["index.refresh_interval"] == "5s"
+    assert scaled == [2, bulk_mode.original_indexer]
+    assert elastic.read_bulk_state() is None
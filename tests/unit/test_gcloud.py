@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import stat
+import pytest
+from typer.testing import CliRunner
+from cibutler.main import cli
+import cibutler.cloud as cloud
+
+runner = CliRunner()
+
+# Stands in for gcloud: instance operations return RUNNING operations,
+# operations list reports them DONE on the second poll, every call is logged.
+FAKE_GCLOUD = """#!{python}
+import json, os, sys
+
+args = sys.argv[1:]
+state = os.environ["FAKE_GCLOUD_STATE"]
+with open(state + ".log", "a") as log:
+    log.write(json.dumps(args) + "\\n")
+
+def operation(name, status, error=None):
+    op = {{
+        "name": "op-" + name,
+        "status": status,
+        "targetLink": "https://compute/projects/p/zones/z/instances/" + name,
+    }}
+    if error:
+        op["error"] = {{"errors": [{{"message": error}}]}}
+    return op
+
+if args[:2] == ["compute", "instances"] and args[2] == "list":
+    names = os.environ.get("FAKE_GCLOUD_INSTANCES", "").split(",")
+    print(json.dumps([{{"name": name}} for name in names if name]))
+elif args[:2] == ["compute", "instances"]:
+    names = [arg for arg in args[3:] if not arg.startswith("--")]
+    with open(state, "w") as f:
+        json.dump(names, f)
+    print(json.dumps([operation(name, "RUNNING") for name in names]))
+elif args[:2] == ["compute", "operations"]:
+    polls = state + ".polls"
+    count = int(open(polls).read()) if os.path.exists(polls) else 0
+    open(polls, "w").write(str(count + 1))
+    names = json.load(open(state))
+    status = "DONE" if count else "RUNNING"
+    fail = os.environ.get("FAKE_GCLOUD_FAIL")
+    print(json.dumps([
+        operation(name, status, "quota exceeded" if name == fail else None)
+        for name in names
+    ]))
+else:
+    sys.exit(1)
+"""
+
+
+@pytest.fixture
+def fake_gcloud(tmp_path, monkeypatch):
+    script = tmp_path / "gcloud"
+    script.write_text(FAKE_GCLOUD.format(python=sys.executable))
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_GCLOUD_STATE", str(tmp_path / "state"))
+    monkeypatch.setattr(cloud.time, "sleep", lambda seconds: None)
+
+    def calls():
+        with open(tmp_path / "state.log") as log:
+            return [json.loads(line) for line in log]
+
+    return calls
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="fake gcloud is a script")
+def test_batch_create_count(fake_gcloud):
+    result = runner.invoke(
+        cli,
+        ["diag", "gcloud-batch-create", "proj", "sa@proj", "--count", "3"],
+    )
+    assert result.exit_code == 0, result.stdout
+    calls = fake_gcloud()
+    create = calls[0]
+    assert create[:6] == ["compute", "instances", "create", "lab-1", "lab-2", "lab-3"]
+    assert "--async" in create
+    # one create call, then operations polled together until done
+    assert [call[1] for call in calls[1:]] == ["operations", "operations"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="fake gcloud is a script")
+def test_batch_stop_pattern(fake_gcloud, monkeypatch):
+    monkeypatch.setenv("FAKE_GCLOUD_INSTANCES", "lab-1,lab-2")
+    result = runner.invoke(cli, ["diag", "gcloud-batch-stop", "--pattern", "^lab-"])
+    assert result.exit_code == 0, result.stdout
+    calls = fake_gcloud()
+    assert "--filter=name~^lab-" in calls[0]
+    assert calls[1][:5] == ["compute", "instances", "stop", "lab-1", "lab-2"]
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="fake gcloud is a script")
+def test_batch_reports_failed_operation(fake_gcloud, monkeypatch):
+    monkeypatch.setenv("FAKE_GCLOUD_FAIL", "lab-2")
+    results = cloud.gcloud_batch("start", ["lab-1", "lab-2"], "us-central1-b")
+    assert [r["ok"] for r in results] == [True, False]
+    assert results[1]["error"] == "quota exceeded"
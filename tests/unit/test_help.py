@@ -42,6 +42,14 @@ def test_utility_commands_help(test_input):
         ("docker-info"),
         ("upload-data"),
         ("cpu"),
+        ("triage"),
+        ("sizing"),
+        ("profiles"),
+        ("tail"),
+        ("snapshots"),
+        ("bulk-load-reset"),
+        ("low-memory-overlay"),
+        ("mirror-stats"),
     ],
 )
 def test_diag_commands_help(test_input):
@@ -49,10 +57,33 @@ def test_diag_commands_help(test_input):
     assert result.exit_code == 0, f"exit status, stdout: {result.stdout}"
 
 
+@pytest.mark.parametrize(
+    "test_input",
+    [
+        ("snapshot"),
+        ("restore"),
+        ("hibernate"),
+        ("resume"),
+        ("mirror"),
+        ("mirror-stop"),
+        ("tunnel-status"),
+        ("tunnel-stop"),
+        ("port-forward"),
+        ("port-forward-stop"),
+        ("agent"),
+        ("agent-stop"),
+        ("batch"),
+    ],
+)
+def test_ci_commands_help(test_input):
+    result = runner.invoke(cli, [test_input, "--help"])
+    assert result.exit_code == 0, f"exit status, stdout: {result.stdout}"
+
+
 # Help for Policy Developer Utils/Commands
 @pytest.mark.parametrize(
     "test_input",
-    [("use-context"), ("current-context")],
+    [("use-context"), ("current-context"), ("start-clusters")],
 )
 def test_k8s_help(test_input):
     result = runner.invoke(cli, [test_input, "--help"])
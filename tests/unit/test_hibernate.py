@@ -0,0 +1,22 @@
+import cibutler.hibernate as hibernate
+
+
+def test_workload_tiers():
+    workloads = [
+        ("Deployment", "search", 1),
+        ("StatefulSet", "postgresql", 1),
+        ("Deployment", "entitlements-bootstrap", 1),
+        ("Deployment", "wellbore-worker", 1),
+        ("StatefulSet", "elasticsearch", 1),
+        ("Deployment", "partition", 1),
+        ("Deployment", "keycloak", 1),
+        ("Deployment", "cimpl-notebook", 1),
+    ]
+    names = [[name for _, name, _ in tier] for tier in hibernate.tiers(workloads)]
+    assert names == [
+        ["postgresql", "elasticsearch"],
+        ["keycloak"],
+        ["partition"],
+        ["entitlements-bootstrap"],
+        ["search", "wellbore-worker", "cimpl-notebook"],
+    ]
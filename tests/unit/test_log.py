@@ -0,0 +1,57 @@
+import queue
+import logging
+import logging.handlers
+import cibutler.log as log
+
+
+def test_use_logfile(tmp_path, monkeypatch):
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, log.file_handler(str(tmp_path / "cibutler.log"))
+    )
+    monkeypatch.setattr(log, "_listener", listener)
+    test_logger = logging.getLogger("test_use_logfile")
+    test_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    test_logger.setLevel(logging.INFO)
+    listener.start()
+    try:
+        test_logger.info("before")
+        log.use_logfile(str(tmp_path / "cibutler-agent.log"))
+        test_logger.info("after")
+    finally:
+        listener.stop()
+        test_logger.handlers.clear()
+    assert "before" in (tmp_path / "cibutler.log").read_text()
+    daemon_log = (tmp_path / "cibutler-agent.log").read_text()
+    assert "after" in daemon_log and "before" not in daemon_log
+
+
+class Flag:
+    def __init__(self, cycles):
+        self.cycles = cycles
+
+    def exit(self):
+        self.cycles -= 1
+        return self.cycles < 0
+
+
+def test_follow_drains_rotated_file(tmp_path, monkeypatch):
+    path = tmp_path / "cibutler.log"
+    path.write_bytes(b"first\n")
+    real_stat = log.os.stat
+    rotated = []
+
+    def stat(name, *args, **kwargs):
+        # Written after follow's empty read, just before the rotation
+        if not rotated:
+            rotated.append(True)
+            with open(path, "ab") as f:
+                f.write(b"late\npart")
+            path.rename(tmp_path / "cibutler.log.1")
+            path.write_bytes(b"new\n")
+        return real_stat(name, *args, **kwargs)
+
+    monkeypatch.setattr(log.os, "stat", stat)
+    watcher = type("Watcher", (), {"wait": lambda self, seconds: None})()
+    lines = list(log.follow(str(path), Flag(4), watcher, lines=1))
+    assert lines == ["first", "late", "part", "new"]
@@ -0,0 +1,33 @@
+import time
+import ruamel.yaml
+import cibutler.lowmem as lowmem
+from cibutler.config import profile_services
+
+
+def test_low_memory_values_only_selected_services():
+    values = lowmem.low_memory_values(profile_services("dev-core"))
+    assert values["global"]["limitsEnabled"] is True
+    assert values["keycloak"]["resourcesPreset"] == "small"
+    assert "elasticsearch" not in values
+    assert values["core-plus-storage-deploy"]["data"]["limitsMemory"] == "1Gi"
+    assert values["core-plus-legal-deploy"]["data"]["requestsMemory"] == "256Mi"
+    assert "core-plus-search-deploy" not in values
+    assert "common-infra-bootstrap" not in values
+
+
+def test_write_overlay(tmp_path):
+    path = lowmem.write_overlay(["Elastic", "Search"], str(tmp_path / "values.yaml"))
+    with open(path) as f:
+        values = ruamel.yaml.YAML(typ="safe", pure=True).load(f)
+    assert values["elasticsearch"]["data"]["heapSize"] == "512m"
+    assert values["core-plus-search-deploy"]["data"]["limitsCpu"] == "1"
+
+
+def test_peak_memory():
+    samples = iter([2.0, None, 5.5, 3.0])
+    peak = lowmem.PeakMemory(lambda: next(samples, None), interval=0.01)
+    with peak:
+        deadline = time.time() + 5
+        while peak.peak_gb != 5.5 and time.time() < deadline:
+            time.sleep(0.01)
+    assert peak.peak_gb == 5.5
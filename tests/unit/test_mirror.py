@@ -0,0 +1,93 @@
+import json
+import cibutler.mirror as mirror
+import cibutler.ciminikube as ciminikube
+from cibutler.ciminikube import minikube_start_command
+from cibutler.shell import CommandResult
+
+METRICS = """# HELP registry_proxy_hits_total The number of total proxy request hits
+# TYPE registry_proxy_hits_total counter
+registry_proxy_hits_total{type="blob"} 40
+registry_proxy_hits_total{type="manifest"} 2
+registry_proxy_misses_total{type="blob"} 10
+registry_proxy_misses_total{type="manifest"} 3
+registry_proxy_pulled_bytes_total{type="blob"} 1.073741824e+09
+registry_proxy_pushed_bytes_total{type="blob"} 3.221225472e+09
+registry_storage_action_seconds_count{action="GetContent"} 7
+"""
+
+
+def test_parse_metrics():
+    metrics = mirror.parse_metrics(METRICS)
+    assert metrics["registry_proxy_hits_total"] == 42
+    assert metrics["registry_proxy_misses_total"] == 13
+    assert "registry_storage_action_seconds_count" not in metrics
+
+
+def test_stats_message():
+    message = mirror.stats_message(
+        {
+            "hits": 42,
+            "misses": 14,
+            "pulled_bytes": 1024**3,
+            "served_bytes": 3 * 1024**3,
+        }
+    )
+    assert message == "42 hits / 14 misses (75%), 2.00 GiB served from cache"
+
+
+def test_k3d_registries():
+    text = mirror.k3d_registries(registries=["community.opengroup.org:5555"])
+    assert text == (
+        "mirrors:\n"
+        '  "community.opengroup.org:5555":\n'
+        "    endpoint:\n"
+        "      - http://host.k3d.internal:5101\n"
+    )
+
+
+def test_minikube_start_command_mirror_flags():
+    cmd = minikube_start_command(
+        container_runtime="containerd",
+        registry_mirror="http://host.minikube.internal:5100",
+        insecure_registries=["host.minikube.internal:5100"],
+    )
+    assert "--container-runtime=containerd" in cmd
+    assert "--registry-mirror=http://host.minikube.internal:5100" in cmd
+    assert "--insecure-registry=host.minikube.internal:5100" in cmd
+
+
+def test_stats_since():
+    before = {"hits": 40, "misses": 10, "pulled_bytes": 100, "served_bytes": 300}
+    after = {"hits": 45, "misses": 12, "pulled_bytes": 150, "served_bytes": 400}
+    assert mirror.stats_since(before, after) == {
+        "hits": 5,
+        "misses": 2,
+        "pulled_bytes": 50,
+        "served_bytes": 100,
+    }
+    # Started during the install
+    assert mirror.stats_since(None, after) == after
+    assert mirror.stats_since(before, None) is None
+
+
+def test_profile_runtime(monkeypatch):
+    profiles = {
+        "valid": [
+            {
+                "Name": "minikube",
+                "Config": {"KubernetesConfig": {"ContainerRuntime": "docker"}},
+            },
+            {
+                "Name": "osdu",
+                "Config": {"KubernetesConfig": {"ContainerRuntime": "containerd"}},
+            },
+        ]
+    }
+    monkeypatch.setattr(
+        ciminikube.shell,
+        "run",
+        lambda *args, **kwargs: CommandResult(args[0], 0, json.dumps(profiles)),
+    )
+    assert ciminikube.profile_runtime() == "docker"
+    assert ciminikube.profile_runtime(profile="osdu") == "containerd"
+    assert ciminikube.profile_runtime(profile="new") is None
@@ -0,0 +1,72 @@
+import pytest
+import tenacity
+import cibutler.osdu as osdu
+
+
+class FakeCredentials:
+    """Keycloak accepts only the current secret"""
+
+    def __init__(self, keycloak):
+        self.keycloak = keycloak
+        self.secret = osdu.os.environ["KEYCLOAK_CLIENT_SECRET"]
+        self.access_token = None
+
+    def refresh_token(self):
+        if self.secret != self.keycloak["secret"]:
+            raise KeyError("id_token")
+        self.access_token = f"token-{self.secret}"
+        return self.access_token
+
+
+@pytest.fixture
+def keycloak(monkeypatch):
+    keycloak = {"secret": "one", "context": "minikube", "reads": 0}
+
+    def get_secret():
+        keycloak["reads"] += 1
+        return keycloak["secret"]
+
+    monkeypatch.setattr(osdu, "_refreshers", {})
+    monkeypatch.setattr(osdu.tunnel, "tunnel_up", lambda url: True)
+    monkeypatch.setattr(osdu.cimpl, "get_keycloak_client_secret", get_secret)
+    monkeypatch.setattr(osdu.cik8s, "kube_context", lambda: keycloak["context"])
+    monkeypatch.setattr(
+        osdu.credentials, "get_credentials", lambda: FakeCredentials(keycloak)
+    )
+    # No waits between the refresher's own retries
+    monkeypatch.setattr(
+        osdu.BaseTokenRefresher.refresh_token.retry, "sleep", lambda seconds: None
+    )
+    # setup sets these, restored after the test
+    for name in (
+        "KEYCLOAK_AUTH_URL",
+        "KEYCLOAK_CLIENT_ID",
+        "KEYCLOAK_CLIENT_SECRET",
+        "CLOUD_PROVIDER",
+        "BASE_URL",
+    ):
+        monkeypatch.delenv(name, raising=False)
+    return keycloak
+
+
+def test_setup_caches_per_context(keycloak):
+    first = osdu.setup(osdu.BASE_URL)
+    assert osdu.setup(osdu.BASE_URL) is first
+    keycloak["context"] = "other"
+    assert osdu.setup(osdu.BASE_URL) is not first
+    assert keycloak["reads"] == 2
+
+
+def test_setup_retries_rotated_secret(keycloak):
+    assert osdu.setup(osdu.BASE_URL).refresh_token() == "token-one"
+    keycloak["secret"] = "two"
+    refresher = osdu.setup(osdu.BASE_URL)
+    assert refresher.refresh_token() == "token-two"
+    assert osdu.setup(osdu.BASE_URL) is refresher
+    # A secret read just now is not retried
+    keycloak["secret"] = "three"
+    osdu._refreshers.clear()
+    refresher = osdu.setup(osdu.BASE_URL)
+    keycloak["secret"] = "four"
+    with pytest.raises(tenacity.RetryError):
+        refresher.refresh_token()
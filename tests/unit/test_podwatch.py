@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+import pytest
+import cibutler.podwatch as podwatch
+
+
+def helm_secret(name, revision, status):
+    return SimpleNamespace(
+        metadata=SimpleNamespace(
+            name=f"sh.helm.release.v1.{name}.v{revision}",
+            labels={"name": name, "version": str(revision), "status": status},
+            creation_timestamp=None,
+        )
+    )
+
+
+def test_helm_releases_latest_revision():
+    changes = []
+    watcher = podwatch.HelmReleaseWatcher(on_change=changes.append)
+    watcher.update("ADDED", helm_secret("cimpl", 1, "superseded"))
+    watcher.update("ADDED", helm_secret("cimpl", 2, "deployed"))
+    watcher.update("ADDED", helm_secret("notebook", 1, "pending-install"))
+    assert [(r["name"], r["revision"], r["status"]) for r in watcher.releases()] == [
+        ("cimpl", 2, "deployed"),
+        ("notebook", 1, "pending-install"),
+    ]
+    watcher.update("DELETED", helm_secret("notebook", 1, "pending-install"))
+    assert [r["name"] for r in watcher.releases()] == ["cimpl"]
+    assert len(changes) == 4
+
+
+def test_resource_watcher_is_abstract():
+    with pytest.raises(TypeError):
+        podwatch.ResourceWatcher()
+
+
+def test_pod_state_workload():
+    pod = SimpleNamespace(
+        metadata=SimpleNamespace(
+            name="entitlements-7c4b-x2",
+            labels={"pod-template-hash": "7c4b"},
+            owner_references=[
+                SimpleNamespace(
+                    kind="ReplicaSet", name="entitlements-7c4b", controller=True
+                )
+            ],
+            creation_timestamp=None,
+        ),
+        status=SimpleNamespace(
+            container_statuses=None,
+            init_container_statuses=None,
+            conditions=None,
+            phase="Pending",
+        ),
+    )
+    state = podwatch.pod_state(pod)
+    assert state["owner"] == "ReplicaSet/entitlements-7c4b"
+    assert state["workload"] == "Deployment/entitlements"
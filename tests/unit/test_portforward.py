@@ -0,0 +1,63 @@
+import os
+import json
+from types import SimpleNamespace as NS
+import cibutler.portforward as portforward
+
+
+def test_url_defaults(tmp_path, monkeypatch):
+    monkeypatch.setattr(portforward, "STATE_FILE", str(tmp_path / "port-forward.json"))
+    assert portforward.url_defaults() == {}
+    with open(portforward.STATE_FILE, "w") as f:
+        json.dump({"pid": os.getpid(), "ports": {"ingress": 8080, "minio": 9000}}, f)
+    # The host names were not found to resolve to loopback
+    assert portforward.url_defaults() == {}
+    state = {
+        "pid": os.getpid(),
+        "ports": {"ingress": 8080, "minio": 9000},
+        "hosts_resolve": True,
+    }
+    assert portforward.url_defaults(state) == {
+        "BASE_URL": "http://osdu.localhost:8080",
+        "KEYCLOAK_URL": "http://keycloak.localhost:8080",
+    }
+
+
+def test_resolves_to_loopback():
+    assert portforward.resolves_to_loopback("localhost")
+    assert not portforward.resolves_to_loopback("name.invalid")
+
+
+class FakeCoreV1Api:
+    def read_namespaced_service(self, name, namespace):
+        return NS(
+            spec=NS(
+                ports=[NS(port=80, target_port="http")],
+                selector={"app.kubernetes.io/name": "keycloak"},
+            )
+        )
+
+    def list_namespaced_pod(self, namespace, label_selector):
+        assert label_selector == "app.kubernetes.io/name=keycloak"
+        container = NS(ports=[NS(name="http", container_port=8080)])
+        return NS(
+            items=[
+                NS(
+                    metadata=NS(name="keycloak-0"),
+                    status=NS(phase="Pending", conditions=[]),
+                    spec=NS(containers=[container]),
+                ),
+                NS(
+                    metadata=NS(name="keycloak-1"),
+                    status=NS(
+                        phase="Running", conditions=[NS(type="Ready", status="True")]
+                    ),
+                    spec=NS(containers=[container]),
+                ),
+            ]
+        )
+
+
+def test_resolve_named_port(monkeypatch):
+    monkeypatch.setattr(portforward.client, "CoreV1Api", FakeCoreV1Api)
+    forward = portforward.Forward("keycloak", *portforward.FORWARDS["keycloak"])
+    assert forward.resolve() == ("keycloak-1", 8080)
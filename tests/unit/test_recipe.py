@@ -0,0 +1,25 @@
+import cibutler.cloud as cloud
+
+
+class FakeConnection:
+    def __init__(self, name):
+        self.name = name
+        self.scripts = []
+
+    def run(self, script, **options):
+        self.scripts.append(script)
+
+
+def test_apply_recipe_reconnects_for_new_session():
+    first, second = FakeConnection("first"), FakeConnection("second")
+    steps = [
+        cloud.Step("group", "sudo usermod -a -G microk8s {user}"),
+        cloud.Step("kube config", "microk8s config > config", new_session=True),
+    ]
+    ran = cloud.apply_recipe(
+        first, steps, {"user": "osdu"}, force=True, reconnect=lambda: second
+    )
+    assert ran == ["group", "kube config"]
+    assert len(first.scripts) == 1 and "usermod -a -G microk8s osdu" in first.scripts[0]
+    # The group only applies to a newly authenticated connection
+    assert len(second.scripts) == 1 and "microk8s config" in second.scripts[0]
@@ -0,0 +1,93 @@
+import sys
+import time
+import cibutler.shell as shell
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_run_captures_output():
+    result = shell.run(
+        python("import sys; print('out'); print('err', file=sys.stderr); sys.exit(3)")
+    )
+    assert result.returncode == 3
+    assert not result.ok
+    assert result.stdout == "out"
+    assert result.stderr == "err"
+    assert result.output == "out"
+
+
+def test_run_missing_command():
+    result = shell.run("cibutler-no-such-command --version")
+    assert result.returncode == 127
+    assert result.output
+
+
+def test_run_timeout():
+    start = time.time()
+    result = shell.run(python("import time; time.sleep(10)"), timeout=0.5)
+    assert result.timed_out
+    assert result.returncode is None
+    assert time.time() - start < 5
+
+
+def test_run_shell_command_exit_code():
+    assert shell.run_shell_command(f"{sys.executable} -c 'pass'")
+    assert not shell.run_shell_command(f"{sys.executable} -c 'import sys; sys.exit(1)'")
+
+
+def test_run_many_concurrent_and_ordered(monkeypatch):
+    timed = []
+    monkeypatch.setattr(shell, "timing_hooks", [timed.append])
+    start = time.time()
+    results = shell.run_many(
+        [python(f"import time; time.sleep(0.5); print({n})") for n in range(4)]
+    )
+    assert time.time() - start < 1.8
+    assert [result.stdout for result in results] == ["0", "1", "2", "3"]
+    assert len(timed) == 4
+
+
+def test_run_many_fail_fast():
+    start = time.time()
+    results = shell.run_many(
+        [python("import time; time.sleep(10)"), python("import sys; sys.exit(2)")],
+        fail_fast=True,
+    )
+    assert time.time() - start < 5
+    assert results[0].cancelled
+    assert results[1].returncode == 2
+
+
+def test_run_line_over_limit(monkeypatch):
+    monkeypatch.setattr(shell, "READ_LIMIT", 1024)
+    start = time.time()
+    result = shell.run(
+        python("import time; print('x' * 5000, flush=True); time.sleep(10)")
+    )
+    assert result.unreadable
+    assert not result.ok
+    assert "Unable to read output" in result.stderr
+    assert time.time() - start < 5
+
+
+def test_run_without_capture(capfd):
+    result = shell.run(python("print('shown')"), capture=False)
+    assert result.ok
+    assert result.stdout == ""
+    assert capfd.readouterr().out == "shown\n"
+
+
+def test_run_input_and_stdout_file(tmp_path):
+    result = shell.run(
+        python("import sys; print(sys.stdin.read().upper())"), input="data"
+    )
+    assert result.stdout == "DATA"
+    with open(tmp_path / "out.bin", "wb") as f:
+        result = shell.run(
+            python("import sys; sys.stdout.buffer.write(bytes(range(256)))"),
+            stdout_file=f,
+        )
+    assert result.ok and result.stdout == ""
+    assert (tmp_path / "out.bin").read_bytes() == bytes(range(256))
@@ -0,0 +1,96 @@
+import pytest
+import cibutler.podwatch as podwatch
+import cibutler.triage as triage
+
+
+def state(name, reason, restarts=0, owner="ReplicaSet/storage-5d9f"):
+    return {
+        "name": name,
+        "owner": owner,
+        "workload": "Deployment/" + owner.split("/")[1].rsplit("-", 1)[0],
+        "reason": reason,
+        "restarts": restarts,
+        "message": None,
+        "last_terminated": None,
+        "scheduling_message": None,
+    }
+
+
+def test_crash_loop_baseline_survives_reason_flips():
+    previous = podwatch.track_state(state("storage-1", "CrashLoopBackOff", 4))
+    # Each restart runs the container again, the reason clears and returns
+    for reason, restarts in [(None, 5), ("CrashLoopBackOff", 5), (None, 6)]:
+        previous = podwatch.track_state(state("storage-1", reason, restarts), previous)
+    current = podwatch.track_state(state("storage-1", "CrashLoopBackOff", 6), previous)
+    assert current["restarts_baseline"] == 4
+    assert [f["kind"] for f in triage.classify([current])] == ["crash-loop"]
+
+
+def test_image_pull_alternation_keeps_reason_since():
+    previous = podwatch.track_state(state("storage-1", "ErrImagePull"))
+    previous["reason_since"] -= 400
+    current = podwatch.track_state(state("storage-1", "ImagePullBackOff"), previous)
+    assert current["reason_since"] == previous["reason_since"]
+    assert [f["kind"] for f in triage.classify([current])] == ["image-pull"]
+
+
+def test_escalation_fixes_once_per_workload(monkeypatch):
+    fixed = []
+    monkeypatch.setattr(
+        triage, "apply_fix", lambda finding, namespace: fixed.append(finding["pod"])
+    )
+    escalation = triage.Escalation()
+    first = podwatch.track_state(state("storage-1", "ImagePullBackOff"))
+    first["reason_since"] -= 400
+    assert escalation.check([first]) == []
+    # delete-pod replaced the pod, same fault under a new name
+    second = podwatch.track_state(state("storage-2", "ImagePullBackOff"))
+    second["reason_since"] -= 400
+    fatal = escalation.check([second])
+    assert fixed == ["storage-1"]
+    assert [f["pod"] for f in fatal] == ["storage-2"]
+
+
+def crash_loop(name, owner):
+    previous = podwatch.track_state(state(name, "CrashLoopBackOff", 4, owner))
+    return podwatch.track_state(state(name, "CrashLoopBackOff", 6, owner), previous)
+
+
+def test_escalation_restarts_entitlements_once(monkeypatch):
+    fixed = []
+    monkeypatch.setattr(
+        triage, "apply_fix", lambda finding, namespace: fixed.append(finding["fix"])
+    )
+    escalation = triage.Escalation()
+    assert (
+        escalation.check([crash_loop("entitlements-1", "ReplicaSet/entitlements-5d9f")])
+        == []
+    )
+    # The rollout restart created a new ReplicaSet, the crash loop returns
+    fatal = escalation.check(
+        [crash_loop("entitlements-2", "ReplicaSet/entitlements-7c4b")]
+    )
+    assert fixed == ["restart-entitlements"]
+    assert [f["pod"] for f in fatal] == ["entitlements-2"]
+
+
+def test_entitlements_bootstrap_is_not_restarted():
+    findings = triage.classify(
+        [
+            crash_loop(
+                "entitlements-bootstrap-1", "ReplicaSet/entitlements-bootstrap-5d9f"
+            )
+        ]
+    )
+    assert [f["fix"] for f in findings] == [None]
+
+
+def test_escalation_without_fix_only_reports(monkeypatch):
+    monkeypatch.setattr(
+        triage, "apply_fix", lambda finding, namespace: pytest.fail("fixed")
+    )
+    escalation = triage.Escalation(fix=False)
+    fatal = escalation.check(
+        [crash_loop("entitlements-1", "ReplicaSet/entitlements-5d9f")]
+    )
+    assert [f["fix"] for f in fatal] == ["restart-entitlements"]
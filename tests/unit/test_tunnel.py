@@ -0,0 +1,36 @@
+import os
+import socket
+import time
+import cibutler.tunnel as tunnel
+
+
+def test_reachable():
+    with socket.socket() as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        port = server.getsockname()[1]
+        assert tunnel.reachable(f"http://127.0.0.1:{port}")
+    assert not tunnel.reachable(f"http://127.0.0.1:{port}", timeout=0.2)
+
+
+def test_tunnel_up_from_status(tmp_path, monkeypatch):
+    monkeypatch.setattr(tunnel, "PID_FILE", str(tmp_path / "tunnel.pid"))
+    monkeypatch.setattr(tunnel, "STATUS_FILE", str(tmp_path / "tunnel-status.json"))
+    monkeypatch.setattr(tunnel, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(tunnel, "reachable", lambda url: "fallback")
+    # No supervisor, so a quick connect decides
+    assert tunnel.tunnel_up() == "fallback"
+
+    with open(tunnel.PID_FILE, "w") as f:
+        f.write(str(os.getpid()))
+    tunnel.write_status(state="down", error="istio ingress has no external IP")
+    assert tunnel.tunnel_up() is False
+    tunnel.write_status(state="up", ingress_ip="127.0.0.1")
+    assert tunnel.tunnel_up() is True
+    # A stale status is not trusted
+    monkeypatch.setattr(time, "time", lambda: 10**12)
+    assert tunnel.tunnel_up() == "fallback"
+
+
+def test_backoff():
+    assert [tunnel.backoff(n) for n in [1, 2, 3, 10]] == [2, 4, 8, tunnel.MAX_BACKOFF]
@@ -0,0 +1,51 @@
+import time
+import cibutler.update as update
+
+
+def test_sort_versions():
+    versions = ["0.9.0", "0.10.0", "not-a-version", "0.10.0rc1", "0.2.1"]
+    assert update.sort_versions(versions) == ["0.2.1", "0.9.0", "0.10.0rc1", "0.10.0"]
+
+
+def test_update_message_uses_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(update, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(update, "VERSION_CACHE_FILE", str(tmp_path / "versions.json"))
+    monkeypatch.setattr(update, "__version__", "1.0.0")
+
+    def offline(*args):
+        raise AssertionError("fresh cache must not hit the network")
+
+    monkeypatch.setattr(update, "fetch_versions", offline)
+    update.write_cache_entry(
+        update.INDEX_URL,
+        "cibutler",
+        {"versions": ["1.0.0", "1.2.0"], "checked": time.time()},
+    )
+    assert update.update_message() is True
+    assert update.available_versions() == ["1.0.0", "1.2.0"]
+
+
+def test_stale_cache_refreshes_in_background(tmp_path, monkeypatch):
+    monkeypatch.setattr(update, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(update, "VERSION_CACHE_FILE", str(tmp_path / "versions.json"))
+    calls = []
+    monkeypatch.setattr(update, "fetch_versions", lambda *args: calls.append(args))
+    update.write_cache_entry(
+        update.INDEX_URL, "cibutler", {"versions": ["1.0.0"], "checked": 0}
+    )
+    assert update.cached_versions() == ["1.0.0"]
+    thread = update.refresh_in_background()
+    thread.join()
+    assert calls
+
+
+def test_exit_waits_for_refresh(tmp_path, monkeypatch):
+    monkeypatch.setattr(update, "VERSION_CACHE_FILE", str(tmp_path / "versions.json"))
+    monkeypatch.setattr(update, "_refresh_thread", None)
+    monkeypatch.setattr(update.atexit, "register", lambda func: None)
+    monkeypatch.setattr(update, "fetch_versions", lambda *args: time.sleep(0.2))
+    thread = update.refresh_in_background()
+    # Still running, a second stale check does not start another
+    assert update.refresh_in_background() is thread
+    update._join_refresh()
+    assert not thread.is_alive()
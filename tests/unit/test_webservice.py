@@ -0,0 +1,55 @@
+import asyncio
+import pytest
+import cibutler.webservice as webservice
+
+
+def test_ttl_cache_shares_calls():
+    calls = []
+
+    @webservice.ttl_cache(60)
+    async def double(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    async def main():
+        assert await asyncio.gather(double(1), double(1), double(2)) == [2, 2, 4]
+        assert await double(1) == 2
+
+    asyncio.run(main())
+    assert calls == [1, 2]
+
+
+def test_ttl_cache_does_not_cache_errors():
+    calls = []
+
+    @webservice.ttl_cache(60)
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise webservice.ServiceError("down")
+        return "up"
+
+    async def main():
+        with pytest.raises(webservice.ServiceError):
+            await flaky()
+        assert await flaky() == "up"
+
+    asyncio.run(main())
+
+
+def test_ttl_cache_evicts_oldest():
+    calls = []
+
+    @webservice.ttl_cache(60, maxsize=2)
+    async def double(x):
+        calls.append(x)
+        return x * 2
+
+    async def main():
+        for x in (1, 2, 3, 3, 1):
+            await double(x)
+
+    asyncio.run(main())
+    # 1 was evicted when 3 was cached
+    assert calls == [1, 2, 3, 1]